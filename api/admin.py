@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import IngredientProductMapping
 
 # Register your models here.
+
+@admin.register(IngredientProductMapping)
+class IngredientProductMappingAdmin(admin.ModelAdmin):
+    list_display = ('normalized_name', 'restrictions_key', 'product_name', 'updated_at')
+    list_filter = ('restrictions_key',)
+    search_fields = ('normalized_name', 'product_name')
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import CompressionDictionary, MealPlan
+from core.plan_compression import CODECS, CODEC_RAW, compress_plan, configured_codec, reset_dictionary_cache, train_dictionary
+
+
+class Command(BaseCommand):
+    help = (
+        "Trains a compression dictionary on recent meal plans and stores it. New plans are "
+        "compressed with it; --recompress rewrites the stored plans with it too."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=2000, help='Number of recent plans to train on')
+        parser.add_argument('--size', type=int, default=32 * 1024, help='Dictionary size in bytes')
+        parser.add_argument('--recompress', action='store_true', help='Rewrite stored plans with the new dictionary')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        codec = configured_codec()
+        if codec == CODEC_RAW:
+            raise CommandError(f"MEAL_PLAN_COMPRESSION is '{settings.MEAL_PLAN_COMPRESSION}', nothing to train")
+
+        plans = MealPlan.objects.exclude(plan_body=b'').order_by('-id').only('id', 'plan_body')[:options['samples']]
+        samples = [plan.plan_text for plan in plans]
+        if len(samples) < 10:
+            raise CommandError(f"Need at least 10 stored meal plans to train on, found {len(samples)}")
+
+        data = train_dictionary(samples, codec, options['size'])
+        dictionary = CompressionDictionary.objects.create(codec=codec, data=data, sample_count=len(samples))
+        codec_name = next(name for name, value in CODECS.items() if value == codec)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {codec_name} dictionary {dictionary.id} ({len(data)} bytes) trained on {len(samples)} plans"
+        ))
+
+        if options['recompress']:
+            self._recompress(options['batch_size'])
+
+    def _recompress(self, batch_size):
+        reset_dictionary_cache()
+
+        before = after = count = 0
+        last_id = 0
+        while True:
+            batch = list(
+                MealPlan.objects.filter(id__gt=last_id).exclude(plan_body=b'')
+                .order_by('id').only('id', 'plan_body')[:batch_size]
+            )
+            if not batch:
+                break
+            for plan in batch:
+                before += len(plan.plan_body)
+                plan.plan_body = compress_plan(plan.plan_text)
+                after += len(plan.plan_body)
+            MealPlan.objects.bulk_update(batch, ['plan_body'])
+            count += len(batch)
+            last_id = batch[-1].id
+        self.stdout.write(f"Recompressed {count} plans: {before} -> {after} bytes")
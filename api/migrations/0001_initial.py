@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('users', '0006_emailverification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('estimated_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('cart_url', models.URLField(blank=True, max_length=500)),
+                ('prompt_version', models.CharField(blank=True, max_length=20)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_plans', to='users.profile')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Meal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('slot', models.CharField(choices=[('breakfast', 'Breakfast'), ('lunch', 'Lunch'), ('dinner', 'Dinner'), ('snack', 'Snack')], max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('instructions', models.TextField(blank=True)),
+                ('estimated_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('meal_plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meals', to='api.mealplan')),
+            ],
+            options={
+                'ordering': ['meal_plan', 'day', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('normalized_name', models.CharField(max_length=255)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('unit', models.CharField(max_length=50)),
+                ('estimated_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='api.meal')),
+                ('meal_plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='api.mealplan')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='mealplan',
+            index=models.Index(fields=['profile', '-created_at'], name='api_mealpla_profile_0627d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['meal_plan', 'day', 'position'], name='api_meal_meal_pl_e467eb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['meal_plan', 'normalized_name'], name='api_ingredi_meal_pl_83cd35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['normalized_name'], name='api_ingredi_normali_25e7ec_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientProductMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_name', models.CharField(max_length=255)),
+                ('restrictions_key', models.CharField(blank=True, max_length=255)),
+                ('product_name', models.CharField(max_length=255)),
+                ('filters', models.JSONField(default=dict, help_text='Instacart line item filters (brand_filters, health_filters)')),
+                ('product_ids', models.JSONField(blank=True, default=list, help_text='Optional Instacart product ids to pin')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('normalized_name', 'restrictions_key'), name='unique_ingredient_product')],
+            },
+        ),
+    ]
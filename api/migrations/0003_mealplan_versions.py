@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_ingredientproductmapping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealplan',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='mealplan',
+            name='plan_text',
+            field=models.TextField(blank=True, help_text='The plan rendered as text'),
+        ),
+        migrations.AddField(
+            model_name='mealplan',
+            name='changes',
+            field=models.JSONField(blank=True, help_text='Ingredient delta of the last partial regeneration', null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+from django.db import migrations
+from django.utils.dateparse import parse_datetime
+
+
+def move_profile_meal_plans(apps, schema_editor):
+    """
+    Numbers existing plans per profile and moves the rendered plan text from
+    Profile.meal_plan into MealPlan rows.
+    """
+    MealPlan = apps.get_model('api', 'MealPlan')
+    Profile = apps.get_model('users', 'Profile')
+
+    latest_versions = {}
+    plans = list(MealPlan.objects.order_by('profile_id', 'created_at', 'id'))
+    for plan in plans:
+        plan.version = latest_versions[plan.profile_id] = latest_versions.get(plan.profile_id, 0) + 1
+    MealPlan.objects.bulk_update(plans, ['version'], batch_size=500)
+
+    for profile in Profile.objects.exclude(meal_plan=None).only('id', 'meal_plan').iterator():
+        data = profile.meal_plan
+        if not isinstance(data, dict) or not data.get('plan'):
+            continue
+        plan = MealPlan.objects.filter(id=data.get('meal_plan_id'), profile_id=profile.id).first()
+        if plan is None:
+            # Plans generated before the MealPlan table only exist as text on the profile
+            version = latest_versions[profile.id] = latest_versions.get(profile.id, 0) + 1
+            plan = MealPlan.objects.create(profile_id=profile.id, version=version)
+            generated_at = parse_datetime(str(data.get('generated_at', '')))
+            if generated_at:
+                MealPlan.objects.filter(id=plan.id).update(created_at=generated_at)
+        plan.plan_text = data['plan']
+        plan.cart_url = data.get('cart_url') or plan.cart_url
+        plan.changes = data.get('changes')
+        plan.save(update_fields=['plan_text', 'cart_url', 'changes'])
+
+
+def restore_profile_meal_plans(apps, schema_editor):
+    MealPlan = apps.get_model('api', 'MealPlan')
+    Profile = apps.get_model('users', 'Profile')
+
+    latest = {}
+    for plan in MealPlan.objects.order_by('profile_id', 'version'):
+        latest[plan.profile_id] = plan
+    for profile_id, plan in latest.items():
+        meal_plan = {
+            'plan': plan.plan_text,
+            'cart_url': plan.cart_url,
+            'generated_at': str(plan.created_at),
+            'meal_plan_id': plan.id,
+        }
+        if plan.changes:
+            meal_plan['changes'] = plan.changes
+        Profile.objects.filter(id=profile_id).update(meal_plan=meal_plan)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_mealplan_versions'),
+        ('users', '0006_emailverification'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_profile_meal_plans, restore_profile_meal_plans),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Kept apart from the data migration: PostgreSQL refuses to ALTER a table
+    # with pending (deferred foreign key) trigger events from the same transaction
+
+    dependencies = [
+        ('api', '0004_move_profile_meal_plans'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='mealplan',
+            constraint=models.UniqueConstraint(fields=('profile', 'version'), name='unique_meal_plan_version'),
+        ),
+    ]
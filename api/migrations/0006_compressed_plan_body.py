@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_unique_meal_plan_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.PositiveSmallIntegerField()),
+                ('data', models.BinaryField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='mealplan',
+            name='plan_body',
+            field=models.BinaryField(blank=True, default=b'', help_text='The plan rendered as text, compressed'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:20
+
+import struct
+import zlib
+
+from django.db import migrations
+
+# The body format as of this migration (see core.plan_compression): a header of
+# codec (1 byte) and dictionary id (4 bytes, 0 = none), then the UTF-8 text
+HEADER = struct.Struct('>BI')
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+
+def compress_plan_texts(apps, schema_editor):
+    MealPlan = apps.get_model('api', 'MealPlan')
+    plans = []
+    for plan in MealPlan.objects.exclude(plan_text='').only('id', 'plan_text').iterator():
+        # No dictionary has been trained yet; train_plan_dictionary --recompress can apply one later
+        plan.plan_body = HEADER.pack(CODEC_ZLIB, 0) + zlib.compress(plan.plan_text.encode('utf-8'))
+        plans.append(plan)
+        if len(plans) == 500:
+            MealPlan.objects.bulk_update(plans, ['plan_body'])
+            plans = []
+    MealPlan.objects.bulk_update(plans, ['plan_body'])
+
+
+def decompress_plan_body(data, dictionaries):
+    data = bytes(data)
+    codec, dictionary_id = HEADER.unpack_from(data)
+    body = data[HEADER.size:]
+    dictionary = dictionaries[dictionary_id] if dictionary_id else None
+    if codec == CODEC_ZSTD:
+        # Bodies recompressed with zstd after the migration ran
+        import zstandard
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        raw = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(body)
+    elif codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        raw = decompressor.decompress(body) + decompressor.flush()
+    else:
+        raw = body
+    return raw.decode('utf-8')
+
+
+def decompress_plan_bodies(apps, schema_editor):
+    MealPlan = apps.get_model('api', 'MealPlan')
+    CompressionDictionary = apps.get_model('api', 'CompressionDictionary')
+    dictionaries = {
+        dictionary_id: bytes(data)
+        for dictionary_id, data in CompressionDictionary.objects.values_list('id', 'data')
+    }
+    plans = []
+    for plan in MealPlan.objects.exclude(plan_body=b'').only('id', 'plan_body').iterator():
+        plan.plan_text = decompress_plan_body(plan.plan_body, dictionaries)
+        plans.append(plan)
+        if len(plans) == 500:
+            MealPlan.objects.bulk_update(plans, ['plan_text'])
+            plans = []
+    MealPlan.objects.bulk_update(plans, ['plan_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_compressed_plan_body'),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_plan_texts, decompress_plan_bodies),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_compress_plan_texts'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='mealplan',
+            name='plan_text',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_remove_mealplan_plan_text'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='meal',
+            options={'ordering': ['meal_plan_id', 'day', 'position']},
+        ),
+    ]
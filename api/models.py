@@ -1,3 +1,324 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Max, Sum
+from users.models import Profile
+from core.ingredients import aggregate_ingredients, canonical_ingredient_name
+from core.plan_compression import compress_plan, decompress_plan
 
 # Create your models here.
+
+class MealPlan(models.Model):
+    """
+    A generated meal plan, stored as normalized days/meals/ingredients so that
+    reads, ingredient aggregation and cart creation are plain queries.
+
+    Each generation for a profile gets the next version number; the profile's
+    current plan is the one with the highest version. The rendered text is
+    kept here rather than on the profile, so profile reads stay small, and is
+    stored compressed (see core.plan_compression): read and assign it through
+    ``plan_text``, which decompresses on first access.
+    """
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='meal_plans')
+    version = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    estimated_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    cart_url = models.URLField(max_length=500, blank=True)
+    prompt_version = models.CharField(max_length=20, blank=True)
+    plan_body = models.BinaryField(blank=True, default=b'', help_text="The plan rendered as text, compressed")
+    changes = models.JSONField(null=True, blank=True, help_text="Ingredient delta of the last partial regeneration")
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['profile', '-created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'version'], name='unique_meal_plan_version'),
+        ]
+
+    def __str__(self):
+        return f"Meal plan {self.id} for {self.profile}"
+
+    @classmethod
+    def create_from_document(cls, profile, document, prompt_version=''):
+        """
+        Persists a validated structured meal plan (see core.meal_plan_schema)
+        as the profile's next version. Meals and ingredients are written with
+        one bulk insert each.
+        """
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    latest = cls.objects.filter(profile=profile).aggregate(version=Max('version'))['version']
+                    meal_plan = cls.objects.create(
+                        profile=profile,
+                        version=(latest or 0) + 1,
+                        estimated_cost=document.get('estimated_cost'),
+                        prompt_version=prompt_version
+                    )
+                    meal_plan.add_meals(document['days'])
+                return meal_plan
+            except IntegrityError:
+                # Another plan for the profile took the version number meanwhile
+                if attempt == 2:
+                    raise
+
+    @classmethod
+    def latest_for(cls, profile_id, fields=None):
+        """
+        Returns the profile's current (highest version) meal plan, or None.
+
+        Args:
+            profile_id: The profile's ID
+            fields: Only load these columns
+        """
+        queryset = cls.objects.filter(profile_id=profile_id).order_by('-version')
+        if fields:
+            queryset = queryset.only(*fields)
+        return queryset.first()
+
+    @property
+    def plan_text(self):
+        # Decompressed once per loaded body
+        cached = self.__dict__.get('_plan_text')
+        if cached is None or cached[0] is not self.plan_body:
+            cached = self.__dict__['_plan_text'] = (self.plan_body, decompress_plan(self.plan_body))
+        return cached[1]
+
+    @plan_text.setter
+    def plan_text(self, text):
+        self.plan_body = compress_plan(text or '')
+        self.__dict__['_plan_text'] = (self.plan_body, text or '')
+
+    def summary(self, status=None):
+        """
+        The lightweight representation returned with profiles.
+        """
+        return {
+            'id': self.id,
+            'version': self.version,
+            'status': status,
+            'generated_at': self.created_at.isoformat() if self.created_at else None,
+            'cart_url': self.cart_url,
+        }
+
+    def add_meals(self, days):
+        """
+        Bulk inserts the meals and ingredients of validated day plans.
+        """
+        meal_rows = []
+        meal_ingredients = []
+        for day in days:
+            day_index = Meal.DAYS.index(day['day'])
+            for position, meal in enumerate(day['meals']):
+                meal_rows.append(Meal(
+                    meal_plan=self,
+                    day=day_index,
+                    position=position,
+                    slot=meal['slot'],
+                    name=meal['name'][:255],
+                    instructions=meal['instructions'],
+                    estimated_cost=meal['estimated_cost']
+                ))
+                meal_ingredients.append(meal['ingredients'])
+        meals = Meal.objects.bulk_create(meal_rows)
+
+        Ingredient.objects.bulk_create([
+            Ingredient(
+                meal_plan=self,
+                meal=meal,
+                name=item['name'][:255],
+                normalized_name=Ingredient.normalize_name(item['name']),
+                quantity=item['quantity'],
+                unit=item['unit'][:50],
+                estimated_cost=item['estimated_cost']
+            )
+            for meal, items in zip(meals, meal_ingredients)
+            for item in items
+        ])
+        return meals
+
+    def replace_meals(self, targets, days):
+        """
+        Replaces the targeted meals with newly generated ones and updates the
+        plan's estimated cost by the difference.
+
+        Args:
+            targets: (day name, slot or None) pairs; a None slot targets the whole day
+            days: Validated day plans containing only the replacement meals
+        """
+        with transaction.atomic():
+            selector = models.Q()
+            for day, slot in targets:
+                condition = models.Q(day=Meal.DAYS.index(day))
+                if slot:
+                    condition &= models.Q(slot=slot)
+                selector |= condition
+            replaced = self.meals.filter(selector)
+            removed_cost = replaced.aggregate(total=Sum('estimated_cost'))['total'] or 0
+            replaced.delete()
+
+            # Replacement meals go after the meals kept on the same day
+            last_positions = dict(
+                self.meals.order_by().values_list('day').annotate(last=models.Max('position'))
+            )
+            meals = self.add_meals(days)
+            for meal in meals:
+                meal.position += last_positions.get(meal.day, -1) + 1
+            Meal.objects.bulk_update(meals, ['position'])
+
+            added_cost = sum((meal.estimated_cost or 0 for meal in meals), 0)
+            if self.estimated_cost is not None:
+                self.estimated_cost = max(self.estimated_cost - removed_cost + added_cost, 0)
+                self.save(update_fields=['estimated_cost'])
+        return meals
+
+    def to_document(self):
+        """
+        Rebuilds the structured plan (as produced by core.meal_plan_schema) from the tables.
+        """
+        days = {}
+        for meal in self.meals.prefetch_related('ingredients'):
+            day = days.setdefault(meal.day, {
+                'day': Meal.DAYS[meal.day], 'meals': [], 'estimated_cost': 0
+            })
+            day['meals'].append({
+                'slot': meal.slot,
+                'name': meal.name,
+                'instructions': meal.instructions,
+                'estimated_cost': meal.estimated_cost,
+                'ingredients': [
+                    {
+                        'name': item.name,
+                        'quantity': item.quantity,
+                        'unit': item.unit,
+                        'estimated_cost': item.estimated_cost
+                    }
+                    for item in meal.ingredients.all()
+                ]
+            })
+            day['estimated_cost'] += meal.estimated_cost or 0
+        return {
+            'days': [days[index] for index in sorted(days)],
+            'estimated_cost': self.estimated_cost or 0
+        }
+
+    def shopping_list(self):
+        """
+        Aggregates the plan's ingredients by normalized name and unit in the
+        database, then merges units of the same dimension (see core.ingredients).
+
+        Returns:
+            List[Dict]: Ingredients with name, quantity and unit
+        """
+        rows = (
+            self.ingredients
+            .values('normalized_name', 'unit')
+            .annotate(quantity=Sum('quantity'))
+            .order_by()
+        )
+        return aggregate_ingredients(
+            {'name': row['normalized_name'], 'quantity': row['quantity'], 'unit': row['unit']}
+            for row in rows
+        )
+
+
+class CompressionDictionary(models.Model):
+    """
+    A compression dictionary trained on stored meal plans (manage.py
+    train_plan_dictionary). Compressed bodies record the id of the dictionary
+    they were written with, so dictionaries are never changed or deleted
+    while a plan still refers to them.
+    """
+    codec = models.PositiveSmallIntegerField()
+    data = models.BinaryField()
+    sample_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Compression dictionary {self.id} ({len(self.data)} bytes)"
+
+
+class Meal(models.Model):
+    DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    DAY_CHOICES = list(enumerate(DAYS))
+    SLOT_CHOICES = [
+        ('breakfast', 'Breakfast'),
+        ('lunch', 'Lunch'),
+        ('dinner', 'Dinner'),
+        ('snack', 'Snack'),
+    ]
+
+    meal_plan = models.ForeignKey(MealPlan, on_delete=models.CASCADE, related_name='meals')
+    day = models.PositiveSmallIntegerField(choices=DAY_CHOICES)
+    position = models.PositiveSmallIntegerField(default=0)
+    slot = models.CharField(max_length=20, choices=SLOT_CHOICES)
+    name = models.CharField(max_length=255)
+    instructions = models.TextField(blank=True)
+    estimated_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ['meal_plan_id', 'day', 'position']
+        indexes = [
+            models.Index(fields=['meal_plan', 'day', 'position']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_day_display()} {self.slot}: {self.name}"
+
+
+class Ingredient(models.Model):
+    # meal_plan is denormalized from meal so a plan's shopping list is a single indexed aggregate
+    meal_plan = models.ForeignKey(MealPlan, on_delete=models.CASCADE, related_name='ingredients')
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='ingredients')
+    name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255)
+    quantity = models.DecimalField(max_digits=12, decimal_places=3)
+    unit = models.CharField(max_length=50)
+    estimated_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['meal_plan', 'normalized_name']),
+            models.Index(fields=['normalized_name']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} {self.unit} {self.name}"
+
+    @staticmethod
+    def normalize_name(name):
+        return canonical_ingredient_name(name)
+
+
+class IngredientProductMapping(models.Model):
+    """
+    The Instacart line item payload resolved for an ingredient under a set of
+    dietary health filters. Cart line items are built by looking these up
+    (see core.product_mapping) rather than from raw names on every request;
+    entries can be curated in the admin, e.g. to pin brands or product ids.
+    """
+    normalized_name = models.CharField(max_length=255)
+    # Sorted, comma-separated Instacart health filters derived from the dietary restrictions
+    restrictions_key = models.CharField(max_length=255, blank=True)
+    product_name = models.CharField(max_length=255)
+    filters = models.JSONField(default=dict, help_text="Instacart line item filters (brand_filters, health_filters)")
+    product_ids = models.JSONField(default=list, blank=True, help_text="Optional Instacart product ids to pin")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['normalized_name', 'restrictions_key'], name='unique_ingredient_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.normalized_name} [{self.restrictions_key or 'no filters'}] -> {self.product_name}"
+
+    def to_line_item(self):
+        """
+        Returns the product part of an Instacart line item; quantities are added per cart.
+        """
+        line_item = {'name': self.product_name, 'filters': self.filters}
+        if self.product_ids:
+            line_item['product_ids'] = self.product_ids
+        return line_item
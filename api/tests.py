@@ -1,3 +1,619 @@
-from django.test import TestCase
+import io
+from decimal import Decimal
+from unittest import mock
+
+import requests
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from core.celery import check_generation_pool
+from core.ingredients import (
+    VECTORIZE_THRESHOLD, aggregate_ingredients, canonical_ingredient_name, extract_ingredients_from_text,
+)
+from core.llm import MealPlanningChainPool
+from core import plan_compression
+from core.meal_plan_cache import MealPlanCache
+from core.plan_compression import (
+    CODEC_RAW, CODEC_ZLIB, CODECS, compress_plan, decompress_plan, reset_dictionary_cache, train_dictionary,
+)
+from core.rate_limiter import OpenAIRateLimiter, RateLimitTimeout, TokenUsageHandler
+from core.resilience import CircuitBreaker, CircuitOpenError
+from core.streaming import MealPlanStreamPublisher, RedisStreamCallbackHandler
+from core.task_locks import LockResult
+from core.tasks import generate_meal_plan
+from core.testing import QueryBudgetMixin, isolate_throttles, use_fake_redis
+from . import urls
+from .models import CompressionDictionary, MealPlan
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def make_document():
+    """
+    A week of three meals a day with three ingredients each.
+    """
+    return {
+        'estimated_cost': Decimal('105.00'),
+        'days': [
+            {
+                'day': day,
+                'estimated_cost': Decimal('15.00'),
+                'meals': [
+                    {
+                        'slot': slot,
+                        'name': f'{day} {slot}',
+                        'instructions': 'Cook it.',
+                        'estimated_cost': Decimal('5.00'),
+                        'ingredients': [
+                            {'name': name, 'quantity': Decimal('1'), 'unit': 'each', 'estimated_cost': Decimal('1.50')}
+                            for name in ('onion', 'garlic', 'rice')
+                        ],
+                    }
+                    for slot in ('breakfast', 'lunch', 'dinner')
+                ],
+            }
+            for day in DAYS
+        ],
+    }
+
+
+class IngredientTests(SimpleTestCase):
+    """
+    Ingredient parsing and shopping list aggregation (core.ingredients).
+    """
+
+    def names(self, text):
+        return [item['name'] for item in extract_ingredients_from_text(text)]
+
+    def test_plurals_of_words_ending_in_o(self):
+        self.assertEqual(self.names('2 avocados, 3 potatoes and 4 tomatos'), ['avocado', 'potato', 'tomato'])
+        self.assertEqual(canonical_ingredient_name('Avocadoes'), 'avocado')
+
+    def test_distinct_products_keep_their_own_entries(self):
+        text = '2 tbsp lemon juice, 1 lemon, 1 cup brown sugar, 1 tbsp sugar, 1 pepper, diced, ' \
+               '1 tsp black pepper, 2 tbsp tamari, 1 tbsp soy sauce'
+        self.assertEqual(self.names(text), [
+            'lemon juice', 'lemon', 'brown sugar', 'sugar', 'pepper', 'black pepper', 'tamari', 'soy sauce'
+        ])
+
+    def test_quantities_and_units(self):
+        self.assertEqual(extract_ingredients_from_text('1 1/2 Tablespoons olive oil and ½ cup of rice'), [
+            {'name': 'olive oil', 'quantity': 1.5, 'unit': 'tbsp'},
+            {'name': 'rice', 'quantity': 0.5, 'unit': 'cup'},
+        ])
+
+    def test_only_shopping_list_section_is_read(self):
+        text = 'Monday: 2 eggs with spinach\n\nShopping List:\n- 12 eggs\n- spinach\n'
+        self.assertEqual(extract_ingredients_from_text(text), [
+            {'name': 'egg', 'quantity': 12.0, 'unit': 'each'},
+            {'name': 'spinach', 'quantity': 1, 'unit': 'each'},
+        ])
+
+    def test_unquantified_mention_is_dropped_when_quantified(self):
+        self.assertEqual(self.names('garlic, then 3 cloves garlic'), ['garlic'])
+
+    def test_aggregate_converts_units_of_one_dimension(self):
+        shopping_list = aggregate_ingredients([
+            {'name': 'Olive Oil', 'quantity': '4', 'unit': 'tablespoons'},
+            {'name': 'extra virgin olive oil', 'quantity': 0.25, 'unit': 'cup'},
+            {'name': 'garlic', 'quantity': 2, 'unit': 'cloves'},
+            {'name': 'garlic', 'quantity': 1, 'unit': ''},
+        ])
+        self.assertEqual(shopping_list, [
+            {'name': 'Garlic', 'quantity': 2.0, 'unit': 'clove'},
+            {'name': 'Garlic', 'quantity': 1.0, 'unit': 'each'},
+            {'name': 'Olive Oil', 'quantity': 0.5, 'unit': 'cup'},
+        ])
+
+    def test_aggregate_vectorized_matches_loop(self):
+        items = [{'name': 'rice', 'quantity': 1, 'unit': 'cup'}] * (VECTORIZE_THRESHOLD + 1)
+        with mock.patch('core.ingredients.np', None):
+            expected = aggregate_ingredients(items)
+        self.assertEqual(aggregate_ingredients(items), expected)
+        self.assertEqual(expected, [{'name': 'Rice', 'quantity': 65.0, 'unit': 'cup'}])
+
+
+class ApiQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Query budgets of every endpoint in api/urls.py (see query_budgets.json).
+
+    Redis and the Celery broker are mocked out; only database queries count.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'Corr3ct-horse-battery')
+        verification = self.user.email_verification
+        verification.is_verified = True
+        verification.save()
+        self.profile = self.user.profile
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def create_meal_plan(self):
+        meal_plan = MealPlan.create_from_document(self.profile, make_document())
+        meal_plan.plan_text = 'Monday breakfast: Monday breakfast\n' * 20
+        meal_plan.save()
+        return meal_plan
+
+    def test_budgets_cover_all_urls(self):
+        self.assertBudgetsCover(urls.urlpatterns)
+
+    @mock.patch('api.views.generate_meal_plan')
+    @mock.patch('api.views.task_status')
+    @mock.patch('api.views.meal_plan_inflight_lock')
+    def test_trigger_meal_plan(self, inflight_lock, task_status, generate_meal_plan):
+        inflight_lock.acquire.side_effect = lambda profile_id, task_id, *args, **kwargs: LockResult(True, task_id)
+        generate_meal_plan.apply_async.side_effect = lambda args, task_id: mock.Mock(id=task_id)
+        response = self.request_within_budget(
+            'POST trigger-meal-plan', reverse('trigger-meal-plan', args=[self.profile.id])
+        )
+        self.assertEqual(response.status_code, 200)
+        generate_meal_plan.apply_async.assert_called_once()
+
+    @mock.patch('api.views.regenerate_meal_plan_part')
+    @mock.patch('api.views.task_status')
+    @mock.patch('api.views.meal_plan_inflight_lock')
+    def test_regenerate_meal_plan(self, inflight_lock, task_status, regenerate_meal_plan_part):
+        inflight_lock.acquire.side_effect = lambda profile_id, task_id, *args, **kwargs: LockResult(True, task_id)
+        self.create_meal_plan()
+        regenerate_meal_plan_part.apply_async.side_effect = lambda args, task_id: mock.Mock(id=task_id)
+        response = self.request_within_budget(
+            'POST regenerate-meal-plan', reverse('regenerate-meal-plan', args=[self.profile.id]),
+            {'days': ['Tuesday']}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_meal_plan_detail(self):
+        self.create_meal_plan()
+        url = reverse('meal-plan-detail', args=[self.profile.id])
+        response = self.request_within_budget('GET meal-plan-detail', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['meal_plan']['days']), 7)
+
+        response = self.request_within_budget(
+            'GET meal-plan-detail not-modified', url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_meal_plan_version(self):
+        self.create_meal_plan()
+        response = self.request_within_budget(
+            'GET meal-plan-version', reverse('meal-plan-version', args=[self.profile.id, 1])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['meal_plan']['version'], 1)
+
+    @mock.patch('api.views.get_stream_owner', new_callable=mock.AsyncMock)
+    def test_meal_plan_stream(self, get_stream_owner):
+        get_stream_owner.return_value = self.profile.id
+        response = self.request_within_budget(
+            'GET meal-plan-stream', reverse('meal-plan-stream', args=[self.profile.id, 'task-1'])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+    @mock.patch('api.views.task_status')
+    def test_task_status(self, task_status):
+        task_status.wait_for_change = mock.AsyncMock(return_value={
+            'task_id': 'task-1', 'profile_id': self.profile.id, 'state': 'llm', 'version': 3
+        })
+        response = self.request_within_budget('GET task-status', reverse('task-status', args=['task-1']))
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch('api.views.task_status')
+    def test_task_status_rejects_non_finite_wait(self, task_status):
+        for wait in ('nan', 'inf', 'soon'):
+            with self.subTest(wait=wait):
+                response = self.client.get(reverse('task-status', args=['task-1']), {'wait': wait})
+                self.assertEqual(response.status_code, 400)
+        task_status.wait_for_change.assert_not_called()
+
+    def test_email_verification_status(self):
+        response = self.request_within_budget('GET email-verification-status', reverse('email-verification-status'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['email_verified'])
+
+    @mock.patch('api.views.meal_plan_cache')
+    def test_meal_plan_cache_stats(self, meal_plan_cache):
+        meal_plan_cache.stats.return_value = {'hits': 0, 'misses': 0}
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.request_within_budget('GET meal-plan-cache-stats', reverse('meal-plan-cache-stats'))
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch('api.views.task_status')
+    def test_meal_plan_stage_latency(self, task_status):
+        task_status.latency_percentiles.return_value = {}
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.request_within_budget('GET meal-plan-stage-latency', reverse('meal-plan-stage-latency'))
+        self.assertEqual(response.status_code, 200)
+
+
+class MealPlanLockTests(APITestCase):
+    """
+    The per-profile in-flight lock around generation (core.task_locks).
+    """
+
+    def setUp(self):
+        super().setUp()
+        isolate_throttles(self)
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'Corr3ct-horse-battery')
+        verification = self.user.email_verification
+        verification.is_verified = True
+        verification.save()
+        self.profile = self.user.profile
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.lock = self.patch('api.views.meal_plan_inflight_lock')
+        self.task_status = self.patch('api.views.task_status')
+
+    def patch(self, target):
+        patcher = mock.patch(target)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def trigger(self):
+        return self.client.post(
+            reverse('trigger-meal-plan', args=[self.profile.id]), {'supersede': True}, format='json'
+        )
+
+    @mock.patch('core.streaming.task_status')
+    @mock.patch('api.views.generate_meal_plan')
+    @mock.patch('api.views.current_app')
+    def test_superseded_run_is_revoked_and_marked(self, celery_app, generate_meal_plan, stream_task_status):
+        self.lock.acquire.side_effect = lambda profile_id, task_id, *args, **kwargs: LockResult(True, task_id, 'old-task')
+        generate_meal_plan.apply_async.side_effect = lambda args, task_id: mock.Mock(id=task_id)
+        response = self.trigger()
+        self.assertEqual(response.status_code, 200)
+        celery_app.control.revoke.assert_called_once_with('old-task')
+        stream_task_status.finish.assert_called_once_with(
+            'old-task', 'superseded', 'Superseded by a newer meal plan request.'
+        )
+
+    def test_lock_is_released_when_the_status_record_fails(self):
+        self.lock.acquire.side_effect = lambda profile_id, task_id, *args, **kwargs: LockResult(True, task_id)
+        self.task_status.create.side_effect = RuntimeError('status store down')
+        with self.assertLogs(level='ERROR'):
+            response = self.trigger()
+        self.assertEqual(response.status_code, 500)
+        self.lock.release.assert_called_once()
+
+    @mock.patch('api.views.regenerate_meal_plan_part')
+    def test_regeneration_is_refused_while_a_generation_runs(self, regenerate_meal_plan_part):
+        MealPlan.create_from_document(self.profile, make_document())
+        self.lock.acquire.return_value = LockResult(False, 'running-task')
+        response = self.client.post(
+            reverse('regenerate-meal-plan', args=[self.profile.id]), {'days': ['Tuesday']}, format='json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['task_id'], 'running-task')
+        regenerate_meal_plan_part.apply_async.assert_not_called()
+
+    @mock.patch('core.tasks.meal_planning_chain_pool')
+    @mock.patch('core.tasks.mark_profile_processing')
+    @mock.patch('core.streaming.task_status')
+    @mock.patch('core.tasks.meal_plan_inflight_lock')
+    def test_superseded_run_stops_before_the_llm(self, task_lock, stream_task_status, mark_processing, chain_pool):
+        task_lock.is_superseded.return_value = True
+        generate_meal_plan.apply(args=(self.profile.id,), task_id='old-task')
+        mark_processing.assert_not_called()
+        chain_pool.get.assert_not_called()
+        self.assertEqual(stream_task_status.finish.call_args.args[:2], ('old-task', 'superseded'))
+
+
+class ChainPoolWarmUpTests(SimpleTestCase):
+    """
+    Worker start-up warm-up of the meal planning chains (core.llm).
+    """
+
+    def setUp(self):
+        self.chain = mock.Mock()
+        self.pool = MealPlanningChainPool(factory=lambda: self.chain)
+
+    def test_prompt_mentions_json(self):
+        # The chains use JSON mode, which OpenAI refuses for prompts that do not mention JSON
+        self.assertTrue(self.pool.warm_up())
+        prompt = self.chain.llm.invoke.call_args.args[0]
+        self.assertIn('json', prompt.lower())
+
+    def test_errors_raised_before_calling_keep_chain_healthy(self):
+        self.pool.get()
+        self.pool.mark_failed(CircuitOpenError('openai', 30))
+        self.pool.mark_failed(RateLimitTimeout('busy'))
+        self.assertTrue(self.pool.health_check()['healthy'])
+
+    def test_failure_keeps_chain_healthy(self):
+        self.chain.llm.invoke.side_effect = ConnectionError('timed out')
+        self.assertFalse(self.pool.warm_up())
+        self.assertTrue(self.pool.health_check()['healthy'])
+
+
+@override_settings(MEAL_PLAN_GENERATION_MODE='async')
+class GenerationPoolCheckTests(SimpleTestCase):
+    """
+    Worker start-up check of the pool used for async generation (core.celery).
+    """
+
+    def test_prefork_pool_warns(self):
+        with self.assertLogs('core.tasks', level='WARNING'):
+            check_generation_pool(sender=mock.Mock(pool_cls='prefork'))
+
+    def test_threads_pool_is_quiet(self):
+        with self.assertNoLogs('core.tasks', level='WARNING'):
+            check_generation_pool(sender=mock.Mock(pool_cls='threads'))
+
+
+@override_settings(OPENAI_RPM_LIMIT=2, OPENAI_TPM_LIMIT=0, OPENAI_RATE_LIMIT_MAX_WAIT=60)
+class OpenAIRateLimiterTests(SimpleTestCase):
+    """
+    The GCRA reservation and reconciliation scripts (core.rate_limiter) run against an in-memory Redis.
+    """
+
+    def setUp(self):
+        self.redis = use_fake_redis(self)
+        self.limiter = OpenAIRateLimiter()
+
+    def test_requests_past_the_rate_wait_for_capacity(self):
+        self.assertEqual([self.limiter.reserve(100), self.limiter.reserve(100)], [0.0, 0.0])
+        # Two requests a minute: the third starts once the first has drained
+        self.assertAlmostEqual(self.limiter.reserve(100), 30, delta=1)
+
+    @override_settings(OPENAI_RATE_LIMIT_MAX_WAIT=10)
+    def test_refuses_waits_past_the_maximum(self):
+        self.limiter.reserve(100)
+        self.limiter.reserve(100)
+        rpm_key = self.limiter._keys()[0]
+        reserved = self.redis.get(rpm_key)
+        with self.assertRaises(RateLimitTimeout):
+            self.limiter.reserve(100)
+        # A refused request reserves nothing
+        self.assertEqual(self.redis.get(rpm_key), reserved)
+
+    @override_settings(OPENAI_RPM_LIMIT=0, OPENAI_TPM_LIMIT=1000)
+    def test_reconcile_returns_unused_tokens(self):
+        now = self.redis.time()
+        tpm_key = self.limiter._keys()[1]
+        self.limiter.reserve(500)
+        self.assertAlmostEqual(float(self.redis.get(tpm_key)) - now[0], 30, delta=1)
+        self.limiter.reconcile(500, 100)
+        self.assertAlmostEqual(float(self.redis.get(tpm_key)) - now[0], 6, delta=1)
+
+    def test_streamed_completion_usage_is_counted(self):
+        usage = TokenUsageHandler(prompt_tokens=40)
+        for token in ('Mon', 'day', ':'):
+            usage.on_llm_new_token(token)
+        usage.on_llm_end(mock.Mock(llm_output=None))
+        self.assertEqual(usage.total_tokens, 43)
+
+        usage.on_llm_end(mock.Mock(llm_output={'token_usage': {'total_tokens': 50}}))
+        self.assertEqual(usage.total_tokens, 50)
+
+
+@override_settings(MEAL_PLAN_STREAMING=True, MEAL_PLAN_STREAM_FLUSH_CHARS=1)
+class StreamCallbackTests(SimpleTestCase):
+    """
+    Forwarding of streamed tokens to the task's event stream (core.streaming).
+    """
+
+    def setUp(self):
+        self.publisher = MealPlanStreamPublisher('task-1', 1)
+        patcher = mock.patch.object(self.publisher, '_publish')
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.handler = RedisStreamCallbackHandler(self.publisher)
+
+    def stream(self, *tokens):
+        self.handler.on_llm_start({}, ['prompt'])
+        for token in tokens:
+            self.handler.on_llm_new_token(token)
+
+    def test_retried_completion_resets_stream(self):
+        self.stream('Mon', 'day')
+        self.stream('Monday', ':', ' rice')
+        with mock.patch.object(self.publisher, 'add_tokens') as add_tokens:
+            self.handler.on_llm_end(mock.Mock(llm_output={}))
+        events = [(call.args[0], call.args[1].get('text')) for call in self.publish.call_args_list]
+        self.assertEqual(events, [
+            ('chunk', 'Mon'), ('chunk', 'day'), ('reset', None),
+            ('chunk', 'Monday'), ('chunk', ':'), ('chunk', ' rice'),
+        ])
+        add_tokens.assert_called_once_with(completion_tokens=3)
+
+    def test_first_attempt_sends_no_reset(self):
+        self.stream('Monday')
+        self.assertEqual([call.args[0] for call in self.publish.call_args_list], ['chunk'])
+
+
+@override_settings(
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD=3, CIRCUIT_BREAKER_WINDOW=60,
+    CIRCUIT_BREAKER_COOLDOWN=30, UPSTREAM_RETRY_ATTEMPTS=1
+)
+class CircuitBreakerTests(SimpleTestCase):
+    """
+    The shared circuit breaker (core.resilience), run against fakeredis.
+    """
+
+    def setUp(self):
+        self.redis = use_fake_redis(self)
+        self.breaker = CircuitBreaker('test')
+
+    def fail_upstream(self):
+        raise requests.ConnectionError('upstream down')
+
+    def attempt(self, func):
+        try:
+            return self.breaker.call(func)
+        except requests.ConnectionError:
+            return 'failed'
+        except CircuitOpenError:
+            return 'open'
+
+    def test_interleaved_failures_open_the_breaker(self):
+        results = [self.attempt(func) for func in (self.fail_upstream, lambda: 'ok') * 3]
+        self.assertEqual(results, ['failed', 'ok', 'failed', 'ok', 'failed', 'open'])
+
+    def test_successful_probe_closes_the_breaker(self):
+        for _ in range(3):
+            self.attempt(self.fail_upstream)
+        self.breaker = CircuitBreaker('test')
+        self.redis.hset(self.breaker.key, 'retry_at', 0)
+        self.assertEqual(self.attempt(lambda: 'ok'), 'ok')
+        self.assertFalse(self.redis.exists(self.breaker.key))
+
+
+@override_settings(MEAL_PLAN_CACHE_ENABLED=True, MEAL_PLAN_CACHE_STATS_FLUSH_INTERVAL=60)
+class MealPlanCacheCounterTests(SimpleTestCase):
+    """
+    Hit and miss counting of the meal plan cache (core.meal_plan_cache).
+    """
+
+    @mock.patch('core.meal_plan_cache.get_redis')
+    def test_local_hits_are_counted_without_redis(self, get_redis):
+        cache = MealPlanCache(local_size=8)
+        cache.local.set('key', 'plan')
+        for _ in range(50):
+            self.assertEqual(cache.get('key'), 'plan')
+        get_redis.assert_not_called()
+
+        cache.stats()
+        get_redis.return_value.pipeline.return_value.hincrby.assert_called_once_with(
+            'meal_plan_cache:stats', 'local_hits', 50
+        )
+
+
+@override_settings(MEAL_PLAN_COMPRESSION_MIN_SIZE=0)
+class PlanCompressionTests(TestCase):
+    """
+    Storage of rendered meal plans (core.plan_compression and train_plan_dictionary).
+    """
+
+    def setUp(self):
+        reset_dictionary_cache()
+        self.addCleanup(reset_dictionary_cache)
+        self.addCleanup(plan_compression._dictionaries.clear)
+        self.texts = [f'{day} dinner: rice with onion and garlic\n' * 10 for day in DAYS * 2]
+
+    def test_round_trip(self):
+        for name, codec in CODECS.items():
+            with self.subTest(codec=name), override_settings(MEAL_PLAN_COMPRESSION=name):
+                body = compress_plan(self.texts[0])
+                self.assertEqual(plan_compression.HEADER.unpack_from(body), (codec, 0))
+                self.assertEqual(decompress_plan(body), self.texts[0])
+
+    @override_settings(MEAL_PLAN_COMPRESSION='zlib', MEAL_PLAN_COMPRESSION_MIN_SIZE=256)
+    def test_short_plans_are_stored_raw(self):
+        body = compress_plan('Monday: rice')
+        self.assertEqual(plan_compression.HEADER.unpack_from(body), (CODEC_RAW, 0))
+        self.assertEqual(decompress_plan(body), 'Monday: rice')
+        self.assertEqual(decompress_plan(b''), '')
+
+    def test_dictionary_round_trip(self):
+        for name, codec in CODECS.items():
+            if codec == CODEC_RAW:
+                continue
+            with self.subTest(codec=name), override_settings(MEAL_PLAN_COMPRESSION=name):
+                data = train_dictionary(self.texts, codec, 4096)
+                self.assertTrue(data)
+                dictionary = CompressionDictionary.objects.create(codec=codec, data=data)
+                reset_dictionary_cache()
+                body = compress_plan(self.texts[0])
+                self.assertEqual(plan_compression.HEADER.unpack_from(body), (codec, dictionary.id))
+
+                # Read back by another process: the dictionary comes from the database
+                reset_dictionary_cache()
+                plan_compression._dictionaries.clear()
+                self.assertEqual(decompress_plan(body), self.texts[0])
+
+    @override_settings(MEAL_PLAN_COMPRESSION='zlib')
+    def test_recompress_applies_new_dictionary(self):
+        profile = User.objects.create_user('alice').profile
+        for version, text in enumerate(self.texts, 1):
+            MealPlan(profile=profile, version=version, plan_text=text).save()
+
+        call_command('train_plan_dictionary', '--recompress', stdout=io.StringIO())
+
+        dictionary = CompressionDictionary.objects.get()
+        plans = MealPlan.objects.order_by('version')
+        self.assertEqual(
+            {plan_compression.HEADER.unpack_from(plan.plan_body)[1] for plan in plans}, {dictionary.id}
+        )
+        self.assertEqual([plan.plan_text for plan in plans], self.texts)
+
+
+@override_settings(MEAL_PLAN_COMPRESSION='zlib', MEAL_PLAN_COMPRESSION_MIN_SIZE=0)
+class CompressPlanMigrationTests(TransactionTestCase):
+    """
+    Migration api 0007, which moves plan text into compressed bodies, and its reverse.
+    """
+    before = [('api', '0006_compressed_plan_body')]
+    after = [('api', '0007_compress_plan_texts')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        self.addCleanup(reset_dictionary_cache)
+        self.addCleanup(plan_compression._dictionaries.clear)
+        self.addCleanup(self.migrate, MigrationExecutor(connection).loader.graph.leaf_nodes())
+        self.profile = User.objects.create_user('alice').profile
+        self.texts = ['Monday dinner: rice with onion\n' * 20, 'Tuesday lunch: soup']
+
+    def test_forward_and_reverse(self):
+        MealPlan = self.migrate(self.before).get_model('api', 'MealPlan')
+        for version, text in enumerate(self.texts, 1):
+            MealPlan.objects.create(profile_id=self.profile.id, version=version, plan_text=text)
+
+        MealPlan = self.migrate(self.after).get_model('api', 'MealPlan')
+        bodies = MealPlan.objects.order_by('version').values_list('plan_body', flat=True)
+        self.assertEqual([decompress_plan(body) for body in bodies], self.texts)
+
+        # Recompressed with a trained dictionary after the migration ran
+        CompressionDictionary.objects.create(codec=CODEC_ZLIB, data=train_dictionary(self.texts * 2, CODEC_ZLIB, 1024))
+        plan = MealPlan.objects.get(version=1)
+        plan.plan_body = compress_plan(self.texts[0])
+        plan.save()
+
+        MealPlan = self.migrate(self.before).get_model('api', 'MealPlan')
+        self.assertEqual(list(MealPlan.objects.order_by('version').values_list('plan_text', flat=True)), self.texts)
+
+
+@override_settings(MEAL_PLAN_CACHE_ENABLED=True)
+class MealPlanCacheExpiryTests(SimpleTestCase):
+    """
+    The Redis tier of the meal plan cache (core.meal_plan_cache) run against an in-memory Redis.
+    """
+
+    def setUp(self):
+        self.redis = use_fake_redis(self)
+        patcher = mock.patch('core.meal_plan_cache.time.time', return_value=1000)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = MealPlanCache(ttl=100, max_entries=10)
+
+    def test_hit_restarts_ttl(self):
+        self.cache.set('plan', 'Monday: rice')
+        self.cache.local.clear()
+
+        self.clock.return_value = 1080
+        self.assertEqual(self.cache.get('plan'), 'Monday: rice')
+        self.assertEqual(self.redis.ttl('meal_plan_cache:entry:plan'), 100)
+        self.assertEqual(self.redis.zscore('meal_plan_cache:lru', 'meal_plan_cache:entry:plan'), 1080)
+
+        # Past the original TTL: the entry and its place in the index outlive it
+        self.clock.return_value = 1150
+        self.cache.set('other', 'Tuesday: soup')
+        self.cache.local.clear()
+        self.assertEqual(self.redis.zcard('meal_plan_cache:lru'), 2)
+        self.assertEqual(self.cache.get('plan'), 'Monday: rice')
+
+    def test_miss_leaves_index_alone(self):
+        self.assertIsNone(self.cache.get('plan'))
+        self.assertEqual(self.redis.zcard('meal_plan_cache:lru'), 0)
 
-# Create your tests here.
@@ -3,5 +3,12 @@ from . import views
 
 urlpatterns = [
     path('profiles/<int:profile_id>/trigger-meal-plan/', views.trigger_meal_plan_view, name='trigger-meal-plan'),
+    path('profiles/<int:profile_id>/regenerate-meal-plan/', views.regenerate_meal_plan_view, name='regenerate-meal-plan'),
+    path('profiles/<int:profile_id>/meal-plan/', views.meal_plan_detail_view, name='meal-plan-detail'),
+    path('profiles/<int:profile_id>/meal-plans/<int:version>/', views.meal_plan_detail_view, name='meal-plan-version'),
+    path('profiles/<int:profile_id>/meal-plan/stream/<str:task_id>/', views.meal_plan_stream_view, name='meal-plan-stream'),
+    path('tasks/<str:task_id>/', views.task_status_view, name='task-status'),
     path('email-verification-status/', views.check_email_verification_status, name='email-verification-status'),
+    path('ops/meal-plan-cache/', views.meal_plan_cache_stats_view, name='meal-plan-cache-stats'),
+    path('ops/meal-plan-stages/', views.meal_plan_stage_latency_view, name='meal-plan-stage-latency'),
 ] 
\ No newline at end of file
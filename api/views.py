@@ -1,10 +1,28 @@
+import json
+import logging
+import math
+import uuid
+from asgiref.sync import sync_to_async
+from celery import current_app
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, BasePermission
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, BasePermission
 from rest_framework.response import Response
 from rest_framework import status
-from core.tasks import generate_meal_plan
+from .models import MealPlan
+from core.conditional import conditional_get, weak_etag
+from core.tasks import generate_meal_plan, regenerate_meal_plan_part
+from core.meal_plan_schema import MealPlanSchemaError, normalize_targets
+from core.meal_plan_cache import meal_plan_cache
+from core.streaming import MealPlanStreamPublisher, format_sse, get_stream_owner, read_stream_events
+from core.task_locks import meal_plan_fingerprint, meal_plan_inflight_lock
+from core.task_status import task_status
 
 # Create your views here.
 
@@ -19,7 +37,7 @@ class IsEmailVerified(BasePermission):
             request.user and
             request.user.is_authenticated and
             hasattr(request.user, 'profile') and
-            request.user.profile.is_email_verified
+            request.user.profile.email_verified
         )
 
 @api_view(['POST'])
@@ -29,6 +47,10 @@ def trigger_meal_plan_view(request, profile_id):
     Trigger the meal planning and Instacart cart creation process for a specific profile.
     Only authenticated users with verified email addresses can create meal plans.
     
+    Only one generation runs per profile: triggering again while one is in
+    flight returns the running task's id. With ``{"supersede": true}`` a run
+    started with different preferences is cancelled and replaced instead.
+    
     Args:
         request: The HTTP request object
         profile_id: The ID of the profile to generate the meal plan for
@@ -41,22 +63,181 @@ def trigger_meal_plan_view(request, profile_id):
                 'message': 'You can only create meal plans for your own profile.'
             }, status=403)
         
+        supersede = str(request.data.get('supersede', request.query_params.get('supersede', ''))).lower() in ('1', 'true', 'yes')
+        task_id = str(uuid.uuid4())
+        lock = meal_plan_inflight_lock.acquire(
+            profile_id, task_id, meal_plan_fingerprint(request.user.profile), supersede=supersede
+        )
+        if not lock.acquired:
+            return JsonResponse({
+                'status': 'success',
+                'message': f'Meal planning is already in progress for profile ID: {profile_id}',
+                'task_id': lock.task_id,
+                'deduplicated': True
+            })
+        
+        if lock.superseded_task_id:
+            # Drops the old run if it has not started; a started one stops before
+            # calling the LLM, or discards its result if it already has
+            current_app.control.revoke(lock.superseded_task_id)
+            MealPlanStreamPublisher(lock.superseded_task_id, profile_id).fail(
+                "Superseded by a newer meal plan request.", state='superseded'
+            )
+            logging.info("Superseded meal plan task %s for profile ID %s", lock.superseded_task_id, profile_id)
+        
         # Trigger the async task
-        task = generate_meal_plan.delay(profile_id)
+        try:
+            task_status.create(task_id, profile_id)
+            task = generate_meal_plan.apply_async(args=(profile_id,), task_id=task_id)
+        except Exception:
+            meal_plan_inflight_lock.release(profile_id, task_id)
+            raise
         
-        return JsonResponse({
+        response = {
             'status': 'success',
             'message': f'Meal planning process initiated for profile ID: {profile_id}',
             'task_id': task.id
-        })
+        }
+        if lock.superseded_task_id:
+            response['superseded_task_id'] = lock.superseded_task_id
+        return JsonResponse(response)
     except Exception as e:
-        import logging
         logging.error("Error initiating meal planning process for profile ID %s: %s", profile_id, str(e), exc_info=True)
         return JsonResponse({
             'status': 'error',
             'message': 'An internal error occurred while initiating the meal planning process.'
         }, status=500)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsEmailVerified])
+def regenerate_meal_plan_view(request, profile_id):
+    """
+    Regenerate only some days or meals of the profile's latest meal plan.
+    
+    Body: {"days": ["Tuesday"], "meals": [{"day": "Friday", "slot": "dinner"}]}
+    
+    Answers 409 Conflict, with the running task's id, while a generation or
+    another regeneration of the profile is in flight.
+    
+    Args:
+        request: The HTTP request object
+        profile_id: The ID of the profile whose meal plan should be patched
+    """
+    if request.user.profile.id != profile_id:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'You can only regenerate meal plans for your own profile.'
+        }, status=403)
+    
+    try:
+        targets = normalize_targets(request.data.get('days'), request.data.get('meals'))
+    except MealPlanSchemaError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    meal_plan = MealPlan.latest_for(profile_id, fields=('id',))
+    if meal_plan is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'There is no meal plan to regenerate yet.'
+        }, status=404)
+    
+    # Regeneration rewrites the current plan in place, so it must not overlap
+    # a full generation or another regeneration of the profile
+    task_id = str(uuid.uuid4())
+    lock = meal_plan_inflight_lock.acquire(profile_id, task_id, f'regenerate:{meal_plan.id}')
+    if not lock.acquired:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'A meal plan generation is already in progress for profile ID: {profile_id}',
+            'task_id': lock.task_id
+        }, status=409)
+    
+    try:
+        task_status.create(task_id, profile_id, kind='regenerate')
+        task = regenerate_meal_plan_part.apply_async(args=(profile_id, meal_plan.id, targets), task_id=task_id)
+    except Exception as e:
+        meal_plan_inflight_lock.release(profile_id, task_id)
+        logging.error("Error initiating meal plan regeneration for profile ID %s: %s", profile_id, str(e), exc_info=True)
+        return JsonResponse({
+            'status': 'error',
+            'message': 'An internal error occurred while initiating the meal plan regeneration.'
+        }, status=500)
+    
+    return JsonResponse({
+        'status': 'success',
+        'message': f'Regeneration of {len(targets)} meal plan part(s) initiated for profile ID: {profile_id}',
+        'task_id': task.id
+    })
+
+def _meal_plan_validators(request, profile_id, version=None):
+    """
+    Returns (id, version, created_at, profile updated_at) of the requested
+    plan, read once per request. Completing a plan also saves the profile, so
+    the profile's updated_at covers changes to the plan and its status.
+    """
+    if not hasattr(request, '_meal_plan_validators'):
+        plans = MealPlan.objects.filter(profile_id=profile_id)
+        if version is not None:
+            plans = plans.filter(version=version)
+        request._meal_plan_validators = plans.order_by('-version').values_list(
+            'id', 'version', 'created_at', 'profile__updated_at'
+        ).first()
+    return request._meal_plan_validators
+
+def _meal_plan_etag(request, profile_id, version=None):
+    if request.user.profile.id != profile_id:
+        return None
+    validators = _meal_plan_validators(request, profile_id, version)
+    if validators is None:
+        return None
+    plan_id, plan_version, created_at, updated_at = validators
+    return weak_etag('meal-plan', plan_id, plan_version, created_at.isoformat(), updated_at.isoformat())
+
+def _meal_plan_last_modified(request, profile_id, version=None):
+    if request.user.profile.id != profile_id:
+        return None
+    validators = _meal_plan_validators(request, profile_id, version)
+    return max(validators[2], validators[3]) if validators else None
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get(_meal_plan_etag, _meal_plan_last_modified)
+def meal_plan_detail_view(request, profile_id, version=None):
+    """
+    Return a profile's full meal plan: the rendered text, the structured days
+    and the cart. Profile responses only carry a summary of the current plan.
+    Responses carry an ETag and Last-Modified; unchanged plans get a 304.
+    
+    Args:
+        request: The HTTP request object
+        profile_id: The ID of the profile the plan belongs to
+        version: The plan version to return; the current plan when omitted
+    """
+    if request.user.profile.id != profile_id:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'You can only view meal plans for your own profile.'
+        }, status=403)
+    
+    if version is None:
+        meal_plan = MealPlan.latest_for(profile_id)
+    else:
+        meal_plan = MealPlan.objects.filter(profile_id=profile_id, version=version).first()
+    if meal_plan is None:
+        return JsonResponse({'status': 'error', 'message': 'Meal plan not found.'}, status=404)
+    
+    return Response({
+        'status': 'success',
+        'meal_plan': {
+            **meal_plan.summary(status=request.user.profile.status),
+            'estimated_cost': meal_plan.estimated_cost,
+            'prompt_version': meal_plan.prompt_version,
+            'plan': meal_plan.plan_text,
+            'days': meal_plan.to_document()['days'],
+            'changes': meal_plan.changes,
+        }
+    })
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_email_verification_status(request):
@@ -64,7 +245,159 @@ def check_email_verification_status(request):
     Check if the current user's email is verified.
     """
     return Response({
-        'email_verified': request.user.profile.is_email_verified,
+        'email_verified': request.user.profile.email_verified,
         'email': request.user.email,
         'username': request.user.username
     })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def meal_plan_cache_stats_view(request):
+    """
+    Return hit/miss counters for the meal plan cache (staff only).
+    """
+    return Response(meal_plan_cache.stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def meal_plan_stage_latency_view(request):
+    """
+    Return p50/p90/p99 latencies of each meal plan pipeline stage (staff only).
+    """
+    return Response({
+        kind: task_status.latency_percentiles(kind) for kind in ('generate', 'regenerate')
+    })
+
+async def _authenticate(request):
+    """
+    Run the configured DRF authenticators for a plain (async) Django view.
+    Returns the authenticated user's profile id, or None.
+    """
+    def authenticate():
+        drf_request = Request(
+            request,
+            authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        )
+        try:
+            user = drf_request.user
+        except AuthenticationFailed:
+            return None
+        if not user or not user.is_authenticated or not hasattr(user, 'profile'):
+            return None
+        return user.profile.id
+
+    return await sync_to_async(authenticate)()
+
+async def _meal_plan_events(task_id, profile_id, last_event_id):
+    yield 'retry: 3000\n\n'
+    try:
+        async for item in read_stream_events(task_id, last_event_id):
+            if item is None:
+                yield ': keep-alive\n\n'
+                continue
+            event_id, event, data = item
+            if event == 'start' and json.loads(data).get('profile_id') != profile_id:
+                yield format_sse(event_id, 'error', json.dumps({'message': 'Task not found.'}))
+                return
+            yield format_sse(event_id, event, data)
+    except Exception as e:
+        logging.error("Error relaying meal plan stream for task %s: %s", task_id, str(e), exc_info=True)
+        yield format_sse('0-0', 'error', json.dumps({'message': 'The meal plan stream is unavailable.'}))
+
+@require_GET
+async def meal_plan_stream_view(request, profile_id, task_id):
+    """
+    Relay a meal plan generation to the client as Server-Sent Events.
+    
+    Chunks are read from the task's Redis stream as the LLM produces them.
+    Serve this through core.asgi.application so that a viewer does not hold a
+    WSGI worker thread. Clients may resume with the Last-Event-ID header.
+    
+    Args:
+        request: The HTTP request object
+        profile_id: The ID of the profile the meal plan is generated for
+        task_id: The Celery task ID returned by trigger-meal-plan
+    """
+    user_profile_id = await _authenticate(request)
+    if user_profile_id is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Authentication credentials were not provided.'
+        }, status=401)
+    
+    if user_profile_id != profile_id:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'You can only stream meal plans for your own profile.'
+        }, status=403)
+    
+    owner = await get_stream_owner(task_id)
+    if owner is not None and owner != profile_id:
+        return JsonResponse({'status': 'error', 'message': 'Task not found.'}, status=404)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or '0-0'
+    response = StreamingHttpResponse(
+        _meal_plan_events(task_id, profile_id, last_event_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _known_task_version(request, task_id):
+    # The client's last seen version, from If-None-Match (W/"<task_id>-<version>") or ?version=
+    etag = request.headers.get('If-None-Match', '')
+    prefix = f'W/"{task_id}-'
+    value = etag[len(prefix):-1] if etag.startswith(prefix) and etag.endswith('"') else request.GET.get('version')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+@require_GET
+async def task_status_view(request, task_id):
+    """
+    Report the state and progress of a meal plan task from its Redis record,
+    without touching the database beyond authentication.
+    
+    Send the ETag from a previous response as If-None-Match (or ?version=)
+    together with ?wait=<seconds> to long-poll: the response is held until the
+    task changes, or 304 Not Modified is returned once the wait is over.
+    
+    Args:
+        request: The HTTP request object
+        task_id: The task ID returned by trigger-meal-plan or regenerate-meal-plan
+    """
+    user_profile_id = await _authenticate(request)
+    if user_profile_id is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Authentication credentials were not provided.'
+        }, status=401)
+    
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait):
+        return JsonResponse({'status': 'error', 'message': "'wait' must be a number of seconds."}, status=400)
+    wait = min(max(wait, 0), settings.TASK_STATUS_MAX_WAIT)
+    
+    known_version = _known_task_version(request, task_id)
+    try:
+        record = await task_status.wait_for_change(task_id, known_version, wait if known_version is not None else 0)
+    except Exception as e:
+        logging.error("Error reading status of task %s: %s", task_id, str(e), exc_info=True)
+        return JsonResponse({'status': 'error', 'message': 'Task status is unavailable.'}, status=503)
+    
+    if record is None or record.get('profile_id') != user_profile_id:
+        return JsonResponse({'status': 'error', 'message': 'Task not found.'}, status=404)
+    
+    etag = f'W/"{task_id}-{record["version"]}"'
+    if record['version'] == known_version:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse({'status': 'success', 'task': record})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -51,15 +51,14 @@ def check_all_profiles():
         if profile.weekly_budget:
             print(f"  - Budget: ${profile.weekly_budget}")
         
-        if profile.meal_plan:
-            print(f"  - ✅ Meal Plan: GENERATED")
-            print(f"    - Keys: {list(profile.meal_plan.keys())}")
-            if 'plan' in profile.meal_plan:
-                plan_text = profile.meal_plan['plan']
-                print(f"    - Plan length: {len(plan_text)} characters")
-                print(f"    - Plan preview: {plan_text[:200]}...")
-            if 'cart_url' in profile.meal_plan:
-                print(f"    - Cart URL: {profile.meal_plan['cart_url']}")
+        meal_plan = profile.meal_plans.order_by('-version').first()
+        if meal_plan:
+            print(f"  - ✅ Meal Plan: GENERATED (version {meal_plan.version})")
+            if meal_plan.plan_text:
+                print(f"    - Plan length: {len(meal_plan.plan_text)} characters")
+                print(f"    - Plan preview: {meal_plan.plan_text[:200]}...")
+            if meal_plan.cart_url:
+                print(f"    - Cart URL: {meal_plan.cart_url}")
         else:
             print(f"  - ❌ Meal Plan: NOT GENERATED")
             if not profile.is_email_verified:
@@ -87,21 +86,20 @@ def check_completed_profiles():
         print(f"  - Profile ID: {profile.id}")
         print(f"  - Generated: {profile.updated_at}")
         
-        if profile.meal_plan and 'plan' in profile.meal_plan:
-            plan_text = profile.meal_plan['plan']
-            print(f"  - Plan length: {len(plan_text)} characters")
-            
-            # Show a better preview of the meal plan
-            lines = plan_text.split('\n')
+        meal_plan = profile.meal_plans.order_by('-version').first()
+        if meal_plan:
+            # Structured plans are previewed straight from the Meal/Ingredient tables
+            meals = list(meal_plan.meals.all()[:10])
+            total_meals = meal_plan.meals.count()
+            print(f"  - Meals: {total_meals}, ingredients: {len(meal_plan.shopping_list())}")
+            print(f"  - Estimated cost: ${meal_plan.estimated_cost}")
             print("  - Plan preview:")
-            for line in lines[:10]:  # Show first 10 lines
-                if line.strip():
-                    print(f"    {line}")
-            if len(lines) > 10:
-                print(f"    ... ({len(lines) - 10} more lines)")
-        
-        if profile.meal_plan and 'cart_url' in profile.meal_plan:
-            print(f"  - Cart URL: {profile.meal_plan['cart_url']}")
+            for meal in meals:
+                print(f"    {meal.get_day_display()} {meal.slot}: {meal.name}")
+            if total_meals > len(meals):
+                print(f"    ... ({total_meals - len(meals)} more meals)")
+            if meal_plan.cart_url:
+                print(f"  - Cart URL: {meal_plan.cart_url}")
         
         print("-" * 40)
 
@@ -243,18 +241,18 @@ def create_test_meal_plan():
                     # Refresh profile from database
                     profile.refresh_from_db()
                     
-                    if profile.status == 'COMPLETED' and profile.meal_plan:
+                    meal_plan = profile.meal_plans.order_by('-version').first()
+                    if profile.status == 'COMPLETED' and meal_plan:
                         print("✅ Meal plan generated and stored!")
                         print(f"  - Status: {profile.status}")
-                        print(f"  - Meal plan keys: {list(profile.meal_plan.keys())}")
+                        print(f"  - Meal plan version: {meal_plan.version}")
                         
-                        if 'plan' in profile.meal_plan:
-                            plan_text = profile.meal_plan['plan']
-                            print(f"  - Plan length: {len(plan_text)} characters")
-                            print(f"  - Plan preview: {plan_text[:300]}...")
+                        if meal_plan.plan_text:
+                            print(f"  - Plan length: {len(meal_plan.plan_text)} characters")
+                            print(f"  - Plan preview: {meal_plan.plan_text[:300]}...")
                         
-                        if 'cart_url' in profile.meal_plan:
-                            print(f"  - Cart URL: {profile.meal_plan['cart_url']}")
+                        if meal_plan.cart_url:
+                            print(f"  - Cart URL: {meal_plan.cart_url}")
                         
                         # Clean up test user
                         test_user.delete()
@@ -54,7 +54,7 @@ def reset_pending_plans():
     for profile in pending_profiles:
         print(f"  - Resetting profile for user: {profile.user.username}")
         # Clear any old meal plan data
-        profile.meal_plan = None
+        profile.meal_plans.all().delete()
         profile.status = 'PENDING'
         profile.save()
     
@@ -80,9 +80,9 @@ def show_current_status():
     if completed:
         print(f"\n✅ Completed Meal Plans:")
         for profile in completed:
-            if profile.meal_plan and isinstance(profile.meal_plan, dict):
-                plan_text = profile.meal_plan.get('plan', '')
-                print(f"  - {profile.user.username}: {len(plan_text)} chars")
+            meal_plan = profile.meal_plans.order_by('-version').first()
+            if meal_plan:
+                print(f"  - {profile.user.username}: {len(meal_plan.plan_text)} chars")
             else:
                 print(f"  - {profile.user.username}: No meal plan data")
 
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from users.models import Profile
+from api.models import MealPlan
+from .instacart_client import AsyncInstacartClient
+from .llm import MEAL_PLAN_PROMPT_VERSION, meal_planning_chain_pool
+from .meal_plan_cache import make_cache_key, meal_plan_cache
+from .meal_plan_schema import parse_meal_plan, render_meal_plan
+from .rate_limiter import openai_rate_limiter
+from .resilience import instacart_breaker, openai_breaker
+from .streaming import MealPlanStreamPublisher, RedisStreamCallbackHandler
+from .task_locks import meal_plan_inflight_lock
+
+logger = logging.getLogger('core.tasks')
+
+MOCK_CART_URL = "https://instacart.com/cart/mock-cart-url"
+
+
+class PipelineEventLoop:
+    """
+    A per-process asyncio event loop running in a background thread.
+
+    Celery tasks submit coroutines to it and wait for the result, so every
+    task thread of a worker process (e.g. ``--pool threads``) shares one loop,
+    one OpenAI client and one Instacart connection pool. The number of
+    generations in flight on the loop is capped by MEAL_PLAN_ASYNC_CONCURRENCY.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._pid = None
+        self._semaphore = None
+        self._instacart_client = None
+        self._instacart_api_key = None
+        self._lock = threading.Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # A forked worker process must not reuse its parent's loop thread
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='meal-plan-pipeline', daemon=True).start()
+                self._loop = loop
+                self._pid = os.getpid()
+                self._semaphore = None
+                self._instacart_client = None
+            return self._loop
+
+    def run(self, coro):
+        """
+        Runs a coroutine on the pipeline loop and blocks until it finishes.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # Only called from coroutines running on the pipeline loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.MEAL_PLAN_ASYNC_CONCURRENCY)
+        return self._semaphore
+
+    def instacart_client(self, api_key: str) -> AsyncInstacartClient:
+        if self._instacart_client is None or self._instacart_api_key != api_key:
+            self._instacart_client = AsyncInstacartClient(api_key=api_key)
+            self._instacart_api_key = api_key
+        return self._instacart_client
+
+
+pipeline_loop = PipelineEventLoop()
+
+
+async def acreate_instacart_cart(profile: Profile, ingredients: List[Dict]) -> str:
+    """
+    Creates an Instacart shopping cart without blocking the event loop.
+
+    Args:
+        profile: User profile the cart is created for
+        ingredients: Aggregated ingredients for the plan
+
+    Returns:
+        str: URL to the created Instacart cart, or a mock URL if it could not be created
+    """
+    from .tasks import resolve_cart_products
+
+    api_key = os.getenv('INSTACART_API_KEY')
+    if not api_key:
+        logger.error("No INSTACART_API_KEY found in environment variables")
+        return MOCK_CART_URL
+
+    try:
+        products = await sync_to_async(resolve_cart_products)(ingredients, profile)
+        cart_response = await instacart_breaker.acall(
+            pipeline_loop.instacart_client(api_key).create_meal_plan_cart,
+            meal_plan_title=f"Weekly Meal Plan for {profile.user.username}",
+            ingredients=ingredients,
+            products=products
+        )
+    except Exception as e:
+        logger.error(f"Error creating Instacart cart: {str(e)}")
+        return MOCK_CART_URL
+
+    cart_url = cart_response.get("products_link_url", "")
+    if not cart_url:
+        logger.warning("No products_link_url in Instacart response")
+        return MOCK_CART_URL
+    return cart_url
+
+
+async def astore_meal_plan(profile: Profile, document: Dict, prompt_version: str,
+                           publisher: Optional[MealPlanStreamPublisher] = None) -> MealPlan:
+    """
+    Async counterpart of core.tasks.store_meal_plan.
+    """
+    from .tasks import _complete_profile_meal_plan
+
+    meal_plan = await sync_to_async(MealPlan.create_from_document)(profile, document, prompt_version)
+    shopping_list = await sync_to_async(meal_plan.shopping_list)()
+    meal_plan_text = render_meal_plan(document, shopping_list)
+
+    if publisher:
+        await asyncio.to_thread(publisher.stage, 'cart', 'Creating the Instacart cart.')
+    meal_plan.cart_url = await acreate_instacart_cart(profile, shopping_list)
+
+    await sync_to_async(_complete_profile_meal_plan)(profile, meal_plan, meal_plan_text)
+    if publisher:
+        await asyncio.to_thread(
+            publisher.finish, status=profile.status, cart_url=meal_plan.cart_url, meal_plan_id=meal_plan.id
+        )
+    return meal_plan
+
+
+async def agenerate_meal_plan(profile_id: int, task_id: Optional[str] = None) -> str:
+    """
+    Generates, stores and carts a meal plan for a profile on the pipeline loop.
+
+    Network waits (OpenAI, Instacart) are awaited; database and Redis calls run
+    in threads. At most MEAL_PLAN_ASYNC_CONCURRENCY generations run at once.
+
+    Returns:
+        str: A summary of the outcome, like the result of core.tasks.generate_meal_plan
+    """
+    from .tasks import discard_superseded_meal_plan, mark_profile_processing
+
+    try:
+        profile = await Profile.objects.select_related('user').aget(id=profile_id)
+    except Profile.DoesNotExist:
+        logger.error(f"Profile {profile_id} not found")
+        return f"Profile {profile_id} not found"
+    await sync_to_async(mark_profile_processing)(profile)
+
+    publisher = MealPlanStreamPublisher(task_id, profile_id)
+    try:
+        async with pipeline_loop.semaphore():
+            await asyncio.to_thread(publisher.start)
+            cache_key = make_cache_key(
+                profile.preferences,
+                profile.dietary_restrictions,
+                profile.weekly_budget,
+                MEAL_PLAN_PROMPT_VERSION
+            )
+            response_text = await asyncio.to_thread(meal_plan_cache.get, cache_key)
+
+            if response_text is not None:
+                logger.info(f"Meal plan cache hit for profile {profile_id}")
+                await asyncio.to_thread(publisher.publish_chunk, response_text)
+                await asyncio.to_thread(publisher.stage, 'parsing', 'Reading the meal plan.', sample=False)
+                document = parse_meal_plan(response_text)
+            else:
+                meal_planning_chain = meal_planning_chain_pool.get()
+                logger.info(f"Invoking meal planning chain asynchronously for profile {profile_id}")
+                try:
+                    result = await openai_breaker.acall(openai_rate_limiter.ainvoke, meal_planning_chain, {
+                        "preferences": str(profile.preferences),
+                        "dietary_restrictions": str(profile.dietary_restrictions),
+                        "budget": str(profile.weekly_budget)
+                    }, config={"callbacks": [RedisStreamCallbackHandler(publisher)]})
+                except Exception as e:
+                    meal_planning_chain_pool.mark_failed(e)
+                    raise
+
+                response_text = result['text']
+                await asyncio.to_thread(publisher.stage, 'parsing', 'Reading the meal plan.')
+                document = parse_meal_plan(response_text)
+                await asyncio.to_thread(meal_plan_cache.set, cache_key, response_text)
+
+            if await asyncio.to_thread(meal_plan_inflight_lock.is_superseded, profile_id, task_id):
+                return await asyncio.to_thread(discard_superseded_meal_plan, profile_id, publisher)
+            await astore_meal_plan(profile, document, MEAL_PLAN_PROMPT_VERSION, publisher)
+        return f"Successfully generated meal plan for profile ID: {profile_id} (User: {profile.user.username})"
+
+    except Exception as e:
+        logger.error(f"Error during async meal plan generation: {str(e)}", exc_info=True)
+        profile.status = 'FAILED'
+        await profile.asave(update_fields=['status', 'updated_at'])
+        await asyncio.to_thread(publisher.fail, "Meal plan generation failed.")
+        return f"Error while generating meal plan for profile {profile_id}: {str(e)}"
+
+    finally:
+        # Database work runs in asgiref's executor thread, outside Celery's connection handling
+        await sync_to_async(close_old_connections)()
+
+
+async def agenerate_meal_plans(profile_ids: List[int]) -> List[str]:
+    """
+    Generates meal plans for several profiles concurrently.
+    """
+    return await asyncio.gather(*(agenerate_meal_plan(profile_id) for profile_id in profile_ids))
@@ -1,5 +1,9 @@
+import logging
 import os
 from celery import Celery
+from celery.concurrency import get_implementation
+from celery.concurrency.thread import TaskPool as ThreadTaskPool
+from celery.signals import worker_init, worker_process_init
 from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
@@ -14,6 +18,37 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
+logger = logging.getLogger('core.tasks')
+
+@worker_init.connect
+def check_generation_pool(sender, **kwargs):
+    """
+    Warns when the worker's pool cannot make use of MEAL_PLAN_GENERATION_MODE=async.
+    Each prefork child runs one task at a time, so its event loop never has more
+    than one generation in flight; the mode needs the threads pool.
+    """
+    if settings.MEAL_PLAN_GENERATION_MODE != 'async':
+        return
+    if not issubclass(get_implementation(sender.pool_cls), ThreadTaskPool):
+        logger.warning(
+            "MEAL_PLAN_GENERATION_MODE=async runs one generation per process under this pool; "
+            "start the worker with --pool threads to run several on each event loop"
+        )
+
+@worker_process_init.connect
+def init_meal_planning_chain(**kwargs):
+    """
+    Builds the meal planning chain once per worker process.
+    The warm-up request runs in the background so process start-up stays fast.
+    """
+    import threading
+    from core.llm import meal_plan_day_chain_pool, meal_planning_chain_pool
+
+    pool = meal_plan_day_chain_pool if settings.MEAL_PLAN_GENERATION_MODE == 'per_day' else meal_planning_chain_pool
+    pool.get()
+    if settings.MEAL_PLAN_LLM_WARMUP:
+        threading.Thread(target=pool.warm_up, daemon=True).start()
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}') 
\ No newline at end of file
@@ -0,0 +1,43 @@
+import hashlib
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+def weak_etag(*parts: Any) -> str:
+    """
+    Builds a weak ETag from the values a representation depends on.
+    """
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8'), usedforsecurity=False)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def fieldset_key(request) -> str:
+    """
+    The ?fields= / ?omit= selection of a request, which changes the representation.
+    """
+    return f"{request.GET.get('fields', '')};{request.GET.get('omit', '')}"
+
+
+def conditional_get(etag_func: Callable, last_modified_func: Optional[Callable] = None) -> Callable:
+    """
+    Django's ``condition`` for authenticated DRF handlers.
+
+    Apply it below ``@api_view`` (or with ``method_decorator`` on ``get``) so
+    the validators are computed after authentication. A request whose
+    If-None-Match or If-Modified-Since still matches gets a 304 before the
+    handler runs, so nothing is serialized. Responses are marked private and
+    must be revalidated on every use.
+    """
+    def decorator(func):
+        conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(func)
+
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,368 @@
+import re
+from functools import lru_cache
+from decimal import Decimal
+from fractions import Fraction
+from typing import Dict, Iterable, List, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; aggregation falls back to pure Python
+    np = None
+
+# Canonical ingredient name -> other spellings. Plurals are derived automatically.
+INGREDIENT_DICTIONARY = {
+    'all-purpose flour': ['flour', 'plain flour', 'all purpose flour'],
+    'almond': ['almonds'],
+    'apple': [],
+    'avocado': [],
+    'bacon': [],
+    'baking powder': [],
+    'baking soda': [],
+    'banana': [],
+    'basil': ['fresh basil'],
+    'bell pepper': ['red bell pepper', 'green bell pepper', 'yellow bell pepper', 'capsicum'],
+    'black beans': ['black bean'],
+    'black pepper': ['ground black pepper'],
+    'blueberry': ['blueberries'],
+    'bread': ['whole wheat bread', 'whole grain bread', 'sandwich bread'],
+    'broccoli': ['broccoli florets'],
+    'brown rice': [],
+    'brown sugar': ['light brown sugar', 'dark brown sugar'],
+    'butter': ['unsalted butter', 'salted butter'],
+    'carrot': [],
+    'cauliflower': [],
+    'celery': ['celery stalk'],
+    'cheddar cheese': ['cheddar', 'shredded cheddar'],
+    'cheese': [],
+    'chicken breast': ['boneless chicken breast', 'skinless chicken breast', 'chicken breasts'],
+    'chicken broth': ['chicken stock'],
+    'chicken thigh': ['chicken thighs'],
+    'chickpeas': ['chickpea', 'garbanzo beans'],
+    'cilantro': ['coriander leaves'],
+    'cinnamon': ['ground cinnamon'],
+    'coconut milk': [],
+    'cucumber': [],
+    'cumin': ['ground cumin'],
+    'egg': ['large egg'],
+    'feta cheese': ['feta'],
+    'garlic': ['garlic clove', 'minced garlic'],
+    'ginger': ['fresh ginger', 'ground ginger'],
+    'granola': [],
+    'greek yogurt': ['plain greek yogurt'],
+    'ground beef': ['lean ground beef', 'minced beef'],
+    'ground turkey': [],
+    'heavy cream': ['whipping cream'],
+    'honey': [],
+    'kale': [],
+    'lemon': [],
+    'lemon juice': [],
+    'lentils': ['lentil', 'red lentils', 'green lentils'],
+    'lettuce': ['romaine lettuce', 'romaine'],
+    'lime': [],
+    'lime juice': [],
+    'maple syrup': [],
+    'milk': ['whole milk', 'skim milk'],
+    'mozzarella': ['mozzarella cheese'],
+    'mushroom': ['cremini mushroom', 'button mushroom'],
+    'oats': ['rolled oats', 'oatmeal', 'old-fashioned oats'],
+    'olive oil': ['extra virgin olive oil', 'extra-virgin olive oil'],
+    'onion': ['yellow onion', 'red onion', 'white onion'],
+    'orange': [],
+    'paprika': ['smoked paprika'],
+    'parmesan': ['parmesan cheese', 'grated parmesan'],
+    'parsley': ['fresh parsley'],
+    'pasta': ['spaghetti', 'penne', 'whole wheat pasta'],
+    'peanut butter': [],
+    'pepper': [],
+    'pork chop': [],
+    'potato': ['russet potato', 'yukon gold potato'],
+    'quinoa': [],
+    'rice': ['white rice', 'jasmine rice', 'basmati rice'],
+    'salmon': ['salmon fillet'],
+    'salt': ['kosher salt', 'sea salt'],
+    'scallion': ['green onion', 'spring onion'],
+    'shrimp': ['prawns', 'prawn'],
+    'soy sauce': [],
+    'spinach': ['baby spinach', 'fresh spinach'],
+    'strawberry': ['strawberries'],
+    'sugar': ['granulated sugar'],
+    'sweet potato': ['sweet potatoes', 'yam'],
+    'tamari': [],
+    'tofu': ['firm tofu', 'extra-firm tofu'],
+    'tomato': ['cherry tomato', 'roma tomato', 'tomatoes'],
+    'tomato sauce': ['marinara sauce', 'marinara'],
+    'tortilla': ['flour tortilla', 'corn tortilla'],
+    'tuna': ['canned tuna'],
+    'vegetable broth': ['vegetable stock'],
+    'vegetable oil': ['canola oil'],
+    'walnut': [],
+    'zucchini': ['courgette'],
+}
+
+# Canonical unit -> other spellings, matched case-insensitively
+UNIT_ALIASES = {
+    'g': ['gram', 'grams', 'gr'],
+    'kg': ['kilogram', 'kilograms', 'kilo', 'kilos'],
+    'oz': ['ounce', 'ounces'],
+    'lb': ['lbs', 'pound', 'pounds'],
+    'ml': ['milliliter', 'milliliters', 'millilitre', 'millilitres'],
+    'l': ['liter', 'liters', 'litre', 'litres'],
+    'tsp': ['teaspoon', 'teaspoons', 'tsps'],
+    'tbsp': ['tablespoon', 'tablespoons', 'tbs', 'tbsps'],
+    'cup': ['cups'],
+    'pint': ['pints', 'pt'],
+    'quart': ['quarts', 'qt'],
+    'gallon': ['gallons', 'gal'],
+    'each': ['ea', 'piece', 'pieces', 'pc', 'pcs', 'whole', 'large', 'medium', 'small', 'item', 'items'],
+    'dozen': ['dozens'],
+    'clove': ['cloves'],
+    'can': ['cans', 'tin', 'tins'],
+    'bunch': ['bunches'],
+    'bag': ['bags'],
+    'box': ['boxes'],
+    'bottle': ['bottles'],
+    'jar': ['jars'],
+    'package': ['packages', 'pkg', 'pack', 'packs'],
+    'slice': ['slices'],
+    'head': ['heads'],
+    'block': ['blocks'],
+    'stalk': ['stalks'],
+    'pinch': ['pinches'],
+}
+
+# Convertible units: unit -> (dimension, size in the dimension's base unit: g, ml or each)
+UNIT_CONVERSIONS = {
+    'g': ('mass', 1.0),
+    'kg': ('mass', 1000.0),
+    'oz': ('mass', 28.349523),
+    'lb': ('mass', 453.59237),
+    'ml': ('volume', 1.0),
+    'l': ('volume', 1000.0),
+    'tsp': ('volume', 4.928922),
+    'tbsp': ('volume', 14.786765),
+    'cup': ('volume', 236.588237),
+    'pint': ('volume', 473.176473),
+    'quart': ('volume', 946.352946),
+    'gallon': ('volume', 3785.411784),
+    'each': ('count', 1.0),
+    'dozen': ('count', 12.0),
+}
+
+# Below this many items the pure Python loop beats building numpy arrays
+VECTORIZE_THRESHOLD = 64
+
+UNICODE_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅛': '1/8'}
+
+
+def _plurals(name: str) -> List[str]:
+    if name.endswith('y') and not name.endswith(('ay', 'ey', 'oy')):
+        return [name[:-1] + 'ies']
+    if name.endswith('o'):
+        # 'avocados' and 'potatoes' are both common
+        return [name + 's', name + 'es']
+    if name.endswith(('s', 'x', 'ch', 'sh')):
+        return [name + 'es']
+    return [name + 's']
+
+
+def _build_alias_index() -> Dict[str, str]:
+    index = {}
+    for canonical, aliases in INGREDIENT_DICTIONARY.items():
+        for alias in [canonical, *aliases]:
+            for spelling in [alias, *_plurals(alias)]:
+                index.setdefault(spelling, canonical)
+    return index
+
+
+INGREDIENT_ALIASES = _build_alias_index()
+UNIT_INDEX = {alias: unit for unit, aliases in UNIT_ALIASES.items() for alias in [unit, *aliases]}
+
+
+def _alternation(words: Iterable[str]) -> str:
+    # Longest first, so 'chicken breast' wins over 'chicken' and 'tbsp' over 'tbs'
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+# One compiled pattern matches every dictionary entry in a single pass over the text
+INGREDIENT_PATTERN = re.compile(
+    r"(?:(?<![\w.])(?P<quantity>\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?|[½⅓⅔¼¾⅛])\s*"
+    r"(?:(?P<unit>" + _alternation(UNIT_INDEX) + r")\.?\s+)?(?:of\s+)?)?"
+    r"\b(?P<name>" + _alternation(INGREDIENT_ALIASES) + r")\b",
+    re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=4096)
+def canonical_ingredient_name(name: str) -> str:
+    """
+    Normalizes an ingredient name and maps known spellings to their dictionary entry.
+    """
+    normalized = ' '.join(str(name).split()).lower()
+    return INGREDIENT_ALIASES.get(normalized, normalized)
+
+
+@lru_cache(maxsize=1024)
+def normalize_unit(unit) -> str:
+    """
+    Maps a unit spelling to its canonical form ('Tablespoons' -> 'tbsp').
+    Unknown units are lower-cased and kept.
+    """
+    normalized = str(unit or '').strip().lower().rstrip('.')
+    if not normalized:
+        return 'each'
+    return UNIT_INDEX.get(normalized, normalized)
+
+
+def parse_quantity(value) -> float:
+    """
+    Parses '2', '1.5', '1/2', '1 1/2' or '½' into a float. Missing values count as 1.
+    """
+    if value in (None, ''):
+        return 1.0
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    text = str(value).strip()
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        text = text.replace(symbol, fraction)
+    try:
+        return float(sum(Fraction(part) for part in text.split()))
+    except (ValueError, ZeroDivisionError):
+        return 1.0
+
+
+@lru_cache(maxsize=1024)
+def unit_dimension(unit) -> Tuple[str, float]:
+    """
+    Returns the dimension of a unit and its size in the dimension's base unit.
+    Non-convertible units such as 'clove' are their own dimension.
+    """
+    unit = normalize_unit(unit)
+    return UNIT_CONVERSIONS.get(unit, (unit, 1.0))
+
+
+def to_base_quantity(quantity, unit: str) -> Tuple[str, float]:
+    """
+    Converts a quantity to the base unit of its dimension.
+
+    Returns:
+        Tuple[str, float]: The dimension and the amount in its base unit
+    """
+    dimension, factor = unit_dimension(unit)
+    return dimension, parse_quantity(quantity) * factor
+
+
+def from_base_quantity(dimension: str, amount: float) -> Tuple[float, str]:
+    """
+    Expresses a base-unit amount in the unit a shopper would expect.
+
+    Returns:
+        Tuple[float, str]: The rounded quantity and its unit
+    """
+    if dimension == 'mass':
+        unit = 'lb' if abs(amount) >= UNIT_CONVERSIONS['lb'][1] else 'oz'
+    elif dimension == 'volume':
+        if abs(amount) >= UNIT_CONVERSIONS['cup'][1] / 4:
+            unit = 'cup'
+        elif abs(amount) >= UNIT_CONVERSIONS['tbsp'][1]:
+            unit = 'tbsp'
+        else:
+            unit = 'tsp'
+    elif dimension == 'count':
+        unit = 'each'
+    else:
+        return round(amount, 3), dimension
+    return round(amount / UNIT_CONVERSIONS[unit][1], 3), unit
+
+
+def _sum_by_group(groups: List[int], quantities: List[float], factors: List[float], size: int) -> List[float]:
+    if np is not None and len(groups) >= VECTORIZE_THRESHOLD:
+        amounts = np.asarray(quantities, dtype=np.float64) * np.asarray(factors, dtype=np.float64)
+        return np.bincount(np.asarray(groups, dtype=np.intp), weights=amounts, minlength=size).tolist()
+    totals = [0.0] * size
+    for group, quantity, factor in zip(groups, quantities, factors):
+        totals[group] += quantity * factor
+    return totals
+
+
+def aggregate_ingredients(items: Iterable[Dict]) -> List[Dict]:
+    """
+    Deduplicates ingredients by canonical name and sums their quantities,
+    converting between units of the same dimension (e.g. tbsp and cup).
+
+    Args:
+        items: Ingredients with a name and optional quantity and unit
+
+    Returns:
+        List[Dict]: Ingredients with name, quantity (float) and unit, in the
+        format expected by InstacartClient.create_meal_plan_cart
+    """
+    keys = {}
+    groups = []
+    quantities = []
+    factors = []
+    for item in items:
+        name = canonical_ingredient_name(str(item.get('name', '')))
+        if not name:
+            continue
+        dimension, factor = unit_dimension(item.get('unit'))
+        groups.append(keys.setdefault((name, dimension), len(keys)))
+        quantities.append(parse_quantity(item.get('quantity')))
+        factors.append(factor)
+
+    totals = _sum_by_group(groups, quantities, factors, len(keys))
+    shopping_list = []
+    for (name, dimension), group in keys.items():
+        quantity, unit = from_base_quantity(dimension, totals[group])
+        shopping_list.append({'name': name.title(), 'quantity': quantity, 'unit': unit})
+    return sorted(shopping_list, key=lambda item: (item['name'], item['unit']))
+
+
+def extract_ingredients_from_text(text: str) -> List[Dict]:
+    """
+    Finds dictionary ingredients in free-form meal plan text.
+
+    If the text has a 'Shopping List:' section only that section is read, so
+    ingredients listed per meal are not counted twice. Mentions without a
+    quantity count once, and only if the ingredient has no quantified mention.
+    """
+    marker = re.search(r'^\s*shopping list:?\s*$', text, re.IGNORECASE | re.MULTILINE)
+    if marker:
+        text = text[marker.end():]
+
+    items = []
+    mentioned = {}
+    for match in INGREDIENT_PATTERN.finditer(text):
+        name = INGREDIENT_ALIASES[match.group('name').lower()]
+        if match.group('quantity') is None:
+            mentioned.setdefault(name, {'name': name, 'quantity': 1, 'unit': 'each'})
+            continue
+        items.append({
+            'name': name,
+            'quantity': parse_quantity(match.group('quantity')),
+            'unit': normalize_unit(match.group('unit')),
+        })
+    quantified = {item['name'] for item in items}
+    items.extend(item for name, item in mentioned.items() if name not in quantified)
+    return items
+
+
+def extract_ingredients(source: Union[str, Dict]) -> List[Dict]:
+    """
+    Extracts raw ingredients from a structured meal plan (see
+    core.meal_plan_schema) or from plain meal plan text.
+    """
+    if isinstance(source, dict):
+        return [
+            item
+            for day in source.get('days', [])
+            for meal in day.get('meals', [])
+            for item in meal.get('ingredients', [])
+        ]
+    return extract_ingredients_from_text(source or '')
+
+
+def build_shopping_list(source: Union[str, Dict]) -> List[Dict]:
+    """
+    Turns a meal plan (structured or text) into a deduplicated shopping list.
+    """
+    return aggregate_ingredients(extract_ingredients(source))
@@ -3,6 +3,72 @@ import json
 import os
 from typing import Dict, List, Optional
 import logging
+import httpx
+from django.conf import settings
+
+from .ingredients import canonical_ingredient_name
+
+INSTACART_BASE_URL = "https://connect.dev.instacart.tools"
+PRODUCTS_LINK_PATH = "/idp/v1/products/products_link"
+
+MEAL_PLAN_CART_INSTRUCTIONS = [
+    "This shopping list was generated from your meal plan",
+    "Please review quantities and brands before purchasing"
+]
+
+def build_line_items(ingredients: List[Dict], products: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """
+    Converts ingredients to the line item format expected by the Instacart API.
+    
+    Args:
+        ingredients: List of ingredients with name, quantity, and unit
+        products: Resolved product payloads keyed by canonical ingredient name
+            (see core.product_mapping); unmapped ingredients use their raw name
+        
+    Returns:
+        List[Dict]: Products Link line items
+    """
+    products = products or {}
+    line_items = []
+    for ingredient in ingredients:
+        line_item = {
+            "name": ingredient.get("name", ""),
+            "quantity": ingredient.get("quantity", 1),
+            "unit": ingredient.get("unit", "each"),
+            "display_text": f"{ingredient.get('quantity', 1)} {ingredient.get('unit', 'each')} {ingredient.get('name', '')}",
+            "line_item_measurements": [
+                {
+                    "quantity": ingredient.get("quantity", 1),
+                    "unit": ingredient.get("unit", "each")
+                }
+            ],
+            "filters": {
+                "brand_filters": [],
+                "health_filters": []
+            }
+        }
+        product = products.get(canonical_ingredient_name(ingredient.get("name", "")))
+        if product:
+            line_item.update(product)
+        line_items.append(line_item)
+    return line_items
+
+def build_products_link_payload(title: str, line_items: List[Dict], instructions: List[str] = None) -> Dict:
+    """
+    Builds the request body for the Products Link endpoint.
+    """
+    return {
+        "title": title,
+        "image_url": "",  # Optional: can be empty string
+        "link_type": "shopping_list",
+        "expires_in": 7,  # In days, not seconds
+        "instructions": instructions or [],
+        "line_items": line_items,
+        "landing_page_configuration": {
+            "partner_linkback_url": "",
+            "enable_pantry_items": True
+        }
+    }
 
 class InstacartClient:
     """
@@ -12,7 +78,7 @@ class InstacartClient:
     
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.base_url = "https://connect.dev.instacart.tools"
+        self.base_url = INSTACART_BASE_URL
         self.session = requests.Session()
         self.session.headers.update({
             "Authorization": f"Bearer {self.api_key}",
@@ -32,20 +98,8 @@ class InstacartClient:
         Returns:
             Dict: Response from the API containing the cart information
         """
-        url = f"{self.base_url}/idp/v1/products/products_link"
-        
-        payload = {
-            "title": title,
-            "image_url": "",  # Optional: can be empty string
-            "link_type": "shopping_list",
-            "expires_in": 7,  # In days, not seconds
-            "instructions": instructions or [],
-            "line_items": line_items,
-            "landing_page_configuration": {
-                "partner_linkback_url": "",
-                "enable_pantry_items": True
-            }
-        }
+        url = f"{self.base_url}{PRODUCTS_LINK_PATH}"
+        payload = build_products_link_payload(title, line_items, instructions)
         
         # Debug logging
         logger = logging.getLogger('core.tasks')
@@ -54,7 +108,9 @@ class InstacartClient:
         logger.info(f"🔍 DEBUG: Request payload: {json.dumps(payload, indent=2)}")
         logger.info(f"🔍 DEBUG: Authorization header: Bearer {self.api_key[:10]}...{self.api_key[-4:] if len(self.api_key) > 14 else ''}")
         
-        response = self.session.post(url, json=payload)
+        response = self.session.post(
+            url, json=payload, timeout=(settings.INSTACART_CONNECT_TIMEOUT, settings.INSTACART_READ_TIMEOUT)
+        )
         
         logger.info(f"🔍 DEBUG: Response status code: {response.status_code}")
         logger.info(f"🔍 DEBUG: Response headers: {dict(response.headers)}")
@@ -68,48 +124,75 @@ class InstacartClient:
         response.raise_for_status()
         return response.json()
     
-    def create_meal_plan_cart(self, meal_plan_title: str, ingredients: List[Dict]) -> Dict:
+    def create_meal_plan_cart(self, meal_plan_title: str, ingredients: List[Dict],
+                              products: Optional[Dict[str, Dict]] = None) -> Dict:
         """
         Creates a shopping cart specifically for meal plan ingredients.
         
         Args:
             meal_plan_title: Title for the meal plan
             ingredients: List of ingredients with name, quantity, and unit
+            products: Resolved product payloads keyed by canonical ingredient name
             
         Returns:
             Dict: Response from the API containing the cart information
         """
-        # Convert ingredients to the format expected by Instacart API
-        line_items = []
-        for ingredient in ingredients:
-            line_item = {
-                "name": ingredient.get("name", ""),
-                "quantity": ingredient.get("quantity", 1),
-                "unit": ingredient.get("unit", "each"),
-                "display_text": f"{ingredient.get('quantity', 1)} {ingredient.get('unit', 'each')} {ingredient.get('name', '')}",
-                "line_item_measurements": [
-                    {
-                        "quantity": ingredient.get("quantity", 1),
-                        "unit": ingredient.get("unit", "each")
-                    }
-                ],
-                "filters": {
-                    "brand_filters": [],
-                    "health_filters": []
-                }
-            }
-            line_items.append(line_item)
+        return self.create_shopping_cart(
+            title=meal_plan_title,
+            line_items=build_line_items(ingredients, products),
+            instructions=MEAL_PLAN_CART_INSTRUCTIONS
+        )
+
+class AsyncInstacartClient:
+    """
+    Asynchronous counterpart of InstacartClient for the asyncio meal plan pipeline.
+    A single instance can serve many concurrent requests over one connection pool.
+    """
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.base_url = INSTACART_BASE_URL
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Accept": "application/json",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(settings.INSTACART_READ_TIMEOUT, connect=settings.INSTACART_CONNECT_TIMEOUT)
+        )
+    
+    async def create_shopping_cart(self, title: str, line_items: List[Dict], instructions: List[str] = None) -> Dict:
+        """
+        Creates a shopping cart using the Instacart Products Link API.
         
-        instructions = [
-            "This shopping list was generated from your meal plan",
-            "Please review quantities and brands before purchasing"
-        ]
+        Returns:
+            Dict: Response from the API containing the cart information
+        """
+        response = await self.client.post(
+            PRODUCTS_LINK_PATH,
+            json=build_products_link_payload(title, line_items, instructions)
+        )
+        logging.getLogger('core.tasks').info(f"Instacart products link response status: {response.status_code}")
+        response.raise_for_status()
+        return response.json()
+    
+    async def create_meal_plan_cart(self, meal_plan_title: str, ingredients: List[Dict],
+                                    products: Optional[Dict[str, Dict]] = None) -> Dict:
+        """
+        Creates a shopping cart specifically for meal plan ingredients.
         
-        return self.create_shopping_cart(
+        Returns:
+            Dict: Response from the API containing the cart information
+        """
+        return await self.create_shopping_cart(
             title=meal_plan_title,
-            line_items=line_items,
-            instructions=instructions
+            line_items=build_line_items(ingredients, products),
+            instructions=MEAL_PLAN_CART_INSTRUCTIONS
         )
+    
+    async def aclose(self) -> None:
+        await self.client.aclose()
 
 class Cart:
     """
@@ -0,0 +1,248 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from django.conf import settings
+from langchain.prompts import PromptTemplate
+from langchain.chat_models import ChatOpenAI
+from langchain.chains import LLMChain
+
+from .meal_plan_schema import MEAL_PLAN_JSON_EXAMPLE
+from .rate_limiter import RateLimitTimeout
+from .resilience import CircuitOpenError
+
+logger = logging.getLogger('core.tasks')
+
+# Bump whenever the meal planning prompt changes so cached plans are not reused
+MEAL_PLAN_PROMPT_VERSION = '2'
+
+MEAL_PLAN_TEMPLATE = """You are a meal planning assistant. Create a detailed weekly meal plan based on the user's preferences and dietary restrictions.
+
+User Preferences: {preferences}
+Dietary Restrictions: {dietary_restrictions}
+Budget: ${budget}
+
+Please create a comprehensive meal plan that:
+1. Stays within the specified budget
+2. Respects all dietary restrictions
+3. Matches user preferences
+4. Includes 7 days of meals (breakfast, lunch, dinner)
+5. Provides a complete ingredient list with quantities and units for every meal
+6. Includes estimated costs for every meal and day, and the estimated total cost
+7. Provides simple cooking instructions
+
+Respond with JSON only, using exactly this structure:
+""" + MEAL_PLAN_JSON_EXAMPLE
+
+# Bump whenever the per-day prompt changes so cached day plans are not reused
+MEAL_PLAN_DAY_PROMPT_VERSION = '1'
+
+MEAL_PLAN_DAY_TEMPLATE = """You are a meal planning assistant. Plan the meals for {day} (day {day_number} of a 7-day plan) based on the user's preferences and dietary restrictions.
+
+User Preferences: {preferences}
+Dietary Restrictions: {dietary_restrictions}
+Daily Budget: ${budget}
+
+The meals must:
+1. Stay within the daily budget
+2. Respect all dietary restrictions
+3. Match user preferences
+4. Cover breakfast, lunch and dinner
+5. Vary from what would typically be served on the other days of the week
+
+Respond with JSON only, using exactly this structure:
+{{"day": "{day}", "meals": [{{"slot": "breakfast", "name": "...", "instructions": "...", "estimated_cost": 0.0, "ingredients": [{{"name": "...", "quantity": 1, "unit": "..."}}]}}], "estimated_cost": 0.0}}"""
+
+
+# Bump whenever the partial regeneration prompt changes
+MEAL_PLAN_PATCH_PROMPT_VERSION = '1'
+
+MEAL_PLAN_PATCH_TEMPLATE = """You are a meal planning assistant. A user wants to replace part of their weekly meal plan.
+
+User Preferences: {preferences}
+Dietary Restrictions: {dietary_restrictions}
+Weekly Budget: ${budget}
+
+Current meal plan:
+{current_plan}
+
+Replace only these meals: {targets}
+
+The replacement meals must:
+1. Respect all dietary restrictions
+2. Match user preferences
+3. Differ from the meals they replace
+4. Keep the week within the budget
+5. Include ingredients with quantities and units, estimated costs and simple cooking instructions
+
+Respond with JSON only, containing only the replacement meals, using exactly this structure:
+""" + MEAL_PLAN_JSON_EXAMPLE
+
+
+def _create_llm(**kwargs):
+    # Retries are left to core.resilience so they count towards the OpenAI circuit breaker
+    return ChatOpenAI(
+        temperature=settings.MEAL_PLAN_LLM_TEMPERATURE,
+        model_name=settings.MEAL_PLAN_LLM_MODEL,
+        openai_api_key=os.getenv('OPENAI_API_KEY'),
+        request_timeout=httpx.Timeout(settings.OPENAI_READ_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        max_retries=0,
+        **kwargs
+    )
+
+
+def create_meal_planning_chain():
+    """
+    Creates a LangChain chain for meal planning using OpenAI.
+    Uses a simple LLMChain approach instead of complex agents to avoid parsing errors.
+    The model answers in JSON mode; responses are validated by core.meal_plan_schema.
+    """
+    llm = _create_llm(
+        streaming=settings.MEAL_PLAN_STREAMING,
+        model_kwargs={"response_format": {"type": "json_object"}}
+    )
+
+    prompt = PromptTemplate(
+        template=MEAL_PLAN_TEMPLATE,
+        input_variables=["preferences", "dietary_restrictions", "budget"]
+    )
+
+    return LLMChain(llm=llm, prompt=prompt)
+
+
+def create_meal_plan_day_chain():
+    """
+    Creates a LangChain chain that plans a single day and answers in JSON.
+    Used when the week is generated as parallel per-day subtasks.
+    """
+    llm = _create_llm(model_kwargs={"response_format": {"type": "json_object"}})
+
+    prompt = PromptTemplate(
+        template=MEAL_PLAN_DAY_TEMPLATE,
+        input_variables=["day", "day_number", "preferences", "dietary_restrictions", "budget"]
+    )
+
+    return LLMChain(llm=llm, prompt=prompt)
+
+
+def create_meal_plan_patch_chain():
+    """
+    Creates a LangChain chain that regenerates selected days or meals of an
+    existing plan and answers in JSON with only the replacements.
+    """
+    llm = _create_llm(model_kwargs={"response_format": {"type": "json_object"}})
+
+    prompt = PromptTemplate(
+        template=MEAL_PLAN_PATCH_TEMPLATE,
+        input_variables=["preferences", "dietary_restrictions", "budget", "current_plan", "targets"]
+    )
+
+    return LLMChain(llm=llm, prompt=prompt)
+
+
+class MealPlanningChainPool:
+    """
+    Keeps one chain of a given kind per worker process.
+
+    Reusing the chain keeps the underlying OpenAI HTTP client, and with it the
+    keep-alive connections and TLS sessions, alive across tasks. The chain is
+    rebuilt when the API key or LLM settings change, or after a call failed.
+    """
+
+    def __init__(self, factory=create_meal_planning_chain, prompt_version=MEAL_PLAN_PROMPT_VERSION):
+        self.factory = factory
+        self.prompt_version = prompt_version
+        self._chain = None
+        self._fingerprint = None
+        self._healthy = False
+        self._built_at = None
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    def _current_fingerprint(self) -> str:
+        parts = [
+            os.getenv('OPENAI_API_KEY') or '',
+            settings.MEAL_PLAN_LLM_MODEL,
+            str(settings.MEAL_PLAN_LLM_TEMPERATURE),
+            str(settings.MEAL_PLAN_STREAMING),
+            self.prompt_version,
+        ]
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self) -> LLMChain:
+        """
+        Returns the process-wide chain, rebuilding it if it is stale or unhealthy.
+
+        Returns:
+            LLMChain: The meal planning chain
+        """
+        fingerprint = self._current_fingerprint()
+        with self._lock:
+            if self._chain is None or self._fingerprint != fingerprint or not self._healthy:
+                if self._chain is not None:
+                    logger.info("Rebuilding meal planning chain (settings changed or previous call failed)")
+                self._chain = self.factory()
+                self._fingerprint = fingerprint
+                self._healthy = True
+                self._built_at = time.time()
+            return self._chain
+
+    def mark_failed(self, error: Exception) -> None:
+        """
+        Flags the current chain as unhealthy so the next task rebuilds it.
+        An open circuit breaker or a rate limiter timeout is raised before any
+        request is sent, so it says nothing about the chain and is ignored.
+        """
+        if isinstance(error, (CircuitOpenError, RateLimitTimeout)):
+            return
+        with self._lock:
+            self._healthy = False
+            self._last_error = str(error)
+
+    def warm_up(self) -> bool:
+        """
+        Sends a one-token request so the first real task finds an open connection.
+
+        The chains answer in JSON mode, which OpenAI refuses unless the
+        messages mention JSON, so the warm-up prompt asks for JSON too. A
+        failed warm-up leaves the chain as it is: the connection it was meant
+        to open is merely still closed, and a real failure is caught by the
+        first task.
+
+        Returns:
+            bool: True if the warm-up request succeeded
+        """
+        try:
+            chain = self.get()
+            chain.llm.invoke("Reply with an empty JSON object.", max_tokens=1)
+            logger.info("Meal planning chain warmed up")
+            return True
+        except Exception as e:
+            logger.warning(f"Meal planning chain warm-up failed: {str(e)}")
+            return False
+
+    def health_check(self) -> Dict[str, Optional[object]]:
+        """
+        Reports the state of this process's chain.
+
+        Returns:
+            Dict: Whether a chain is built, healthy and built from current settings
+        """
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'built': self._chain is not None,
+                'healthy': self._healthy,
+                'stale': self._fingerprint != self._current_fingerprint(),
+                'built_at': self._built_at,
+                'last_error': self._last_error,
+            }
+
+
+meal_planning_chain_pool = MealPlanningChainPool()
+meal_plan_day_chain_pool = MealPlanningChainPool(create_meal_plan_day_chain, MEAL_PLAN_DAY_PROMPT_VERSION)
+meal_plan_patch_chain_pool = MealPlanningChainPool(create_meal_plan_patch_chain, MEAL_PLAN_PATCH_PROMPT_VERSION)
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Optional
+
+import redis
+from django.conf import settings
+
+from .lru import LRUCache
+from .redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+CACHE_PREFIX = 'meal_plan_cache'
+
+# Stores the entry, records its access time in the LRU index and evicts the
+# least recently used entries once the index grows past the configured size.
+# KEYS[1] = LRU index (sorted set), KEYS[2] = entry key
+# ARGV = value, ttl seconds, now, max entries, entry key prefix
+_SET_SCRIPT = """
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], KEYS[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[3]) - tonumber(ARGV[2]))
+local overflow = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[4])
+if overflow > 0 then
+    local victims = redis.call('ZRANGE', KEYS[1], 0, overflow - 1)
+    redis.call('DEL', unpack(victims))
+    redis.call('ZREM', KEYS[1], unpack(victims))
+    return overflow
+end
+return 0
+"""
+
+# Reads an entry and, on a hit, records the access in the LRU index and
+# restarts the entry's TTL, so an entry expires ``ttl`` seconds after its last
+# use, just as the set script trims the index by last use.
+# KEYS[1] = LRU index (sorted set), KEYS[2] = entry key
+# ARGV = now, ttl seconds
+_GET_SCRIPT = """
+local value = redis.call('GET', KEYS[2])
+if value then
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    redis.call('ZADD', KEYS[1], ARGV[1], KEYS[2])
+end
+return value
+"""
+
+
+def _normalize(value: Any) -> Any:
+    """
+    Normalizes user input so that semantically identical requests hash the same:
+    dict keys are sorted, strings are trimmed and lower-cased, and lists are
+    treated as unordered collections.
+    """
+    if isinstance(value, dict):
+        return {str(k).strip().lower(): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        items = [_normalize(v) for v in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(value, str):
+        return ' '.join(value.split()).lower()
+    if isinstance(value, Decimal):
+        return str(value.normalize())
+    return value
+
+
+def _normalize_budget(budget: Any) -> Optional[str]:
+    if budget in (None, ''):
+        return None
+    try:
+        return str(Decimal(str(budget)).quantize(Decimal('0.01')))
+    except (InvalidOperation, ValueError):
+        return str(budget)
+
+
+def make_cache_key(preferences: Any, dietary_restrictions: Any, budget: Any,
+                   prompt_version: str, **extra: Any) -> str:
+    """
+    Builds the content-addressed cache key for a meal plan request.
+
+    Args:
+        preferences: The profile's food preferences
+        dietary_restrictions: The profile's dietary restrictions
+        budget: The weekly budget
+        prompt_version: Version of the prompt template used to generate the plan
+        **extra: Any additional inputs that change the generated output
+
+    Returns:
+        str: A hex SHA-256 digest of the canonical, normalized inputs
+    """
+    payload = {
+        'preferences': _normalize(preferences),
+        'dietary_restrictions': _normalize(dietary_restrictions),
+        'budget': _normalize_budget(budget),
+        'prompt_version': str(prompt_version),
+    }
+    if extra:
+        payload['extra'] = _normalize(extra)
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class MealPlanCache:
+    """
+    Two-tier cache for generated meal plans.
+
+    A small in-process LRU sits in front of a shared Redis tier. Redis entries
+    expire a TTL after they were last read or written and are additionally
+    evicted in least-recently-used order once more than ``max_entries`` plans
+    are stored. Cache failures are logged
+    and treated as misses so they never fail a generation.
+
+    Hit and miss counters are kept per process and added to the shared
+    counters in Redis at most every MEAL_PLAN_CACHE_STATS_FLUSH_INTERVAL
+    seconds (and whenever stats are read), so a local hit costs no I/O.
+    """
+
+    def __init__(self, ttl: int = None, max_entries: int = None,
+                 local_size: int = None, local_ttl: int = None):
+        self.ttl = ttl or settings.MEAL_PLAN_CACHE_TTL
+        self.max_entries = max_entries or settings.MEAL_PLAN_CACHE_MAX_ENTRIES
+        self.local = LRUCache(
+            maxsize=settings.MEAL_PLAN_CACHE_LOCAL_SIZE if local_size is None else local_size,
+            ttl=local_ttl or settings.MEAL_PLAN_CACHE_LOCAL_TTL,
+        )
+        self._counters = {'local_hits': 0, 'hits': 0, 'misses': 0, 'errors': 0}
+        self._unflushed = {}
+        self._last_flush = time.monotonic()
+        self._counter_lock = threading.Lock()
+        self._get_script = None
+        self._set_script = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.MEAL_PLAN_CACHE_ENABLED
+
+    def _entry_key(self, key: str) -> str:
+        return f"{CACHE_PREFIX}:entry:{key}"
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+            if name != 'errors':
+                self._unflushed[name] = self._unflushed.get(name, 0) + 1
+            due = time.monotonic() - self._last_flush >= settings.MEAL_PLAN_CACHE_STATS_FLUSH_INTERVAL
+        if due:
+            self.flush_counters()
+
+    def flush_counters(self) -> None:
+        """
+        Adds this process's counts since the last flush to the shared counters in Redis.
+        """
+        with self._counter_lock:
+            pending, self._unflushed = self._unflushed, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for name, count in pending.items():
+                pipe.hincrby(f"{CACHE_PREFIX}:stats", name, count)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not flush meal plan cache counters: {str(e)}")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks up a cached meal plan.
+
+        Args:
+            key: Cache key built with make_cache_key
+
+        Returns:
+            Optional[str]: The cached meal plan text, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+
+        try:
+            if self._get_script is None:
+                self._get_script = get_redis().register_script(_GET_SCRIPT)
+            raw = self._get_script(
+                keys=[f"{CACHE_PREFIX}:lru", self._entry_key(key)], args=[time.time(), self.ttl]
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Meal plan cache lookup failed: {str(e)}")
+            self._count('errors')
+            return None
+
+        if raw is None:
+            self._count('misses')
+            return None
+
+        value = raw.decode('utf-8')
+        self.local.set(key, value)
+        self._count('hits')
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores a generated meal plan in both cache tiers.
+
+        Args:
+            key: Cache key built with make_cache_key
+            value: The generated meal plan text
+        """
+        if not self.enabled:
+            return
+
+        self.local.set(key, value)
+        try:
+            client = get_redis()
+            if self._set_script is None:
+                self._set_script = client.register_script(_SET_SCRIPT)
+            evicted = self._set_script(
+                keys=[f"{CACHE_PREFIX}:lru", self._entry_key(key)],
+                args=[value, self.ttl, time.time(), self.max_entries],
+            )
+            if evicted:
+                logger.debug(f"Evicted {evicted} least recently used meal plan(s) from cache")
+        except redis.RedisError as e:
+            logger.warning(f"Meal plan cache store failed: {str(e)}")
+            self._count('errors')
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns cluster-wide hit/miss counters along with this process's counters.
+        Other processes' counts reach the shared counters within
+        MEAL_PLAN_CACHE_STATS_FLUSH_INTERVAL seconds.
+
+        Returns:
+            Dict: Counters, hit rate and the number of entries in the Redis tier
+        """
+        self.flush_counters()
+        with self._counter_lock:
+            process = dict(self._counters)
+        stats = {
+            'enabled': self.enabled,
+            'process': process,
+            'local_entries': len(self.local),
+        }
+        try:
+            client = get_redis()
+            shared = {k.decode(): int(v) for k, v in client.hgetall(f"{CACHE_PREFIX}:stats").items()}
+            stats['entries'] = client.zcard(f"{CACHE_PREFIX}:lru")
+        except redis.RedisError as e:
+            logger.warning(f"Could not read meal plan cache stats: {str(e)}")
+            shared = {}
+        hits = shared.get('hits', 0) + shared.get('local_hits', 0)
+        lookups = hits + shared.get('misses', 0)
+        stats.update({
+            'hits': shared.get('hits', 0),
+            'local_hits': shared.get('local_hits', 0),
+            'misses': shared.get('misses', 0),
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+        })
+        return stats
+
+
+meal_plan_cache = MealPlanCache()
@@ -0,0 +1,217 @@
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MEAL_SLOTS = ['breakfast', 'lunch', 'dinner', 'snack']
+
+# Shown to the LLM; every generated plan must validate against parse_meal_plan
+MEAL_PLAN_JSON_EXAMPLE = (
+    '{{"days": [{{"day": "Monday", "estimated_cost": 0.0, "meals": [{{"slot": "breakfast", '
+    '"name": "...", "instructions": "...", "estimated_cost": 0.0, "ingredients": '
+    '[{{"name": "...", "quantity": 1, "unit": "...", "estimated_cost": 0.0}}]}}]}}], '
+    '"estimated_cost": 0.0}}'
+)
+
+
+class MealPlanSchemaError(ValueError):
+    """Raised when an LLM response is not a valid structured meal plan."""
+
+
+def _decimal(value, field: str, default=None) -> Decimal:
+    if value in (None, ''):
+        if default is not None:
+            return default
+        return None
+    try:
+        result = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise MealPlanSchemaError(f"'{field}' must be a number, got {value!r}")
+    if result < 0:
+        raise MealPlanSchemaError(f"'{field}' must not be negative")
+    return result
+
+
+def load_json_response(text: str) -> Dict:
+    """
+    Parses a JSON object from an LLM response, tolerating Markdown code fences.
+    """
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        if text.startswith('json'):
+            text = text[4:]
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise MealPlanSchemaError(f"Response is not valid JSON: {str(e)}")
+    if not isinstance(data, dict):
+        raise MealPlanSchemaError("Response must be a JSON object")
+    return data
+
+
+def validate_day_plan(data: Dict) -> Dict:
+    """
+    Validates and normalizes one day of a structured meal plan.
+
+    Returns:
+        Dict: The day with a canonical day name, lower-case meal slots and
+        Decimal quantities and costs
+    """
+    day = str(data.get('day', '')).strip().title()
+    if day not in DAYS:
+        raise MealPlanSchemaError(f"Unknown day {data.get('day')!r}")
+
+    meals = data.get('meals')
+    if not isinstance(meals, list) or not meals:
+        raise MealPlanSchemaError(f"{day} must have a non-empty 'meals' list")
+
+    normalized_meals = []
+    for meal in meals:
+        if not isinstance(meal, dict):
+            raise MealPlanSchemaError(f"Meals on {day} must be objects")
+        slot = str(meal.get('slot', '')).strip().lower()
+        if slot not in MEAL_SLOTS:
+            raise MealPlanSchemaError(f"Unknown meal slot {meal.get('slot')!r} on {day}")
+        name = str(meal.get('name', '')).strip()
+        if not name:
+            raise MealPlanSchemaError(f"The {slot} on {day} has no name")
+
+        ingredients = []
+        for item in meal.get('ingredients') or []:
+            if not isinstance(item, dict) or not str(item.get('name', '')).strip():
+                raise MealPlanSchemaError(f"Ingredients of {name!r} must be objects with a name")
+            ingredients.append({
+                'name': str(item['name']).strip(),
+                'quantity': _decimal(item.get('quantity'), 'quantity', Decimal('1')),
+                'unit': str(item.get('unit') or 'each').strip().lower(),
+                'estimated_cost': _decimal(item.get('estimated_cost'), 'estimated_cost'),
+            })
+
+        normalized_meals.append({
+            'slot': slot,
+            'name': name,
+            'instructions': str(meal.get('instructions') or '').strip(),
+            'estimated_cost': _decimal(meal.get('estimated_cost'), 'estimated_cost'),
+            'ingredients': ingredients,
+        })
+
+    estimated_cost = _decimal(data.get('estimated_cost'), 'estimated_cost')
+    if estimated_cost is None:
+        estimated_cost = sum((meal['estimated_cost'] or Decimal('0') for meal in normalized_meals), Decimal('0'))
+    return {'day': day, 'meals': normalized_meals, 'estimated_cost': estimated_cost}
+
+
+def validate_meal_plan(data: Dict) -> Dict:
+    """
+    Validates and normalizes a full structured meal plan.
+
+    Returns:
+        Dict: The plan with its days in week order and a total estimated cost
+    """
+    days = data.get('days')
+    if not isinstance(days, list) or not days:
+        raise MealPlanSchemaError("Meal plan must have a non-empty 'days' list")
+
+    normalized_days = sorted((validate_day_plan(day) for day in days), key=lambda day: DAYS.index(day['day']))
+    if len({day['day'] for day in normalized_days}) != len(normalized_days):
+        raise MealPlanSchemaError("Meal plan contains the same day more than once")
+
+    estimated_cost = _decimal(data.get('estimated_cost'), 'estimated_cost')
+    if estimated_cost is None:
+        estimated_cost = sum((day['estimated_cost'] for day in normalized_days), Decimal('0'))
+    return {'days': normalized_days, 'estimated_cost': estimated_cost}
+
+
+def normalize_targets(days=None, meals=None) -> List[Tuple[str, Optional[str]]]:
+    """
+    Normalizes a regeneration request into ``(day, slot)`` pairs, where a None
+    slot stands for the whole day.
+
+    Args:
+        days: Day names to regenerate entirely
+        meals: Objects with a ``day`` and a ``slot`` to regenerate individually
+
+    Raises:
+        MealPlanSchemaError: If a day or slot is unknown or nothing was requested
+    """
+    targets = []
+    for day in days or []:
+        name = str(day).strip().title()
+        if name not in DAYS:
+            raise MealPlanSchemaError(f"Unknown day {day!r}")
+        targets.append((name, None))
+    for meal in meals or []:
+        if not isinstance(meal, dict):
+            raise MealPlanSchemaError("Each meal must be an object with a 'day' and a 'slot'")
+        name = str(meal.get('day', '')).strip().title()
+        slot = str(meal.get('slot', '')).strip().lower()
+        if name not in DAYS:
+            raise MealPlanSchemaError(f"Unknown day {meal.get('day')!r}")
+        if slot not in MEAL_SLOTS:
+            raise MealPlanSchemaError(f"Unknown meal slot {meal.get('slot')!r}")
+        if (name, None) not in targets:
+            targets.append((name, slot))
+    if not targets:
+        raise MealPlanSchemaError("Specify at least one day or meal to regenerate")
+    return sorted(set(targets), key=lambda target: (DAYS.index(target[0]), target[1] or ''))
+
+
+def matches_target(day: str, slot: str, targets: List[Tuple[str, Optional[str]]]) -> bool:
+    return any(day == target_day and target_slot in (None, slot) for target_day, target_slot in targets)
+
+
+def parse_meal_plan(text: str) -> Dict:
+    """
+    Parses and validates an LLM response containing a structured meal plan.
+
+    Raises:
+        MealPlanSchemaError: If the response is not valid JSON or does not match the schema
+    """
+    return validate_meal_plan(load_json_response(text))
+
+
+def parse_day_plan(text: str) -> Dict:
+    """
+    Parses and validates an LLM response containing a single day plan.
+
+    Raises:
+        MealPlanSchemaError: If the response is not valid JSON or does not match the schema
+    """
+    return validate_day_plan(load_json_response(text))
+
+
+def _format_quantity(quantity) -> str:
+    return f"{Decimal(str(quantity)).normalize():f}"
+
+
+def render_day_plan(day_plan: Dict) -> str:
+    """
+    Renders a structured day plan as the plain-text section used in meal_plan['plan'].
+    """
+    lines = [f"{day_plan['day']}:"]
+    for meal in day_plan['meals']:
+        lines.append(f"  {meal['slot'].title()}: {meal['name']}")
+        ingredients = ', '.join(
+            f"{_format_quantity(item['quantity'])} {item['unit']} {item['name']}"
+            for item in meal['ingredients']
+        )
+        if ingredients:
+            lines.append(f"    Ingredients: {ingredients}")
+        if meal['instructions']:
+            lines.append(f"    Instructions: {meal['instructions']}")
+    return '\n'.join(lines)
+
+
+def render_meal_plan(meal_plan: Dict, shopping_list: List[Dict]) -> str:
+    """
+    Renders a validated meal plan and its aggregated shopping list as plain text.
+    """
+    text = '\n\n'.join(render_day_plan(day) for day in meal_plan['days'])
+    if shopping_list:
+        items = '\n'.join(
+            f"- {_format_quantity(item['quantity'])} {item['unit']} {item['name']}" for item in shopping_list
+        )
+        text += f"\n\nShopping List:\n{items}"
+    text += f"\n\nEstimated Total Cost: ${meal_plan['estimated_cost']:.2f}"
+    return text
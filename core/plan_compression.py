@@ -0,0 +1,146 @@
+import struct
+import zlib
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+
+from .lru import LRUCache
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; plans are compressed with zlib without it
+    zstandard = None
+
+# Stored bodies start with a header: codec (1 byte) and dictionary id (4 bytes, 0 = none)
+HEADER = struct.Struct('>BI')
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {'none': CODEC_RAW, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+# zlib only looks back 32 KB, so a longer preset dictionary is wasted
+ZLIB_MAX_DICTIONARY_SIZE = 32 * 1024
+
+# Dictionaries never change once stored; which one is current is re-read now and then
+_dictionaries = LRUCache(maxsize=16)
+_current_dictionaries = LRUCache(maxsize=4, ttl=300)
+
+
+def configured_codec() -> int:
+    """
+    The codec new plan bodies are written with (MEAL_PLAN_COMPRESSION), falling
+    back to zlib when zstandard is not installed.
+    """
+    codec = CODECS.get(settings.MEAL_PLAN_COMPRESSION, CODEC_ZLIB)
+    if codec == CODEC_ZSTD and zstandard is None:
+        return CODEC_ZLIB
+    return codec
+
+
+def _dictionary(dictionary_id: int) -> bytes:
+    data = _dictionaries.get(dictionary_id)
+    if data is None:
+        from api.models import CompressionDictionary
+        data = bytes(CompressionDictionary.objects.values_list('data', flat=True).get(id=dictionary_id))
+        _dictionaries.set(dictionary_id, data)
+    return data
+
+
+def _current_dictionary(codec: int) -> Tuple[int, Optional[bytes]]:
+    current = _current_dictionaries.get(codec)
+    if current is None:
+        from api.models import CompressionDictionary
+        latest = (
+            CompressionDictionary.objects.filter(codec=codec)
+            .order_by('-id').values_list('id', 'data').first()
+        )
+        current = (latest[0], bytes(latest[1])) if latest else (0, None)
+        _current_dictionaries.set(codec, current)
+        if latest:
+            _dictionaries.set(current[0], current[1])
+    return current
+
+
+def reset_dictionary_cache() -> None:
+    """
+    Makes the next compress_plan call look up the newest dictionary.
+    """
+    _current_dictionaries.clear()
+
+
+def compress_plan(text: str, use_dictionary: bool = True) -> bytes:
+    """
+    Compresses a rendered meal plan for storage.
+
+    Bodies shorter than MEAL_PLAN_COMPRESSION_MIN_SIZE are stored as is. The
+    newest trained dictionary for the codec is used when there is one; its id
+    is recorded in the header so older bodies stay readable.
+
+    Args:
+        text: The plan text
+        use_dictionary: Whether to use the current trained dictionary
+
+    Returns:
+        bytes: Header followed by the (compressed) UTF-8 text
+    """
+    raw = text.encode('utf-8')
+    codec = configured_codec()
+    if codec == CODEC_RAW or len(raw) < settings.MEAL_PLAN_COMPRESSION_MIN_SIZE:
+        return HEADER.pack(CODEC_RAW, 0) + raw
+
+    dictionary_id, dictionary = _current_dictionary(codec) if use_dictionary else (0, None)
+    level = settings.MEAL_PLAN_COMPRESSION_LEVEL
+    if codec == CODEC_ZSTD:
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        body = zstandard.ZstdCompressor(level=level, dict_data=dict_data).compress(raw)
+    else:
+        compressor = zlib.compressobj(min(level, 9), zdict=dictionary) if dictionary else zlib.compressobj(min(level, 9))
+        body = compressor.compress(raw) + compressor.flush()
+    return HEADER.pack(codec, dictionary_id) + body
+
+
+def decompress_plan(data: Optional[bytes]) -> str:
+    """
+    Restores the text stored by compress_plan.
+    """
+    if not data:
+        return ''
+    data = bytes(data)
+    codec, dictionary_id = HEADER.unpack_from(data)
+    body = data[HEADER.size:]
+    dictionary = _dictionary(dictionary_id) if dictionary_id else None
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read this meal plan")
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        raw = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(body)
+    elif codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        raw = decompressor.decompress(body) + decompressor.flush()
+    else:
+        raw = body
+    return raw.decode('utf-8')
+
+
+def train_dictionary(samples: Iterable[str], codec: int, size: int) -> bytes:
+    """
+    Builds a compression dictionary from sample plan texts.
+
+    zstd dictionaries are trained with zstandard. zlib has no trainer, so its
+    preset dictionary is made of the most common lines, the most frequent last
+    (closest to the data, where zlib finds matches most cheaply).
+    """
+    samples = [sample.encode('utf-8') for sample in samples if sample]
+    if codec == CODEC_ZSTD:
+        return zstandard.train_dictionary(size, samples).as_bytes()
+
+    size = min(size, ZLIB_MAX_DICTIONARY_SIZE)
+    counts = Counter(line for sample in samples for line in sample.splitlines(keepends=True) if line.strip())
+    dictionary = b''
+    for line, count in counts.most_common():
+        if count < 2:
+            break
+        if len(dictionary) + len(line) <= size:
+            dictionary = line + dictionary
+    return dictionary
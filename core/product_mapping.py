@@ -0,0 +1,129 @@
+import logging
+from typing import Any, Dict, Iterable, List, Set
+
+from django.conf import settings
+
+from api.models import IngredientProductMapping
+from .ingredients import canonical_ingredient_name
+from .lru import LRUCache
+
+logger = logging.getLogger('core.tasks')
+
+# Instacart health filter -> words in a profile's dietary restrictions that imply it
+HEALTH_FILTER_KEYWORDS = {
+    'VEGAN': ('vegan', 'plant-based', 'plant based'),
+    'GLUTEN_FREE': ('gluten', 'celiac', 'coeliac'),
+    'KOSHER': ('kosher',),
+    'ORGANIC': ('organic',),
+    'SUGAR_FREE': ('sugar-free', 'sugar free', 'no sugar', 'diabetic'),
+    'FAT_FREE': ('fat-free', 'fat free'),
+    'LOW_FAT': ('low-fat', 'low fat'),
+}
+
+
+def _restriction_terms(value: Any) -> Iterable[str]:
+    # dietary_restrictions is free-form JSON: {"vegan": true}, {"diet": ["gluten-free"]}, ...
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if item is True:
+                yield str(key)
+            elif item:
+                yield from _restriction_terms(item)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            yield from _restriction_terms(item)
+    elif isinstance(value, str):
+        yield value
+
+
+def health_filters_for(dietary_restrictions: Any) -> List[str]:
+    """
+    Derives the Instacart health filters implied by a profile's dietary restrictions.
+
+    Returns:
+        List[str]: Sorted health filter names, e.g. ['GLUTEN_FREE', 'VEGAN']
+    """
+    text = ' '.join(term.replace('_', ' ').lower() for term in _restriction_terms(dietary_restrictions))
+    filters: Set[str] = {
+        health_filter
+        for health_filter, keywords in HEALTH_FILTER_KEYWORDS.items()
+        if any(keyword in text for keyword in keywords)
+    }
+    return sorted(filters)
+
+
+class ProductMappingCache:
+    """
+    Resolves ingredients to Instacart line item payloads.
+
+    Mappings are keyed by canonical ingredient name and the health filters
+    derived from the dietary restrictions, persisted in
+    IngredientProductMapping and fronted by an in-process LRU. A cart
+    therefore costs at most one indexed query for the ingredients not yet in
+    the LRU and one bulk insert for ingredients never seen before.
+    """
+
+    def __init__(self, local_size: int = None, local_ttl: int = None):
+        self.local = LRUCache(
+            maxsize=settings.PRODUCT_MAPPING_CACHE_SIZE if local_size is None else local_size,
+            ttl=local_ttl or settings.PRODUCT_MAPPING_CACHE_TTL,
+        )
+
+    @staticmethod
+    def _new_mapping(name: str, restrictions_key: str, health_filters: List[str]) -> IngredientProductMapping:
+        return IngredientProductMapping(
+            normalized_name=name,
+            restrictions_key=restrictions_key,
+            product_name=name.title(),
+            filters={'brand_filters': [], 'health_filters': health_filters},
+        )
+
+    def resolve(self, names: Iterable[str], dietary_restrictions: Any = None) -> Dict[str, Dict]:
+        """
+        Looks up the product payload for each ingredient, creating missing mappings.
+
+        Args:
+            names: Ingredient names
+            dietary_restrictions: The profile's dietary restrictions
+
+        Returns:
+            Dict[str, Dict]: Line item product payloads keyed by canonical ingredient name
+        """
+        health_filters = health_filters_for(dietary_restrictions)
+        restrictions_key = ','.join(health_filters)
+
+        products = {}
+        missing = set()
+        for name in {canonical_ingredient_name(name) for name in names}:
+            product = self.local.get((name, restrictions_key))
+            if product is None:
+                missing.add(name)
+            else:
+                products[name] = product
+        if not missing:
+            return products
+
+        mappings = {
+            mapping.normalized_name: mapping
+            for mapping in IngredientProductMapping.objects.filter(
+                restrictions_key=restrictions_key, normalized_name__in=missing
+            )
+        }
+        new_mappings = [
+            self._new_mapping(name, restrictions_key, health_filters)
+            for name in sorted(missing - mappings.keys())
+        ]
+        if new_mappings:
+            # Another worker may have created some of them meanwhile; either row is equivalent
+            IngredientProductMapping.objects.bulk_create(new_mappings, ignore_conflicts=True)
+            mappings.update((mapping.normalized_name, mapping) for mapping in new_mappings)
+            logger.info(f"Created {len(new_mappings)} ingredient product mapping(s)")
+
+        for name, mapping in mappings.items():
+            product = mapping.to_line_item()
+            self.local.set((name, restrictions_key), product)
+            products[name] = product
+        return products
+
+
+product_mapping_cache = ProductMappingCache()
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import redis
+from django.conf import settings
+from langchain.callbacks.base import BaseCallbackHandler
+
+from .redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+RATE_LIMIT_PREFIX = 'openai_rate_limit'
+WINDOW_SECONDS = 60
+
+# Reserves capacity in both buckets with GCRA (generic cell rate algorithm).
+# Each bucket stores its theoretical arrival time (TAT): the moment at which
+# everything reserved so far has drained at the configured rate. A request
+# costing n units pushes the TAT out by n * (60 / limit) and may start once the
+# TAT is no more than one window ahead. Reservations are granted in the order
+# they reach Redis, so waiting callers are released first come, first served.
+# Time comes from the Redis server, so clock skew between workers cannot move
+# the shared buckets.
+# KEYS[1] = RPM bucket, KEYS[2] = TPM bucket
+# ARGV = rpm limit, tpm limit, tokens, max wait, window
+# Returns {granted (1/0), wait seconds as a string}
+_RESERVE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local window = tonumber(ARGV[5])
+local function plan(key, limit, cost)
+    if limit <= 0 then
+        return nil, now
+    end
+    local tat = tonumber(redis.call('GET', key) or now)
+    if tat < now then
+        tat = now
+    end
+    local new_tat = tat + cost * window / limit
+    return new_tat, new_tat - window
+end
+local rpm_tat, rpm_start = plan(KEYS[1], tonumber(ARGV[1]), 1)
+local tpm_tat, tpm_start = plan(KEYS[2], tonumber(ARGV[2]), tonumber(ARGV[3]))
+local wait = math.max(0, rpm_start - now, tpm_start - now)
+if wait > tonumber(ARGV[4]) then
+    return {0, tostring(wait)}
+end
+if rpm_tat then
+    redis.call('SET', KEYS[1], tostring(rpm_tat), 'EX', math.ceil(rpm_tat - now + window))
+end
+if tpm_tat then
+    redis.call('SET', KEYS[2], tostring(tpm_tat), 'EX', math.ceil(tpm_tat - now + window))
+end
+return {1, tostring(wait)}
+"""
+
+# Moves the TPM bucket by the difference between estimated and actual usage.
+# KEYS[1] = TPM bucket; ARGV = tpm limit, token delta, window
+_RECONCILE_SCRIPT = """
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat then
+    return 0
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local window = tonumber(ARGV[3])
+tat = math.max(now, tat + tonumber(ARGV[2]) * window / tonumber(ARGV[1]))
+redis.call('SET', KEYS[1], tostring(tat), 'EX', math.ceil(tat - now + window))
+return 1
+"""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when OpenAI capacity would not be available within the maximum wait."""
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    Records the token usage of a completion.
+
+    OpenAI reports no usage for streamed completions; their total is the
+    estimated prompt tokens plus the completion tokens counted as they arrive.
+    """
+
+    def __init__(self, prompt_tokens: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.streamed_tokens = 0
+        self.total_tokens = None
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.streamed_tokens += 1
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        if usage.get('total_tokens'):
+            self.total_tokens = usage['total_tokens']
+        elif self.streamed_tokens:
+            self.total_tokens = self.prompt_tokens + self.streamed_tokens
+
+
+class OpenAIRateLimiter:
+    """
+    Cluster-wide requests-per-minute and tokens-per-minute limiter for OpenAI.
+
+    Every worker reserves capacity atomically in Redis before calling the
+    model and sleeps until its reservation starts, so the cluster as a whole
+    runs at the configured quota instead of provoking 429 responses. Token
+    costs are estimated up front and corrected once the actual usage is known.
+    If Redis is unavailable the limiter lets calls through.
+    """
+
+    def __init__(self):
+        self._reserve_script = None
+        self._reconcile_script = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.OPENAI_RPM_LIMIT > 0 or settings.OPENAI_TPM_LIMIT > 0
+
+    def _keys(self):
+        model = settings.MEAL_PLAN_LLM_MODEL
+        return f"{RATE_LIMIT_PREFIX}:{model}:rpm", f"{RATE_LIMIT_PREFIX}:{model}:tpm"
+
+    @staticmethod
+    def estimate_prompt_tokens(prompt: str) -> int:
+        """
+        Estimates a prompt's tokens at about four characters per token.
+        """
+        return len(prompt) // 4
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserves one request and ``tokens`` tokens.
+
+        Returns:
+            float: Seconds to wait before the reserved call may start
+
+        Raises:
+            RateLimitTimeout: If the wait would exceed OPENAI_RATE_LIMIT_MAX_WAIT
+        """
+        if not self.enabled:
+            return 0.0
+        try:
+            client = get_redis()
+            if self._reserve_script is None:
+                self._reserve_script = client.register_script(_RESERVE_SCRIPT)
+            granted, wait = self._reserve_script(
+                keys=list(self._keys()),
+                args=[
+                    settings.OPENAI_RPM_LIMIT, settings.OPENAI_TPM_LIMIT,
+                    tokens, settings.OPENAI_RATE_LIMIT_MAX_WAIT, WINDOW_SECONDS
+                ],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"OpenAI rate limiter unavailable, not limiting: {str(e)}")
+            return 0.0
+
+        wait = float(wait)
+        if not granted:
+            raise RateLimitTimeout(f"OpenAI capacity not available for {wait:.0f}s")
+        return wait
+
+    def reconcile(self, estimated: int, actual: Optional[int]) -> None:
+        """
+        Returns over-reserved tokens to the TPM bucket, or charges the shortfall.
+        """
+        if not actual or actual == estimated or settings.OPENAI_TPM_LIMIT <= 0:
+            return
+        try:
+            client = get_redis()
+            if self._reconcile_script is None:
+                self._reconcile_script = client.register_script(_RECONCILE_SCRIPT)
+            self._reconcile_script(
+                keys=[self._keys()[1]],
+                args=[settings.OPENAI_TPM_LIMIT, actual - estimated, WINDOW_SECONDS],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Could not reconcile OpenAI token usage: {str(e)}")
+
+    def _prepare(self, chain, inputs: Dict[str, Any], config: Optional[Dict]):
+        # The completion is charged at its expected length until the actual usage is known
+        prompt_tokens = self.estimate_prompt_tokens(chain.prompt.format(**inputs))
+        estimated = prompt_tokens + settings.OPENAI_COMPLETION_TOKENS_ESTIMATE
+        usage = TokenUsageHandler(prompt_tokens)
+        config = dict(config or {})
+        config['callbacks'] = [*config.get('callbacks', []), usage]
+        return estimated, usage, config
+
+    def invoke(self, chain, inputs: Dict[str, Any], config: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Waits for OpenAI capacity, then runs ``chain.invoke``.
+        """
+        estimated, usage, config = self._prepare(chain, inputs, config)
+        wait = self.reserve(estimated)
+        if wait > 0:
+            logger.info(f"Waiting {wait:.2f}s for OpenAI rate limit capacity")
+            time.sleep(wait)
+        result = chain.invoke(inputs, config=config)
+        self.reconcile(estimated, usage.total_tokens)
+        return result
+
+    async def ainvoke(self, chain, inputs: Dict[str, Any], config: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Waits for OpenAI capacity without blocking the event loop, then runs ``chain.ainvoke``.
+        """
+        estimated, usage, config = self._prepare(chain, inputs, config)
+        wait = await asyncio.to_thread(self.reserve, estimated)
+        if wait > 0:
+            logger.info(f"Waiting {wait:.2f}s for OpenAI rate limit capacity")
+            await asyncio.sleep(wait)
+        result = await chain.ainvoke(inputs, config=config)
+        await asyncio.to_thread(self.reconcile, estimated, usage.total_tokens)
+        return result
+
+
+openai_rate_limiter = OpenAIRateLimiter()
@@ -0,0 +1,45 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> redis.Redis:
+    """
+    Returns the process-wide Redis client for settings.REDIS_URL.
+
+    The client owns a connection pool, so every caller in the process shares
+    the same sockets. redis-py resets the pool after a fork, which keeps this
+    safe to call from prefork Celery workers.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _client
+
+
+def get_async_redis() -> aioredis.Redis:
+    """
+    Returns the asyncio Redis client for settings.REDIS_URL shared by the
+    coroutines of the running event loop.
+
+    asyncio connections belong to the loop that opened them, so there is one
+    client (and connection pool) per loop: one per process under ASGI.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        )
+    return client
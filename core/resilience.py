@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Callable
+
+import httpx
+import openai
+import redis
+import requests
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+# Admits a call unless the breaker is open. After the cooldown one caller is
+# let through as a probe (half open); others are rejected until it reports back.
+# KEYS[1] = breaker hash; ARGV = now, cooldown (how long a probe may take)
+# Returns {allowed (1/0), seconds until calls may be admitted again, probe (1/0)}
+_ALLOW_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state or state == 'closed' then
+    return {1, '0', 0}
+end
+local now = tonumber(ARGV[1])
+local retry_at = tonumber(redis.call('HGET', KEYS[1], 'retry_at'))
+if now < retry_at then
+    return {0, tostring(retry_at - now), 0}
+end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'retry_at', tostring(now + tonumber(ARGV[2])))
+return {1, '0', 1}
+"""
+
+# Counts a failure. Enough failures within the window, or a failed probe, open the breaker.
+# KEYS[1] = breaker hash; ARGV = now, threshold, window, cooldown
+# Returns 1 if the breaker is open
+_FAILURE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local threshold = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local state = redis.call('HGET', KEYS[1], 'state')
+if state == 'open' then
+    return 1
+end
+local failures = threshold
+if state ~= 'half_open' then
+    local since = tonumber(redis.call('HGET', KEYS[1], 'since'))
+    if since and now - since <= window then
+        failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+    else
+        failures = 1
+        redis.call('HSET', KEYS[1], 'since', tostring(now), 'failures', 1)
+    end
+end
+if failures >= threshold then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'retry_at', tostring(now + tonumber(ARGV[4])))
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[4]) + window))
+    return 1
+end
+redis.call('HSET', KEYS[1], 'state', 'closed')
+redis.call('EXPIRE', KEYS[1], window)
+return 0
+"""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Reports whether an upstream error is worth retrying: connection errors,
+    timeouts, 429 and 5xx responses. Other 4xx responses are the caller's fault.
+    """
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    status_code = getattr(exc, 'status_code', None) or getattr(getattr(exc, 'response', None), 'status_code', None)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped.
+    """
+    return random.uniform(0, min(settings.UPSTREAM_RETRY_MAX_DELAY, settings.UPSTREAM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker for one upstream, with its state shared in Redis.
+
+    After CIRCUIT_BREAKER_FAILURE_THRESHOLD transient failures within
+    CIRCUIT_BREAKER_WINDOW seconds, every worker stops calling the upstream for
+    CIRCUIT_BREAKER_COOLDOWN seconds. Then a single probe call is let through;
+    its success closes the breaker and its failure opens it again. Other
+    successes leave the failure count alone, so failures interleaved with
+    successes still open the breaker once enough of them fall within the
+    window; older failures age out of it. Rejections
+    are also remembered in-process so an open breaker costs no Redis round
+    trip. When Redis is unavailable the breaker stays closed.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._open_until = 0.0
+        self._allow_script = None
+        self._failure_script = None
+
+    @property
+    def key(self) -> str:
+        return f"circuit:{self.name}"
+
+    def allow(self) -> bool:
+        """
+        Returns:
+            bool: True if this call is the half-open probe, whose outcome decides the breaker
+
+        Raises:
+            CircuitOpenError: If the upstream must not be called right now
+        """
+        now = time.time()
+        if now < self._open_until:
+            raise CircuitOpenError(self.name, self._open_until - now)
+        try:
+            client = get_redis()
+            if self._allow_script is None:
+                self._allow_script = client.register_script(_ALLOW_SCRIPT)
+            allowed, retry_after, probe = self._allow_script(
+                keys=[self.key], args=[now, settings.CIRCUIT_BREAKER_COOLDOWN]
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Circuit breaker {self.name} unavailable, allowing call: {str(e)}")
+            return False
+        if not allowed:
+            retry_after = float(retry_after)
+            self._open_until = now + retry_after
+            raise CircuitOpenError(self.name, retry_after)
+        return bool(probe)
+
+    def retry_after(self) -> float:
+        """
+        Returns the seconds until the breaker admits calls again, 0 if it is closed.
+        Unlike ``allow`` this never claims the half-open probe.
+        """
+        now = time.time()
+        if now < self._open_until:
+            return self._open_until - now
+        try:
+            state, retry_at = get_redis().hmget(self.key, 'state', 'retry_at')
+        except redis.RedisError:
+            return 0.0
+        if state in (b'open', b'half_open') and retry_at is not None:
+            return max(float(retry_at) - now, 0.0)
+        return 0.0
+
+    def record_success(self, probe: bool) -> None:
+        """
+        Closes the breaker after a successful probe. Any other success changes nothing.
+        """
+        if not probe:
+            return
+        self._open_until = 0.0
+        try:
+            get_redis().delete(self.key)
+        except redis.RedisError as e:
+            logger.warning(f"Could not reset circuit breaker {self.name}: {str(e)}")
+
+    def record_failure(self) -> None:
+        try:
+            client = get_redis()
+            if self._failure_script is None:
+                self._failure_script = client.register_script(_FAILURE_SCRIPT)
+            opened = self._failure_script(
+                keys=[self.key],
+                args=[
+                    time.time(), settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                    settings.CIRCUIT_BREAKER_WINDOW, settings.CIRCUIT_BREAKER_COOLDOWN
+                ],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Could not record failure for circuit breaker {self.name}: {str(e)}")
+            return
+        if opened:
+            logger.error(f"Circuit breaker {self.name} is open for {settings.CIRCUIT_BREAKER_COOLDOWN}s")
+
+    def call(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Calls ``func`` with retries: transient failures are retried with
+        jittered exponential backoff up to UPSTREAM_RETRY_ATTEMPTS times, and
+        each one counts towards opening the breaker.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, before or between attempts
+        """
+        attempt = 0
+        while True:
+            probe = self.allow()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                self.record_failure()
+                attempt += 1
+                if attempt >= settings.UPSTREAM_RETRY_ATTEMPTS:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{self.name} call failed ({str(e)}), retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self.record_success(probe)
+            return result
+
+    async def acall(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Async counterpart of ``call`` for coroutine functions; Redis calls run in threads.
+        """
+        attempt = 0
+        while True:
+            probe = await asyncio.to_thread(self.allow)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                await asyncio.to_thread(self.record_failure)
+                attempt += 1
+                if attempt >= settings.UPSTREAM_RETRY_ATTEMPTS:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{self.name} call failed ({str(e)}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            if probe:
+                await asyncio.to_thread(self.record_success, probe)
+            return result
+
+
+openai_breaker = CircuitBreaker('openai')
+instacart_breaker = CircuitBreaker('instacart')
@@ -166,19 +166,24 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.JWTAuthentication',
+        'users.authentication.ProfileTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Sliding windows in Redis, shared by every worker (see core.throttling)
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'core.throttling.AnonSlidingWindowThrottle',
+        'core.throttling.UserSlidingWindowThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/day',
-        'user': '1000/day'
+        'anon': os.environ.get('THROTTLE_RATE_ANON', '100/day'),
+        'user': os.environ.get('THROTTLE_RATE_USER', '1000/day'),
+        'register': os.environ.get('THROTTLE_RATE_REGISTER', '5/hour'),
+        'login': os.environ.get('THROTTLE_RATE_LOGIN', '5/minute'),
+        'email_verification': os.environ.get('THROTTLE_RATE_EMAIL_VERIFICATION', '3/hour'),
     }
 }
 
@@ -191,6 +196,33 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Redis client used for caches, locks and task status records
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', '2'))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '5'))
+
+# Meal plan cache: identical preferences/restrictions/budget reuse a generated plan
+MEAL_PLAN_CACHE_ENABLED = os.environ.get('MEAL_PLAN_CACHE_ENABLED', 'True').lower() == 'true'
+MEAL_PLAN_CACHE_TTL = int(os.environ.get('MEAL_PLAN_CACHE_TTL', str(60 * 60 * 24 * 7)))  # 7 days
+MEAL_PLAN_CACHE_MAX_ENTRIES = int(os.environ.get('MEAL_PLAN_CACHE_MAX_ENTRIES', '10000'))
+MEAL_PLAN_CACHE_LOCAL_SIZE = int(os.environ.get('MEAL_PLAN_CACHE_LOCAL_SIZE', '256'))
+MEAL_PLAN_CACHE_LOCAL_TTL = int(os.environ.get('MEAL_PLAN_CACHE_LOCAL_TTL', '300'))
+MEAL_PLAN_CACHE_STATS_FLUSH_INTERVAL = float(os.environ.get('MEAL_PLAN_CACHE_STATS_FLUSH_INTERVAL', '10'))
+
+# Authenticated user cache: opaque access token -> user and profile snapshot
+AUTH_CACHE_ENABLED = os.environ.get('AUTH_CACHE_ENABLED', 'True').lower() == 'true'
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', '900'))
+AUTH_CACHE_LOCAL_SIZE = int(os.environ.get('AUTH_CACHE_LOCAL_SIZE', '1024'))
+AUTH_CACHE_LOCAL_TTL = int(os.environ.get('AUTH_CACHE_LOCAL_TTL', '5'))
+
+# Ingredient -> Instacart product mappings (database table with an in-process LRU in front)
+PRODUCT_MAPPING_CACHE_SIZE = int(os.environ.get('PRODUCT_MAPPING_CACHE_SIZE', '4096'))
+PRODUCT_MAPPING_CACHE_TTL = int(os.environ.get('PRODUCT_MAPPING_CACHE_TTL', '600'))
+
+# Stored meal plan text: 'zstd' (falls back to zlib without the zstandard package), 'zlib' or 'none'
+MEAL_PLAN_COMPRESSION = os.environ.get('MEAL_PLAN_COMPRESSION', 'zstd').lower()
+MEAL_PLAN_COMPRESSION_LEVEL = int(os.environ.get('MEAL_PLAN_COMPRESSION_LEVEL', '6'))
+MEAL_PLAN_COMPRESSION_MIN_SIZE = int(os.environ.get('MEAL_PLAN_COMPRESSION_MIN_SIZE', '256'))
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -251,6 +283,83 @@ OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 INSTACART_API_KEY = os.environ.get('INSTACART_API_KEY')
 INSTACART_API_SECRET = os.environ.get('INSTACART_API_SECRET')
 
+# Access tokens: 'opaque' (DRF tokens, one database lookup per request) or 'jwt'
+# (short-lived signed tokens checked without the database). Both kinds are accepted.
+ACCESS_TOKEN_MODE = os.environ.get('ACCESS_TOKEN_MODE', 'opaque')
+# JWT signing keys as "kid:secret,kid:secret"; the first signs new tokens, all verify
+JWT_SIGNING_KEYS = dict(
+    entry.split(':', 1) for entry in os.environ.get('JWT_SIGNING_KEYS', '').split(',') if ':' in entry
+) or {'default': SECRET_KEY or ''}
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+JWT_ACCESS_TOKEN_TTL = int(os.environ.get('JWT_ACCESS_TOKEN_TTL', '900'))  # 15 minutes
+# Revoked (logged out) access tokens are checked against a per-process Bloom filter
+JWT_REVOCATION_CHECK = os.environ.get('JWT_REVOCATION_CHECK', 'True').lower() == 'true'
+JWT_REVOCATION_REFRESH = int(os.environ.get('JWT_REVOCATION_REFRESH', '10'))
+
+# Refresh tokens live in Redis for this many seconds after their last use
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', str(60 * 60 * 24 * 30)))  # 30 days
+# A rotated refresh token is still accepted this many seconds later (concurrent refreshes)
+REFRESH_TOKEN_REUSE_GRACE = int(os.environ.get('REFRESH_TOKEN_REUSE_GRACE', '10'))
+# Also record issued and revoked token families in the database (users.RefreshToken)
+REFRESH_TOKEN_AUDIT = os.environ.get('REFRESH_TOKEN_AUDIT', 'False').lower() == 'true'
+
+# Meal planning LLM (one chain is kept per Celery worker process)
+MEAL_PLAN_LLM_MODEL = os.environ.get('MEAL_PLAN_LLM_MODEL', 'gpt-4o-mini')
+MEAL_PLAN_LLM_TEMPERATURE = float(os.environ.get('MEAL_PLAN_LLM_TEMPERATURE', '0.7'))
+MEAL_PLAN_LLM_WARMUP = os.environ.get('MEAL_PLAN_LLM_WARMUP', 'True').lower() == 'true'
+
+# A profile's in-flight generation lock expires after this many seconds if never released
+MEAL_PLAN_INFLIGHT_TTL = int(os.environ.get('MEAL_PLAN_INFLIGHT_TTL', '900'))
+
+# Task status records polled through /api/tasks/<task_id>/
+TASK_STATUS_TTL = int(os.environ.get('TASK_STATUS_TTL', str(60 * 60 * 24)))  # 1 day
+TASK_STATUS_MAX_WAIT = int(os.environ.get('TASK_STATUS_MAX_WAIT', '30'))
+TASK_STATUS_POLL_INTERVAL = float(os.environ.get('TASK_STATUS_POLL_INTERVAL', '0.5'))
+# Rolling per-stage latency samples behind task ETAs
+STAGE_LATENCY_SAMPLES = int(os.environ.get('STAGE_LATENCY_SAMPLES', '500'))
+STAGE_LATENCY_CACHE_TTL = int(os.environ.get('STAGE_LATENCY_CACHE_TTL', '30'))
+
+# Cluster-wide OpenAI quota shared by all workers (0 disables a limit)
+OPENAI_RPM_LIMIT = int(os.environ.get('OPENAI_RPM_LIMIT', '500'))
+OPENAI_TPM_LIMIT = int(os.environ.get('OPENAI_TPM_LIMIT', '200000'))
+# Calls that would wait longer than this for capacity fail instead
+OPENAI_RATE_LIMIT_MAX_WAIT = int(os.environ.get('OPENAI_RATE_LIMIT_MAX_WAIT', '300'))
+# Completion tokens reserved per call before the actual usage is known
+OPENAI_COMPLETION_TOKENS_ESTIMATE = int(os.environ.get('OPENAI_COMPLETION_TOKENS_ESTIMATE', '3000'))
+
+# Upstream (OpenAI, Instacart) timeouts in seconds
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', '5'))
+OPENAI_READ_TIMEOUT = float(os.environ.get('OPENAI_READ_TIMEOUT', '120'))
+INSTACART_CONNECT_TIMEOUT = float(os.environ.get('INSTACART_CONNECT_TIMEOUT', '3.05'))
+INSTACART_READ_TIMEOUT = float(os.environ.get('INSTACART_READ_TIMEOUT', '15'))
+# Transient upstream failures are retried with jittered exponential backoff
+UPSTREAM_RETRY_ATTEMPTS = int(os.environ.get('UPSTREAM_RETRY_ATTEMPTS', '3'))
+UPSTREAM_RETRY_BASE_DELAY = float(os.environ.get('UPSTREAM_RETRY_BASE_DELAY', '0.5'))
+UPSTREAM_RETRY_MAX_DELAY = float(os.environ.get('UPSTREAM_RETRY_MAX_DELAY', '8'))
+# Per-upstream circuit breakers shared by all workers through Redis
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5'))
+CIRCUIT_BREAKER_WINDOW = int(os.environ.get('CIRCUIT_BREAKER_WINDOW', '60'))
+CIRCUIT_BREAKER_COOLDOWN = int(os.environ.get('CIRCUIT_BREAKER_COOLDOWN', '30'))
+# How often a task is deferred while the OpenAI breaker is open before it fails
+CIRCUIT_BREAKER_MAX_DEFERRALS = int(os.environ.get('CIRCUIT_BREAKER_MAX_DEFERRALS', '5'))
+
+# 'single' generates the week in one completion, 'per_day' fans out one subtask per day (Celery chord),
+# 'async' runs the single-completion pipeline on a per-process asyncio event loop. 'async' only
+# overlaps generations when the worker runs with --pool threads: a prefork child runs one task
+# at a time, so its loop has a single generation in flight (the worker logs a warning at start-up)
+MEAL_PLAN_GENERATION_MODE = os.environ.get('MEAL_PLAN_GENERATION_MODE', 'single')
+# Maximum number of generations in flight on one worker process's event loop ('async' mode)
+MEAL_PLAN_ASYNC_CONCURRENCY = int(os.environ.get('MEAL_PLAN_ASYNC_CONCURRENCY', '50'))
+
+# Meal plan streaming: tokens are published to a Redis stream per task and relayed over SSE
+MEAL_PLAN_STREAMING = os.environ.get('MEAL_PLAN_STREAMING', 'True').lower() == 'true'
+MEAL_PLAN_STREAM_TTL = int(os.environ.get('MEAL_PLAN_STREAM_TTL', '3600'))
+MEAL_PLAN_STREAM_MAXLEN = int(os.environ.get('MEAL_PLAN_STREAM_MAXLEN', '5000'))
+MEAL_PLAN_STREAM_FLUSH_CHARS = int(os.environ.get('MEAL_PLAN_STREAM_FLUSH_CHARS', '64'))
+MEAL_PLAN_STREAM_FLUSH_INTERVAL = float(os.environ.get('MEAL_PLAN_STREAM_FLUSH_INTERVAL', '0.1'))
+MEAL_PLAN_STREAM_KEEPALIVE = int(os.environ.get('MEAL_PLAN_STREAM_KEEPALIVE', '15'))
+MEAL_PLAN_STREAM_MAX_DURATION = int(os.environ.get('MEAL_PLAN_STREAM_MAX_DURATION', '300'))
+
 # LangChain Configuration
 LANGCHAIN_TRACING_V2 = True
 LANGCHAIN_ENDPOINT = "https://api.smith.langchain.com"
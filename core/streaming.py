@@ -0,0 +1,209 @@
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from langchain.callbacks.base import BaseCallbackHandler
+
+from .redis_client import get_redis
+from .task_status import task_status
+
+logger = logging.getLogger('core.tasks')
+
+TERMINAL_EVENTS = ('done', 'error')
+
+
+def stream_key(task_id: str) -> str:
+    return f"meal_plan:stream:{task_id}"
+
+
+class MealPlanStreamPublisher:
+    """
+    Publishes meal plan generation events to a Redis stream keyed by task id.
+
+    Events are ``start``, ``stage`` (the pipeline moved to another stage),
+    ``chunk`` (a piece of generated text), ``reset`` (discard the text
+    streamed so far, the completion is being retried), ``done`` and ``error``. Tokens are buffered briefly so a long completion does not cost
+    one Redis round trip per token. Publishing is best effort: failures are
+    logged and never interrupt the generation itself. Lifecycle events also
+    update the task's status record (see core.task_status), streaming or not.
+    """
+
+    def __init__(self, task_id: Optional[str], profile_id: int):
+        self.task_id = task_id
+        self.profile_id = profile_id
+        self._buffer = []
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.task_id) and settings.MEAL_PLAN_STREAMING
+
+    def _publish(self, event: str, data: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        key = stream_key(self.task_id)
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.xadd(
+                key,
+                {'event': event, 'data': json.dumps(data)},
+                maxlen=settings.MEAL_PLAN_STREAM_MAXLEN,
+                approximate=True
+            )
+            pipe.expire(key, settings.MEAL_PLAN_STREAM_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish '{event}' event for task {self.task_id}: {str(e)}")
+
+    def start(self) -> None:
+        task_status.enter_stage(self.task_id, 'llm', 'Generating meal plan.', profile_id=self.profile_id)
+        self._publish('start', {'profile_id': self.profile_id})
+
+    def stage(self, name: str, message: str = None, sample: bool = True) -> None:
+        """
+        Moves the task to another pipeline stage (see core.task_status.STAGES).
+        ``sample=False`` keeps the stage being left out of the latency percentiles.
+        """
+        self.flush()
+        task_status.enter_stage(self.task_id, name, message, sample=sample)
+        self._publish('stage', {'stage': name})
+
+    def add_tokens(self, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        task_status.add_tokens(self.task_id, 'llm', prompt_tokens, completion_tokens)
+
+    def publish_chunk(self, text: str) -> None:
+        """
+        Buffers a piece of generated text and flushes it once enough has accumulated.
+        """
+        if not text or not self.enabled:
+            return
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if (self._buffered_chars >= settings.MEAL_PLAN_STREAM_FLUSH_CHARS or
+                time.monotonic() - self._last_flush >= settings.MEAL_PLAN_STREAM_FLUSH_INTERVAL):
+            self.flush()
+
+    def reset(self) -> None:
+        """
+        Drops buffered text and tells clients to discard what was streamed so far.
+        """
+        self._buffer = []
+        self._buffered_chars = 0
+        self._publish('reset', {})
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._publish('chunk', {'text': ''.join(self._buffer)})
+            self._buffer = []
+            self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+
+    def finish(self, **data: Any) -> None:
+        self.flush()
+        self._publish('done', data)
+        task_status.finish(self.task_id, 'completed', 'Meal plan ready.', **data)
+
+    def fail(self, message: str, state: str = 'failed') -> None:
+        self.flush()
+        self._publish('error', {'message': message})
+        task_status.finish(self.task_id, state, message)
+
+
+class RedisStreamCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback that forwards streamed LLM tokens to a MealPlanStreamPublisher
+    and records the completion's token usage on the task.
+
+    OpenAI reports no usage for streamed completions, so streamed tokens are
+    counted as they arrive instead. A retried completion starts over: the text
+    and tokens of the failed attempt are dropped.
+    """
+
+    def __init__(self, publisher: MealPlanStreamPublisher, stream_tokens: bool = True):
+        self.publisher = publisher
+        self.stream_tokens = stream_tokens
+        self.streamed_tokens = 0
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, **kwargs: Any) -> None:
+        if self.streamed_tokens and self.stream_tokens:
+            self.publisher.reset()
+        self.streamed_tokens = 0
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.streamed_tokens += 1
+        if self.stream_tokens:
+            self.publisher.publish_chunk(token)
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        if usage:
+            self.publisher.add_tokens(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+        else:
+            self.publisher.add_tokens(completion_tokens=self.streamed_tokens)
+
+
+def format_sse(event_id: str, event: str, data: str) -> str:
+    """
+    Formats a single Server-Sent Event. ``data`` must not contain newlines.
+    """
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+async def read_stream_events(task_id: str, last_id: str = '0-0'):
+    """
+    Asynchronously yields ``(event_id, event, data)`` tuples from a task's stream.
+
+    Yields None whenever no event arrived within the keep-alive interval, so the
+    caller can write a heartbeat. Stops after a terminal event or once
+    MEAL_PLAN_STREAM_MAX_DURATION has elapsed.
+    """
+    client = aioredis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT
+    )
+    deadline = time.monotonic() + settings.MEAL_PLAN_STREAM_MAX_DURATION
+    try:
+        while time.monotonic() < deadline:
+            response = await client.xread(
+                {stream_key(task_id): last_id},
+                count=100,
+                block=settings.MEAL_PLAN_STREAM_KEEPALIVE * 1000
+            )
+            if not response:
+                yield None
+                continue
+            for _key, entries in response:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    event = fields[b'event'].decode('utf-8')
+                    yield entry_id.decode('utf-8'), event, fields.get(b'data', b'{}').decode('utf-8')
+                    if event in TERMINAL_EVENTS:
+                        return
+    finally:
+        await client.aclose()
+
+
+async def get_stream_owner(task_id: str) -> Optional[int]:
+    """
+    Returns the profile id recorded in a task's ``start`` event, or None if the
+    stream has not started yet.
+    """
+    client = aioredis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT
+    )
+    try:
+        entries = await client.xrange(stream_key(task_id), count=1)
+    finally:
+        await client.aclose()
+    if not entries:
+        return None
+    _entry_id, fields = entries[0]
+    if fields.get(b'event') != b'start':
+        return None
+    return json.loads(fields[b'data']).get('profile_id')
@@ -0,0 +1,139 @@
+import logging
+import time
+from typing import NamedTuple, Optional
+
+import redis
+from django.conf import settings
+
+from .llm import MEAL_PLAN_PROMPT_VERSION
+from .meal_plan_cache import make_cache_key
+from .redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+# Claims the profile's in-flight slot unless another run holds it. In
+# supersede mode a run with different inputs is replaced.
+# KEYS[1] = lock hash; ARGV = task id, fingerprint, supersede (0/1), ttl, now
+# Returns {status, task id holding the lock, replaced task id}
+# status: 1 = acquired, 2 = superseded a previous run, 0 = another run holds it
+_ACQUIRE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'task_id')
+if current and not (ARGV[3] == '1' and redis.call('HGET', KEYS[1], 'fingerprint') ~= ARGV[2]) then
+    return {0, current, ''}
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'task_id', ARGV[1], 'fingerprint', ARGV[2], 'started_at', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if current then
+    return {2, ARGV[1], current}
+end
+return {1, ARGV[1], ''}
+"""
+
+# Deletes the lock only if the given task still owns it.
+# KEYS[1] = lock hash; ARGV[1] = task id
+_RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'task_id') == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def meal_plan_fingerprint(profile) -> str:
+    """
+    Hashes the profile inputs a generation depends on, so a changed request can be told apart.
+    """
+    return make_cache_key(
+        profile.preferences,
+        profile.dietary_restrictions,
+        profile.weekly_budget,
+        MEAL_PLAN_PROMPT_VERSION,
+        mode=settings.MEAL_PLAN_GENERATION_MODE
+    )
+
+
+class LockResult(NamedTuple):
+    acquired: bool
+    task_id: str
+    superseded_task_id: Optional[str] = None
+
+
+class MealPlanInFlightLock:
+    """
+    One in-flight meal plan generation per profile, tracked in Redis.
+
+    The lock records the owning task id and a fingerprint of the inputs it
+    was started with. A second trigger joins the running task instead of
+    queueing another one; in supersede mode a trigger with changed inputs
+    takes the lock over, and the replaced run notices before it stores its
+    result. The lock expires after MEAL_PLAN_INFLIGHT_TTL in case a worker
+    dies without releasing it. When Redis is unavailable nothing is locked.
+    """
+
+    def __init__(self):
+        self._acquire_script = None
+        self._release_script = None
+
+    @staticmethod
+    def _key(profile_id: int) -> str:
+        return f"meal_plan:inflight:{profile_id}"
+
+    def acquire(self, profile_id: int, task_id: str, fingerprint: str, supersede: bool = False) -> LockResult:
+        """
+        Claims the profile's in-flight slot for a task that is about to be enqueued.
+
+        Args:
+            profile_id: The profile to generate a meal plan for
+            task_id: The id the new task will be enqueued with
+            fingerprint: Hash of the generation inputs (see meal_plan_fingerprint)
+            supersede: Replace a running generation whose inputs differ
+
+        Returns:
+            LockResult: Whether the caller should enqueue, and the task id the client should follow
+        """
+        try:
+            client = get_redis()
+            if self._acquire_script is None:
+                self._acquire_script = client.register_script(_ACQUIRE_SCRIPT)
+            status, owner, replaced = self._acquire_script(
+                keys=[self._key(profile_id)],
+                args=[task_id, fingerprint, int(supersede), settings.MEAL_PLAN_INFLIGHT_TTL, time.time()],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Could not lock meal plan generation for profile {profile_id}: {str(e)}")
+            return LockResult(True, task_id)
+
+        owner = owner.decode('utf-8')
+        if status == 0:
+            return LockResult(False, owner)
+        return LockResult(True, owner, replaced.decode('utf-8') if status == 2 else None)
+
+    def release(self, profile_id: int, task_id: Optional[str]) -> None:
+        """
+        Releases the profile's lock if it is still owned by the given task.
+        """
+        if not task_id:
+            return
+        try:
+            client = get_redis()
+            if self._release_script is None:
+                self._release_script = client.register_script(_RELEASE_SCRIPT)
+            self._release_script(keys=[self._key(profile_id)], args=[task_id])
+        except redis.RedisError as e:
+            logger.warning(f"Could not release meal plan lock for profile {profile_id}: {str(e)}")
+
+    def is_superseded(self, profile_id: int, task_id: Optional[str]) -> bool:
+        """
+        Reports whether another task has taken over the profile's lock.
+        """
+        if not task_id:
+            return False
+        try:
+            owner = get_redis().hget(self._key(profile_id), 'task_id')
+        except redis.RedisError:
+            return False
+        return owner is not None and owner.decode('utf-8') != task_id
+
+
+meal_plan_inflight_lock = MealPlanInFlightLock()
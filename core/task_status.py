@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import redis
+from django.conf import settings
+
+from .lru import LRUCache
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger('core.tasks')
+
+TERMINAL_STATES = ('completed', 'failed', 'superseded')
+
+# Pipeline stages in order; a task's state is its current stage until it ends
+STAGES = ('queued', 'llm', 'parsing', 'cart')
+STAGE_PROGRESS = {'queued': 0, 'llm': 10, 'parsing': 70, 'cart': 85}
+
+
+def status_key(task_id: str) -> str:
+    return f"meal_plan:task:{task_id}"
+
+
+def latency_key(kind: str, stage: str) -> str:
+    return f"meal_plan:stage_latency:{kind}:{stage}"
+
+
+def _decode(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+    record = {}
+    stages = {}
+    for key, value in raw.items():
+        key, value = key.decode('utf-8'), value.decode('utf-8')
+        if key.startswith('stage:'):
+            # Flat 'stage:<name>:<field>' hash fields become record['stages'][name][field]
+            _, stage, field = key.split(':', 2)
+            stages.setdefault(stage, {})[field] = int(value) if field.endswith('_tokens') else float(value)
+        else:
+            record[key] = value
+    for field in ('profile_id', 'version', 'progress'):
+        if field in record:
+            record[field] = int(record[field])
+    for field in ('updated_at', 'stage_started_at', 'eta_at'):
+        if field in record:
+            record[field] = float(record[field])
+    if 'result' in record:
+        record['result'] = json.loads(record['result'])
+    record['stages'] = {stage: stages[stage] for stage in STAGES if stage in stages}
+    if 'eta_at' in record:
+        record['eta_seconds'] = round(max(record['eta_at'] - time.time(), 0), 1)
+    return record
+
+
+def _percentile(sorted_values, percent: float) -> float:
+    # Nearest-rank percentile of an ascending list
+    index = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class TaskStatusStore:
+    """
+    Compact per-task status records in Redis, so clients can follow a meal
+    plan generation without reading the profile from the database.
+
+    A record is a hash with the owning profile, a state, a progress
+    percentage, a message and a version that is incremented on every update.
+    Writes are best effort: failures are logged and never fail a task.
+
+    Tasks move through STAGES (queued -> llm -> parsing -> cart) and end as
+    completed or failed. Each stage records its start, end and duration, and
+    the llm stage its token counts. Finished stage durations are kept as
+    rolling samples per task kind, whose percentiles give every task an ETA.
+    """
+
+    def __init__(self):
+        self._percentiles = LRUCache(maxsize=16, ttl=settings.STAGE_LATENCY_CACHE_TTL)
+
+    def _write(self, task_id: str, fields: Dict[str, Any]) -> None:
+        if not task_id:
+            return
+        key = status_key(task_id)
+        fields = {
+            name: json.dumps(value) if name == 'result' else str(value)
+            for name, value in fields.items() if value is not None
+        }
+        fields['updated_at'] = str(time.time())
+        try:
+            pipe = get_redis().pipeline()
+            pipe.hset(key, mapping=fields)
+            pipe.hincrby(key, 'version', 1)
+            pipe.expire(key, settings.TASK_STATUS_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not update status of task {task_id}: {str(e)}")
+
+    def create(self, task_id: str, profile_id: int, kind: str = 'generate') -> None:
+        """
+        Records a newly enqueued task.
+        """
+        now = time.time()
+        self._write(task_id, {
+            'task_id': task_id, 'profile_id': profile_id, 'kind': kind,
+            'state': 'queued', 'progress': 0, 'message': 'Waiting for a worker.',
+            'stage_started_at': now, 'stage:queued:started_at': now,
+            'eta_at': now + self.estimate_remaining(kind, 'queued', 0),
+        })
+
+    def _end_stage(self, task_id: str, sample: bool) -> Dict[str, Any]:
+        """
+        Returns the fields that close the task's current stage, recording its
+        duration as a latency sample unless ``sample`` is False.
+        """
+        try:
+            state, kind, started_at = get_redis().hmget(status_key(task_id), 'state', 'kind', 'stage_started_at')
+        except redis.RedisError as e:
+            logger.warning(f"Could not read status of task {task_id}: {str(e)}")
+            return {}
+        state = state.decode('utf-8') if state else None
+        if state not in STAGES or started_at is None:
+            return {}
+        now = time.time()
+        duration = max(now - float(started_at), 0.0)
+        if sample:
+            self.record_latency(kind.decode('utf-8') if kind else 'generate', state, duration)
+        return {f'stage:{state}:ended_at': now, f'stage:{state}:duration': round(duration, 3)}
+
+    def enter_stage(self, task_id: Optional[str], stage: str, message: str = None,
+                    profile_id: int = None, sample: bool = True) -> None:
+        """
+        Ends the task's current stage and starts ``stage``.
+
+        Args:
+            task_id: The task to update
+            stage: One of STAGES
+            message: Human readable description of the stage
+            profile_id: The owning profile, if the record may not exist yet
+            sample: Whether the stage being ended counts towards latency percentiles
+                (False e.g. for an llm stage answered from the cache)
+        """
+        if not task_id:
+            return
+        fields = self._end_stage(task_id, sample)
+        now = time.time()
+        kind = self._kind(task_id)
+        fields.update({
+            'state': stage, 'progress': STAGE_PROGRESS[stage], 'message': message, 'profile_id': profile_id,
+            'stage_started_at': now, f'stage:{stage}:started_at': now,
+            'eta_at': now + self.estimate_remaining(kind, stage, 0),
+        })
+        self._write(task_id, fields)
+
+    def add_tokens(self, task_id: Optional[str], stage: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        """
+        Adds token counts to a stage (several per-day subtasks may report into one llm stage).
+        """
+        if not task_id or not (prompt_tokens or completion_tokens):
+            return
+        try:
+            pipe = get_redis().pipeline()
+            pipe.hincrby(status_key(task_id), f'stage:{stage}:prompt_tokens', prompt_tokens)
+            pipe.hincrby(status_key(task_id), f'stage:{stage}:completion_tokens', completion_tokens)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not record token usage of task {task_id}: {str(e)}")
+
+    def finish(self, task_id: Optional[str], state: str, message: str = None, **result: Any) -> None:
+        """
+        Ends the task's current stage and moves it to a terminal state.
+        """
+        if not task_id:
+            return
+        fields = self._end_stage(task_id, sample=state == 'completed')
+        fields.update({'state': state, 'message': message, 'eta_at': time.time()})
+        if state == 'completed':
+            fields['progress'] = 100
+        if result:
+            fields['result'] = result
+        self._write(task_id, fields)
+
+    def _kind(self, task_id: str) -> str:
+        try:
+            kind = get_redis().hget(status_key(task_id), 'kind')
+        except redis.RedisError:
+            kind = None
+        return kind.decode('utf-8') if kind else 'generate'
+
+    def record_latency(self, kind: str, stage: str, seconds: float) -> None:
+        key = latency_key(kind, stage)
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.lpush(key, round(seconds, 3))
+            pipe.ltrim(key, 0, settings.STAGE_LATENCY_SAMPLES - 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not record {stage} latency: {str(e)}")
+
+    def latency_percentiles(self, kind: str = 'generate') -> Dict[str, Dict[str, float]]:
+        """
+        Returns p50/p90/p99 latencies of the last STAGE_LATENCY_SAMPLES runs of each stage.
+        Results are cached in-process for STAGE_LATENCY_CACHE_TTL seconds.
+        """
+        percentiles = self._percentiles.get(kind)
+        if percentiles is not None:
+            return percentiles
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for stage in STAGES:
+                pipe.lrange(latency_key(kind, stage), 0, -1)
+            samples = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not read stage latencies: {str(e)}")
+            return {}
+        percentiles = {}
+        for stage, values in zip(STAGES, samples):
+            if values:
+                values = sorted(float(value) for value in values)
+                percentiles[stage] = {
+                    'p50': _percentile(values, 50),
+                    'p90': _percentile(values, 90),
+                    'p99': _percentile(values, 99),
+                    'samples': len(values),
+                }
+        self._percentiles.set(kind, percentiles)
+        return percentiles
+
+    def estimate_remaining(self, kind: str, stage: str, elapsed: float) -> float:
+        """
+        Estimates the seconds left for a task that has spent ``elapsed`` seconds
+        in ``stage``: the median of the current stage's remainder plus the
+        medians of the stages after it.
+        """
+        percentiles = self.latency_percentiles(kind)
+        if stage not in STAGES:
+            return 0.0
+        medians = {name: values['p50'] for name, values in percentiles.items()}
+        remaining = max(medians.get(stage, 0.0) - elapsed, 0.0)
+        return remaining + sum(medians.get(name, 0.0) for name in STAGES[STAGES.index(stage) + 1:])
+
+    def update(self, task_id: Optional[str], state: str = None, progress: int = None,
+               message: str = None, profile_id: int = None, **result: Any) -> None:
+        """
+        Updates a task's state. Other keyword arguments are stored as the task result.
+        """
+        fields = {'state': state, 'progress': progress, 'message': message, 'profile_id': profile_id}
+        if result:
+            fields['result'] = result
+        self._write(task_id, fields)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = get_redis().hgetall(status_key(task_id))
+        except redis.RedisError as e:
+            logger.warning(f"Could not read status of task {task_id}: {str(e)}")
+            return None
+        return _decode(raw) if raw else None
+
+    async def wait_for_change(self, task_id: str, version: Optional[int], timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Long-polls a task's record until its version differs from ``version``,
+        it reaches a terminal state, or ``timeout`` seconds pass.
+
+        Returns:
+            Optional[Dict]: The latest record, or None if the task is unknown
+        """
+        client = get_async_redis()
+        deadline = time.monotonic() + timeout
+        while True:
+            raw = await client.hgetall(status_key(task_id))
+            record = _decode(raw) if raw else None
+            if (record is None or record.get('version') != version or
+                    record.get('state') in TERMINAL_STATES or time.monotonic() >= deadline):
+                return record
+            await asyncio.sleep(settings.TASK_STATUS_POLL_INTERVAL)
+
+
+task_status = TaskStatusStore()
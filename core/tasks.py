@@ -1,60 +1,43 @@
-from celery import shared_task
+from celery import chord, shared_task
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
 import os
+import random
 from users.models import Profile
+from api.models import Ingredient, MealPlan
 import logging
 from typing import Dict, List, Optional
-from langchain.prompts import PromptTemplate
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import LLMChain
 import json
+from .ingredients import build_shopping_list, from_base_quantity, to_base_quantity
 from .instacart_client import InstacartClient
+from .llm import (
+    MEAL_PLAN_DAY_PROMPT_VERSION, MEAL_PLAN_PROMPT_VERSION, create_meal_planning_chain,
+    meal_plan_day_chain_pool, meal_plan_patch_chain_pool, meal_planning_chain_pool
+)
+from .meal_plan_cache import make_cache_key, meal_plan_cache
+from .meal_plan_schema import (
+    DAYS as MEAL_PLAN_DAYS, MealPlanSchemaError, load_json_response, matches_target, parse_meal_plan,
+    render_day_plan, render_meal_plan, validate_day_plan, validate_meal_plan
+)
+from .product_mapping import product_mapping_cache
+from .rate_limiter import openai_rate_limiter
+from .resilience import instacart_breaker, openai_breaker
+from .streaming import MealPlanStreamPublisher, RedisStreamCallbackHandler
+from .task_locks import meal_plan_inflight_lock
+from .task_status import task_status
 
 logger = logging.getLogger('core.tasks')
 
-def create_meal_planning_chain():
-    """
-    Creates a LangChain chain for meal planning using OpenAI.
-    Uses a simple LLMChain approach instead of complex agents to avoid parsing errors.
-    """
-    llm = ChatOpenAI(
-        temperature=0.7,
-        model_name="gpt-4o-mini",  # Use a valid model name
-        openai_api_key=os.getenv('OPENAI_API_KEY')
-    )
-    
-    template = """You are a meal planning assistant. Create a detailed weekly meal plan based on the user's preferences and dietary restrictions.
-
-User Preferences: {preferences}
-Dietary Restrictions: {dietary_restrictions}
-Budget: ${budget}
-
-Please create a comprehensive meal plan that:
-1. Stays within the specified budget
-2. Respects all dietary restrictions
-3. Matches user preferences
-4. Includes 7 days of meals (breakfast, lunch, dinner)
-5. Provides a complete ingredient list with quantities
-6. Includes estimated total cost
-7. Provides simple cooking instructions
-
-Format your response as a structured meal plan with clear sections for each day and a summary of ingredients needed.
-
-Meal Plan:"""
-
-    prompt = PromptTemplate(
-        template=template,
-        input_variables=["preferences", "dietary_restrictions", "budget"]
-    )
-    
-    return LLMChain(llm=llm, prompt=prompt)
-
-def create_instacart_cart(meal_plan: str, profile: Profile) -> str:
+def create_instacart_cart(meal_plan: str, profile: Profile, ingredients: Optional[List[Dict]] = None) -> str:
     """
     Creates an Instacart shopping cart based on the meal plan.
     
     Args:
         meal_plan: The generated meal plan text
         profile: User profile with location information
+        ingredients: Aggregated ingredients for the plan; extracted from the
+            meal plan text when not given
         
     Returns:
         str: URL to the created Instacart cart
@@ -74,29 +57,22 @@ def create_instacart_cart(meal_plan: str, profile: Profile) -> str:
         logger.info(f"🔍 DEBUG: Instacart client created with base URL: {client.base_url}")
         logger.info(f"🔍 DEBUG: Client headers: {dict(client.session.headers)}")
         
-        # Extract ingredients from meal plan (simplified for now)
-        # In a real implementation, you'd parse the meal plan text to extract ingredients
-        ingredients = [
-            {"name": "Chicken Breast", "quantity": 2, "unit": "lb"},
-            {"name": "Rice", "quantity": 1, "unit": "bag"},
-            {"name": "Broccoli", "quantity": 1, "unit": "bunch"},
-            {"name": "Olive Oil", "quantity": 1, "unit": "bottle"},
-            {"name": "Garlic", "quantity": 3, "unit": "cloves"},
-            {"name": "Onion", "quantity": 2, "unit": "each"},
-            {"name": "Tomatoes", "quantity": 4, "unit": "each"},
-            {"name": "Pasta", "quantity": 1, "unit": "box"},
-            {"name": "Ground Beef", "quantity": 1, "unit": "lb"},
-            {"name": "Cheese", "quantity": 1, "unit": "block"}
-        ]
+        if ingredients is None:
+            ingredients = build_shopping_list(meal_plan)
+        if not ingredients:
+            logger.warning("No ingredients found in meal plan, skipping Instacart cart creation")
+            return "https://instacart.com/cart/mock-cart-url"
         
         # Create meal plan cart
         cart_title = f"Weekly Meal Plan for {profile.user.username}"
         logger.info(f"🔍 DEBUG: Creating cart with title: {cart_title}")
         logger.info(f"🔍 DEBUG: Ingredients count: {len(ingredients)}")
         
-        cart_response = client.create_meal_plan_cart(
+        cart_response = instacart_breaker.call(
+            client.create_meal_plan_cart,
             meal_plan_title=cart_title,
-            ingredients=ingredients
+            ingredients=ingredients,
+            products=resolve_cart_products(ingredients, profile)
         )
         
         logger.info(f"🔍 DEBUG: Cart response received: {cart_response}")
@@ -117,47 +93,135 @@ def create_instacart_cart(meal_plan: str, profile: Profile) -> str:
         # Return a mock URL for testing purposes
         return "https://instacart.com/cart/mock-cart-url"
 
-@shared_task
-def generate_meal_plan(profile_id):
+def resolve_cart_products(ingredients: List[Dict], profile: Profile) -> Dict[str, Dict]:
+    """
+    Looks up the stored product payloads for a cart's ingredients. Lookup
+    failures only cost the product filters, never the cart.
+    """
+    try:
+        return product_mapping_cache.resolve(
+            (item['name'] for item in ingredients), profile.dietary_restrictions
+        )
+    except Exception as e:
+        logger.warning(f"Could not resolve ingredient products: {str(e)}")
+        return {}
+
+def openai_unavailable(task) -> bool:
+    """
+    Defers a task while the OpenAI circuit breaker is open, so it does not
+    take a worker slot only to fail against an upstream that is down.
+    
+    Returns:
+        bool: True once the task has been deferred CIRCUIT_BREAKER_MAX_DEFERRALS
+            times and should fail instead
+        
+    Raises:
+        celery.exceptions.Retry: When the task has been rescheduled
+    """
+    retry_after = openai_breaker.retry_after()
+    if not retry_after:
+        return False
+    if task.request.retries >= settings.CIRCUIT_BREAKER_MAX_DEFERRALS:
+        return True
+    logger.warning(f"OpenAI circuit breaker is open, deferring task {task.request.id} by {retry_after:.0f}s")
+    task_status.update(task.request.id, message='Waiting for the meal planner to become available.')
+    # Jitter keeps deferred tasks from all coming back at the same moment
+    raise task.retry(
+        countdown=retry_after + random.uniform(0, settings.UPSTREAM_RETRY_MAX_DELAY),
+        max_retries=settings.CIRCUIT_BREAKER_MAX_DEFERRALS
+    )
+
+@shared_task(bind=True)
+def generate_meal_plan(self, profile_id):
+    if meal_plan_inflight_lock.is_superseded(profile_id, self.request.id):
+        # Replaced while queued and not dropped by the revoke; the newer run owns the profile
+        return discard_superseded_meal_plan(profile_id, MealPlanStreamPublisher(self.request.id, profile_id))
+    
+    if openai_unavailable(self):
+        logger.error(f"OpenAI unavailable, giving up on meal plan generation for profile {profile_id}")
+        Profile.objects.filter(id=profile_id).update(status='FAILED', updated_at=timezone.now())
+        MealPlanStreamPublisher(self.request.id, profile_id).fail("Meal planning is temporarily unavailable.")
+        meal_plan_inflight_lock.release(profile_id, self.request.id)
+        return f"OpenAI unavailable, meal plan generation for profile {profile_id} failed"
+    
+    if settings.MEAL_PLAN_GENERATION_MODE == 'async':
+        # Wait on the worker process's event loop; many task threads share it
+        from .async_pipeline import agenerate_meal_plan, pipeline_loop
+        try:
+            return pipeline_loop.run(agenerate_meal_plan(profile_id, self.request.id))
+        finally:
+            meal_plan_inflight_lock.release(profile_id, self.request.id)
+    
+    # A per-day run keeps the profile's in-flight lock until its chord callback finishes
+    keep_lock = False
     try:
         logger.info(f"Starting meal plan generation for profile {profile_id}")
         profile = Profile.objects.get(id=profile_id)
         logger.debug(f"Retrieved profile: {profile.user.username} with preferences: {profile.preferences}")
+        mark_profile_processing(profile)
         
-        # Create the meal planning chain
-        meal_planning_chain = create_meal_planning_chain()
-        logger.debug("Created meal planning chain")
+        # Generated text is streamed to clients through Redis as it arrives
+        publisher = MealPlanStreamPublisher(self.request.id, profile_id)
+        publisher.start()
+        
+        if settings.MEAL_PLAN_GENERATION_MODE == 'per_day':
+            # Plan each day in its own subtask and merge the results in a chord callback
+            chord(
+                generate_meal_plan_day.s(profile_id, day, self.request.id) for day in MEAL_PLAN_DAYS
+            )(merge_meal_plan_days.s(profile_id, self.request.id))
+            keep_lock = True
+            logger.info(f"Dispatched {len(MEAL_PLAN_DAYS)} per-day subtasks for profile {profile_id}")
+            return f"Dispatched per-day meal plan generation for profile ID: {profile_id}"
         
         try:
-            # Generate the meal plan
-            logger.info("Invoking meal planning chain")
-            result = meal_planning_chain.invoke({
-                "preferences": str(profile.preferences),
-                "dietary_restrictions": str(profile.dietary_restrictions),
-                "budget": str(profile.weekly_budget)
-            })
-            
-            meal_plan_text = result['text']
-            logger.info("Successfully generated meal plan")
+            cache_key = make_cache_key(
+                profile.preferences,
+                profile.dietary_restrictions,
+                profile.weekly_budget,
+                MEAL_PLAN_PROMPT_VERSION
+            )
+            response_text = meal_plan_cache.get(cache_key)
             
-            # Create Instacart cart
-            cart_url = create_instacart_cart(meal_plan_text, profile)
+            if response_text is not None:
+                logger.info(f"Meal plan cache hit for profile {profile_id}")
+                publisher.publish_chunk(response_text)
+                # A cache hit says nothing about LLM latency
+                publisher.stage('parsing', 'Reading the meal plan.', sample=False)
+                document = parse_meal_plan(response_text)
+            else:
+                # Reuse this worker process's meal planning chain
+                meal_planning_chain = meal_planning_chain_pool.get()
+                
+                # Generate the meal plan
+                logger.info("Invoking meal planning chain")
+                try:
+                    result = openai_breaker.call(openai_rate_limiter.invoke, meal_planning_chain, {
+                        "preferences": str(profile.preferences),
+                        "dietary_restrictions": str(profile.dietary_restrictions),
+                        "budget": str(profile.weekly_budget)
+                    }, config={"callbacks": [RedisStreamCallbackHandler(publisher)]})
+                except Exception as e:
+                    meal_planning_chain_pool.mark_failed(e)
+                    raise
+                
+                response_text = result['text']
+                publisher.stage('parsing', 'Reading the meal plan.')
+                # Only responses that match the schema are cached
+                document = parse_meal_plan(response_text)
+                meal_plan_cache.set(cache_key, response_text)
+                logger.info("Successfully generated meal plan")
             
-            # Update profile with generated data
-            profile.meal_plan = {
-                'plan': meal_plan_text,
-                'cart_url': cart_url,
-                'generated_at': str(profile.updated_at)
-            }
-            profile.status = 'COMPLETED'
-            profile.save()
+            if meal_plan_inflight_lock.is_superseded(profile_id, self.request.id):
+                return discard_superseded_meal_plan(profile_id, publisher)
+            store_meal_plan(profile, document, MEAL_PLAN_PROMPT_VERSION, publisher)
             
             return f"Successfully generated meal plan for profile ID: {profile_id} (User: {profile.user.username})"
             
         except Exception as e:
             logger.error(f"Error during meal plan generation: {str(e)}", exc_info=True)
             profile.status = 'FAILED'
-            profile.save()
+            profile.save(update_fields=['status', 'updated_at'])
+            publisher.fail("Meal plan generation failed.")
             return f"Error while generating meal plan for profile {profile_id}: {str(e)}"
             
     except Profile.DoesNotExist:
@@ -167,5 +231,302 @@ def generate_meal_plan(profile_id):
         logger.error(f"Unexpected error in generate_meal_plan: {str(e)}", exc_info=True)
         if 'profile' in locals():
             profile.status = 'FAILED'
-            profile.save()
-        return f"Unexpected error while generating meal plan for profile {profile_id}: {str(e)}" 
\ No newline at end of file
+            profile.save(update_fields=['status', 'updated_at'])
+        return f"Unexpected error while generating meal plan for profile {profile_id}: {str(e)}" 
+    finally:
+        if not keep_lock:
+            meal_plan_inflight_lock.release(profile_id, self.request.id)
+
+def mark_profile_processing(profile: Profile) -> None:
+    """
+    Marks a profile whose meal plan a worker has started generating.
+    """
+    profile.status = 'PROCESSING'
+    profile.updated_at = timezone.now()
+    Profile.objects.filter(id=profile.id).update(status=profile.status, updated_at=profile.updated_at)
+
+def discard_superseded_meal_plan(profile_id: int, publisher: MealPlanStreamPublisher) -> str:
+    """
+    Drops the result of a run that a newer request for the profile replaced,
+    leaving the profile to the newer run.
+    """
+    logger.info(f"Discarding meal plan for profile {profile_id}: superseded by a newer request")
+    publisher.fail("Superseded by a newer meal plan request.", state='superseded')
+    return f"Meal plan generation for profile {profile_id} was superseded"
+
+@shared_task
+def generate_meal_plans_batch(profile_ids):
+    """
+    Generates meal plans for several profiles concurrently on the worker's event loop,
+    occupying a single worker slot.
+    """
+    from .async_pipeline import agenerate_meal_plans, pipeline_loop
+    return pipeline_loop.run(agenerate_meal_plans(profile_ids))
+
+@shared_task
+def check_meal_planning_chain():
+    """
+    Reports the health of the meal planning chain in the worker process that runs it.
+    """
+    return meal_planning_chain_pool.health_check()
+
+def store_meal_plan(profile: Profile, document: Dict, prompt_version: str,
+                    publisher: Optional[MealPlanStreamPublisher] = None) -> MealPlan:
+    """
+    Persists a validated meal plan into the MealPlan/Meal/Ingredient tables,
+    creates the Instacart cart from the aggregated shopping list and marks the
+    profile as completed.
+    
+    Args:
+        profile: The profile the plan was generated for
+        document: A plan validated by core.meal_plan_schema
+        prompt_version: Version of the prompt that produced the plan
+        publisher: Stream publisher to notify when the plan is stored
+        
+    Returns:
+        MealPlan: The stored meal plan
+    """
+    meal_plan = MealPlan.create_from_document(profile, document, prompt_version)
+    shopping_list = meal_plan.shopping_list()
+    meal_plan_text = render_meal_plan(document, shopping_list)
+    
+    if publisher:
+        publisher.stage('cart', 'Creating the Instacart cart.')
+    meal_plan.cart_url = create_instacart_cart(meal_plan_text, profile, ingredients=shopping_list)
+    _complete_profile_meal_plan(profile, meal_plan, meal_plan_text)
+    if publisher:
+        publisher.finish(status=profile.status, cart_url=meal_plan.cart_url, meal_plan_id=meal_plan.id)
+    return meal_plan
+
+def _complete_profile_meal_plan(profile: Profile, meal_plan: MealPlan, meal_plan_text: str,
+                                changes: Optional[Dict] = None) -> None:
+    # Saves the rendered text and cart with the plan and marks the profile as completed
+    meal_plan.plan_text = meal_plan_text
+    meal_plan.changes = changes
+    meal_plan.save(update_fields=['cart_url', 'plan_body', 'changes'])
+    profile.status = 'COMPLETED'
+    profile.save(update_fields=['status', 'updated_at'])
+
+@shared_task(bind=True)
+def generate_meal_plan_day(self, profile_id, day, stream_task_id=None):
+    """
+    Plans a single day of a profile's week. Runs as one header task of the
+    per-day chord dispatched by generate_meal_plan.
+    
+    Returns:
+        Dict: The day plan as returned by the LLM, or a dict with an 'error' key on failure
+    """
+    try:
+        profile = Profile.objects.get(id=profile_id)
+        daily_budget = (profile.weekly_budget / 7).quantize(Decimal('0.01')) if profile.weekly_budget else None
+        
+        cache_key = make_cache_key(
+            profile.preferences,
+            profile.dietary_restrictions,
+            profile.weekly_budget,
+            MEAL_PLAN_DAY_PROMPT_VERSION,
+            day=day
+        )
+        response_text = meal_plan_cache.get(cache_key)
+        cache_hit = response_text is not None
+        
+        publisher = MealPlanStreamPublisher(stream_task_id, profile_id)
+        if not cache_hit:
+            if meal_plan_inflight_lock.is_superseded(profile_id, stream_task_id):
+                # Skip the LLM call; merge_meal_plan_days discards the run
+                return {'day': day, 'error': 'superseded'}
+            chain = meal_plan_day_chain_pool.get()
+            try:
+                # Days finish out of order, so only token usage is recorded while generating
+                result = openai_breaker.call(openai_rate_limiter.invoke, chain, {
+                    "day": day,
+                    "day_number": MEAL_PLAN_DAYS.index(day) + 1,
+                    "preferences": str(profile.preferences),
+                    "dietary_restrictions": str(profile.dietary_restrictions),
+                    "budget": str(daily_budget)
+                }, config={"callbacks": [RedisStreamCallbackHandler(publisher, stream_tokens=False)]})
+            except Exception as e:
+                meal_plan_day_chain_pool.mark_failed(e)
+                raise
+            response_text = result['text']
+        
+        day_plan = load_json_response(response_text)
+        day_plan['day'] = day
+        rendered_day = render_day_plan(validate_day_plan(day_plan))
+        if not cache_hit:
+            meal_plan_cache.set(cache_key, response_text)
+        
+        publisher.publish_chunk(rendered_day + '\n\n')
+        publisher.flush()
+        # The raw (JSON-serializable) day is returned; merge_meal_plan_days validates the full week
+        return day_plan
+        
+    except Exception as e:
+        logger.error(f"Error generating {day} for profile {profile_id}: {str(e)}", exc_info=True)
+        return {'day': day, 'error': str(e)}
+
+@shared_task
+def merge_meal_plan_days(day_plans, profile_id, stream_task_id=None):
+    """
+    Chord callback that merges the per-day plans into one weekly plan and
+    stores it with store_meal_plan, which builds the shared ingredient list
+    and cost total and creates the Instacart cart.
+    """
+    try:
+        return _merge_meal_plan_days(day_plans, profile_id, stream_task_id)
+    finally:
+        meal_plan_inflight_lock.release(profile_id, stream_task_id)
+
+def _merge_meal_plan_days(day_plans, profile_id, stream_task_id=None):
+    publisher = MealPlanStreamPublisher(stream_task_id, profile_id)
+    try:
+        profile = Profile.objects.get(id=profile_id)
+    except Profile.DoesNotExist:
+        logger.error(f"Profile {profile_id} not found")
+        publisher.fail("Meal plan generation failed.")
+        return f"Profile {profile_id} not found"
+    
+    # Checked first: days skipped because of a newer request must not fail the profile
+    if meal_plan_inflight_lock.is_superseded(profile_id, stream_task_id):
+        return discard_superseded_meal_plan(profile_id, publisher)
+    
+    failed_days = [plan['day'] for plan in day_plans if 'error' in plan]
+    if failed_days:
+        logger.error(f"Meal plan generation failed for profile {profile_id} on: {', '.join(failed_days)}")
+        profile.status = 'FAILED'
+        profile.save(update_fields=['status', 'updated_at'])
+        publisher.fail("Meal plan generation failed.")
+        return f"Error while generating meal plan for profile {profile_id}: failed days {failed_days}"
+    
+    try:
+        publisher.stage('parsing', 'Merging the daily plans.')
+        document = validate_meal_plan({'days': day_plans})
+        store_meal_plan(profile, document, MEAL_PLAN_DAY_PROMPT_VERSION, publisher)
+        
+        return f"Successfully generated meal plan for profile ID: {profile_id} (User: {profile.user.username})"
+        
+    except Exception as e:
+        logger.error(f"Error merging meal plan for profile {profile_id}: {str(e)}", exc_info=True)
+        profile.status = 'FAILED'
+        profile.save(update_fields=['status', 'updated_at'])
+        publisher.fail("Meal plan generation failed.")
+        return f"Error while generating meal plan for profile {profile_id}: {str(e)}"
+
+def diff_shopping_lists(before: List[Dict], after: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Computes the ingredient delta between two aggregated shopping lists.
+    
+    Args:
+        before: Shopping list before the change (see MealPlan.shopping_list)
+        after: Shopping list after the change
+        
+    Returns:
+        Dict: 'added' and 'removed' ingredients with the quantity that changed
+    """
+    def index(items):
+        # Compare in base units so '12 oz' before and '1.5 lb' after is a 12 oz change
+        totals = {}
+        for item in items:
+            dimension, amount = to_base_quantity(item['quantity'], item['unit'])
+            key = (Ingredient.normalize_name(item['name']), dimension)
+            totals[key] = totals.get(key, 0.0) + amount
+        return totals
+    
+    old, new = index(before), index(after)
+    delta = {'added': [], 'removed': []}
+    for key in sorted(old.keys() | new.keys()):
+        change = new.get(key, 0.0) - old.get(key, 0.0)
+        quantity, unit = from_base_quantity(key[1], abs(change))
+        if quantity:
+            bucket = 'added' if change > 0 else 'removed'
+            delta[bucket].append({'name': key[0].title(), 'quantity': quantity, 'unit': unit})
+    return delta
+
+@shared_task(bind=True)
+def regenerate_meal_plan_part(self, profile_id, meal_plan_id, targets):
+    """
+    Regenerates only the targeted days or meals of an existing meal plan.
+    
+    The LLM is asked for the replacement meals only, the affected rows are
+    swapped in place and the ingredient delta is computed. The Instacart cart
+    is rebuilt only if the shopping list actually changed. The run holds the
+    profile's in-flight lock (taken by the view) until it ends, and stops
+    without writing if a superseding generation takes the lock over.
+    
+    Args:
+        profile_id: The ID of the profile that owns the plan
+        meal_plan_id: The ID of the plan to patch
+        targets: [day, slot] pairs; a null slot regenerates the whole day
+    """
+    targets = [tuple(target) for target in targets]
+    publisher = MealPlanStreamPublisher(self.request.id, profile_id)
+    if openai_unavailable(self):
+        # The stored plan is left untouched, so the profile keeps its previous status
+        publisher.fail("Meal planning is temporarily unavailable.")
+        meal_plan_inflight_lock.release(profile_id, self.request.id)
+        return f"OpenAI unavailable, regeneration of meal plan {meal_plan_id} failed"
+    try:
+        profile = Profile.objects.get(id=profile_id)
+        meal_plan = MealPlan.objects.get(id=meal_plan_id, profile=profile)
+    except (Profile.DoesNotExist, MealPlan.DoesNotExist):
+        logger.error(f"Meal plan {meal_plan_id} for profile {profile_id} not found")
+        publisher.fail("Meal plan not found.")
+        meal_plan_inflight_lock.release(profile_id, self.request.id)
+        return f"Meal plan {meal_plan_id} for profile {profile_id} not found"
+    
+    publisher.start()
+    try:
+        if meal_plan_inflight_lock.is_superseded(profile_id, self.request.id):
+            return discard_superseded_meal_plan(profile_id, publisher)
+        before = meal_plan.shopping_list()
+        current_plan = '\n'.join(
+            f"{meal.get_day_display()} {meal.slot}: {meal.name}" for meal in meal_plan.meals.all()
+        )
+        
+        chain = meal_plan_patch_chain_pool.get()
+        try:
+            result = openai_breaker.call(openai_rate_limiter.invoke, chain, {
+                "preferences": str(profile.preferences),
+                "dietary_restrictions": str(profile.dietary_restrictions),
+                "budget": str(profile.weekly_budget),
+                "current_plan": current_plan,
+                "targets": ', '.join(f"{day} {slot}" if slot else f"all meals on {day}" for day, slot in targets)
+            }, config={"callbacks": [RedisStreamCallbackHandler(publisher, stream_tokens=False)]})
+        except Exception as e:
+            meal_plan_patch_chain_pool.mark_failed(e)
+            raise
+        
+        publisher.stage('parsing', 'Reading the regenerated meals.')
+        # Ignore anything the model returned beyond what was asked for
+        days = []
+        for day in parse_meal_plan(result['text'])['days']:
+            meals = [meal for meal in day['meals'] if matches_target(day['day'], meal['slot'], targets)]
+            if meals:
+                days.append({**day, 'meals': meals})
+        if not days:
+            raise MealPlanSchemaError("The response did not contain any of the requested meals")
+        
+        if meal_plan_inflight_lock.is_superseded(profile_id, self.request.id):
+            return discard_superseded_meal_plan(profile_id, publisher)
+        meal_plan.replace_meals(targets, days)
+        after = meal_plan.shopping_list()
+        delta = diff_shopping_lists(before, after)
+        meal_plan_text = render_meal_plan(meal_plan.to_document(), after)
+        
+        publisher.stage('cart', 'Updating the Instacart cart.')
+        if delta['added'] or delta['removed']:
+            # Products links cannot be edited, so a new link is only created when the list changed
+            meal_plan.cart_url = create_instacart_cart(meal_plan_text, profile, ingredients=after)
+        
+        _complete_profile_meal_plan(profile, meal_plan, meal_plan_text, changes=delta)
+        publisher.finish(status=profile.status, cart_url=meal_plan.cart_url, meal_plan_id=meal_plan.id, changes=delta)
+        
+        return f"Regenerated {len(targets)} part(s) of meal plan {meal_plan_id} for profile ID: {profile_id}"
+        
+    except Exception as e:
+        # The stored plan is left untouched, so the profile keeps its previous status
+        logger.error(f"Error regenerating meal plan {meal_plan_id}: {str(e)}", exc_info=True)
+        publisher.fail("Meal plan regeneration failed.")
+        return f"Error while regenerating meal plan {meal_plan_id} for profile {profile_id}: {str(e)}"
+    finally:
+        meal_plan_inflight_lock.release(profile_id, self.request.id)
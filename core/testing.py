@@ -0,0 +1,132 @@
+import json
+import sys
+import time
+import uuid
+from typing import Any, Iterable, List, Tuple
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .throttling import RedisSlidingWindowThrottle
+
+try:
+    import fakeredis
+except ImportError:  # Only needed by the tests that run Redis scripts
+    fakeredis = None
+
+QUERY_BUDGETS_PATH = settings.BASE_DIR / 'query_budgets.json'
+
+
+def load_query_budgets() -> dict:
+    """
+    Returns the checked-in query budgets: {"<METHOD> <url name>[ <variant>]": max queries}.
+    """
+    with open(QUERY_BUDGETS_PATH) as f:
+        return json.load(f)
+
+
+def write_queries(captured_queries: Iterable[dict]) -> List[str]:
+    """
+    Returns the INSERT, UPDATE and DELETE statements among captured queries.
+    """
+    return [
+        query['sql'] for query in captured_queries
+        if query['sql'].lstrip().split(' ', 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+def isolate_throttles(test_case) -> None:
+    """
+    Gives a test throttle windows of its own for its duration. The windows
+    live in Redis, so counts would otherwise carry over between tests and runs.
+    """
+    patcher = mock.patch.object(
+        RedisSlidingWindowThrottle, 'cache_format', f'throttle:test-{uuid.uuid4().hex}:%(scope)s:%(ident)s'
+    )
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+def use_fake_redis(test_case):
+    """
+    Points get_redis() at an in-memory Redis for the duration of a test, so
+    that Lua scripts really run. Skips the test without fakeredis[lua].
+
+    Returns:
+        The fake Redis client
+    """
+    if fakeredis is None:
+        test_case.skipTest('fakeredis[lua] is not installed')
+    client = fakeredis.FakeRedis()
+    patcher = mock.patch('core.redis_client._client', client)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return client
+
+
+def url_names(urlpatterns: Iterable) -> List[str]:
+    return [pattern.name for pattern in urlpatterns if getattr(pattern, 'name', None)]
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin that runs requests against the query budgets in
+    query_budgets.json and reports their query counts and timings.
+
+    A request that runs more queries than its budget fails with the captured
+    SQL. When a change needs more queries on purpose, raise the budget in the
+    same pull request so the increase is reviewed; when it saves queries,
+    lower it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.budgets = load_query_budgets()
+        cls.budget_results: List[Tuple[str, int, int, float]] = []
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.budget_results:
+            lines = [f"\nQuery budgets ({cls.__name__}):"]
+            for budget_name, count, budget, elapsed in cls.budget_results:
+                lines.append(f"  {budget_name:<45} {count:>3}/{budget:<3} queries {elapsed * 1000:8.1f} ms")
+            sys.stderr.write('\n'.join(lines) + '\n')
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        isolate_throttles(self)
+
+    def request_within_budget(self, budget_name: str, path: str, data: Any = None, **extra: Any):
+        """
+        Sends the request named by ``budget_name`` ("<METHOD> <url name>...")
+        and asserts it stays within its query budget.
+
+        Returns:
+            The response
+        """
+        self.assertIn(budget_name, self.budgets, f"No query budget for '{budget_name}' in {QUERY_BUDGETS_PATH.name}")
+        budget = self.budgets[budget_name]
+        method = budget_name.split()[0].lower()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(path, data, **extra)
+            elapsed = time.perf_counter() - start
+        self.budget_results.append((budget_name, len(queries), budget, elapsed))
+        self.assertLessEqual(
+            len(queries), budget,
+            f"'{budget_name}' ran {len(queries)} queries, its budget is {budget}:\n" +
+            '\n'.join(f"  {query['sql']}" for query in queries.captured_queries)
+        )
+        return response
+
+    def assertBudgetsCover(self, urlpatterns: Iterable) -> None:
+        """
+        Asserts that every named URL has at least one query budget.
+        """
+        budgeted = {name.split()[1] for name in self.budgets}
+        missing = [name for name in url_names(urlpatterns) if name not in budgeted]
+        self.assertEqual(missing, [], f"URLs without a query budget in {QUERY_BUDGETS_PATH.name}")
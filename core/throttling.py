@@ -0,0 +1,98 @@
+import logging
+import secrets
+import time
+
+import redis
+from rest_framework.throttling import SimpleRateThrottle
+
+from .redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+# Sliding-window log: one sorted set member per allowed request, scored by its
+# time. Members older than the window are dropped, so the set never holds more
+# than ``limit`` members and every check costs the same. A refused request is
+# not recorded; it may retry once the oldest request in the window leaves it.
+# KEYS[1] = window; ARGV = now, window seconds, limit, member
+# Returns {allowed (1/0), wait seconds as a string}
+_HIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('EXPIRE', KEYS[1], math.ceil(window))
+    return {1, '0'}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], count - limit, count - limit, 'WITHSCORES')
+return {0, tostring(tonumber(oldest[2]) + window - now)}
+"""
+
+
+class RedisSlidingWindowThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle whose request history is a sliding window in Redis,
+    shared by every process and checked and updated in one script call.
+
+    Rates and scopes are configured as for DRF's throttles (``rate`` or
+    DEFAULT_THROTTLE_RATES[scope]); each scope has its own window per client.
+    ``wait()`` is the time until the oldest request in a full window expires,
+    which DRF sends as Retry-After. If Redis is unavailable requests are let
+    through.
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+    _hit_script = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = time.time()
+        try:
+            if RedisSlidingWindowThrottle._hit_script is None:
+                RedisSlidingWindowThrottle._hit_script = get_redis().register_script(_HIT_SCRIPT)
+            allowed, wait = RedisSlidingWindowThrottle._hit_script(
+                keys=[self.key],
+                args=[now, self.duration, self.num_requests, f"{now}:{secrets.token_hex(4)}"],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Throttle unavailable, not limiting {self.key}: {str(e)}")
+            return True
+
+        self._wait = float(wait)
+        return bool(allowed)
+
+    def wait(self):
+        return self._wait
+
+
+class AnonSlidingWindowThrottle(RedisSlidingWindowThrottle):
+    """
+    Limits anonymous requests by client IP, like DRF's AnonRateThrottle.
+    """
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserSlidingWindowThrottle(RedisSlidingWindowThrottle):
+    """
+    Limits requests by user id, or by client IP when anonymous, like DRF's UserRateThrottle.
+    """
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
@@ -71,8 +71,9 @@ def test_task_submission():
                 # Check if profile was updated
                 profile.refresh_from_db()
                 print(f"   - Profile status: {profile.status}")
-                if profile.meal_plan:
-                    print(f"   - Meal plan generated: {len(profile.meal_plan.get('plan', ''))} chars")
+                meal_plan = profile.meal_plans.order_by('-version').first()
+                if meal_plan:
+                    print(f"   - Meal plan generated: {len(meal_plan.plan_text)} chars")
                 else:
                     print("   - No meal plan data found")
             else:
@@ -139,13 +139,14 @@ def test_meal_plan_with_instacart():
                     
                     # Check if profile was updated
                     profile.refresh_from_db()
-                    if profile.status == 'COMPLETED' and profile.meal_plan:
+                    meal_plan = profile.meal_plans.order_by('-version').first()
+                    if profile.status == 'COMPLETED' and meal_plan:
                         print("✅ Profile updated with meal plan and cart URL")
                         print(f"   - Status: {profile.status}")
-                        print(f"   - Meal plan keys: {list(profile.meal_plan.keys())}")
+                        print(f"   - Meal plan version: {meal_plan.version}")
                         
-                        if 'cart_url' in profile.meal_plan:
-                            print(f"   - Cart URL: {profile.meal_plan['cart_url']}")
+                        if meal_plan.cart_url:
+                            print(f"   - Cart URL: {meal_plan.cart_url}")
                         
                         # Keep the test user for inspection
                         print(f"   - Test user preserved: {test_user.username}")
@@ -29,6 +29,8 @@ from django.contrib.auth.models import User
 from users.models import Profile
 from core.tasks import generate_meal_plan
 from celery.result import AsyncResult
+from asgiref.sync import async_to_sync
+from core.task_status import TERMINAL_STATES, task_status
 
 def test_environment_setup():
     """Test 1: Verify environment variables and dependencies"""
@@ -177,23 +179,30 @@ def test_celery_task():
         task = generate_meal_plan.delay(profile.id)
         print(f"   - Task ID: {task.id}")
         
-        # Wait for task completion (with timeout)
+        # Wait for task completion (with timeout), long-polling the task's Redis
+        # status record instead of re-reading the profile
         timeout = 300  # 5 minutes
         start_time = time.time()
+        record, version = None, None
         
         while time.time() - start_time < timeout:
-            result = AsyncResult(task.id)
-            if result.ready():
-                if result.successful():
+            latest = async_to_sync(task_status.wait_for_change)(task.id, version, 5)
+            if latest is None:
+                time.sleep(1)  # No worker has picked the task up yet
+            record = latest or record
+            version = record and record['version']
+            if record and record['state'] in TERMINAL_STATES:
+                if record['state'] == 'completed':
                     print("✅ Task completed successfully")
-                    print(f"   - Result: {result.result}")
+                    print(f"   - Result: {AsyncResult(task.id).get(timeout=30)}")
                     
                     # Check if profile was updated
                     profile.refresh_from_db()
-                    if profile.status == 'COMPLETED' and profile.meal_plan:
+                    meal_plan = profile.meal_plans.order_by('-version').first()
+                    if profile.status == 'COMPLETED' and meal_plan:
                         print("✅ Profile updated with meal plan")
                         print(f"   - Status: {profile.status}")
-                        print(f"   - Meal plan keys: {list(profile.meal_plan.keys())}")
+                        print(f"   - Meal plan version: {meal_plan.version} ({len(meal_plan.plan_text)} chars)")
                         
                         # Clean up test user
                         test_user.delete()
@@ -203,12 +212,12 @@ def test_celery_task():
                         test_user.delete()
                         return False
                 else:
-                    print(f"❌ Task failed: {result.result}")
+                    print(f"❌ Task failed: {record.get('message')}")
                     test_user.delete()
                     return False
             
-            time.sleep(5)
-            print(f"   - Still processing... ({int(time.time() - start_time)}s elapsed)")
+            state = record['state'] if record else 'queued'
+            print(f"   - Still processing ({state})... ({int(time.time() - start_time)}s elapsed)")
         
         print("❌ Task timed out")
         test_user.delete()
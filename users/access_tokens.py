@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import redis
+from django.conf import settings
+from jose import jwt, JWTError
+
+from core.bloom import BloomFilter
+from core.redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+REVOKED_KEY = 'jwt:revoked'
+
+
+class InvalidAccessToken(Exception):
+    """Raised for an access token that is malformed, expired, unsigned by a known key or revoked."""
+
+
+def issue_access_token(user) -> Dict[str, Any]:
+    """
+    Signs a short-lived JWT access token for the user with the current key
+    (the first of JWT_SIGNING_KEYS), named in the ``kid`` header.
+
+    Returns:
+        Dict: The token and its lifetime in seconds
+    """
+    kid, key = next(iter(settings.JWT_SIGNING_KEYS.items()))
+    now = int(time.time())
+    claims = {
+        'sub': str(user.id),
+        'username': user.username,
+        'staff': user.is_staff,
+        'iat': now,
+        'exp': now + settings.JWT_ACCESS_TOKEN_TTL,
+        'jti': uuid.uuid4().hex,
+    }
+    token = jwt.encode(claims, key, algorithm=settings.JWT_ALGORITHM, headers={'kid': kid})
+    return {'access_token': token, 'token_type': 'Bearer', 'expires_in': settings.JWT_ACCESS_TOKEN_TTL}
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """
+    Verifies an access token's signature, expiry and revocation.
+
+    Any key in JWT_SIGNING_KEYS is accepted, so tokens signed before a key
+    rotation stay valid until they expire or the old key is removed.
+
+    Raises:
+        InvalidAccessToken: If the token must not be accepted
+    """
+    try:
+        key = settings.JWT_SIGNING_KEYS.get(jwt.get_unverified_header(token).get('kid'))
+        if key is None:
+            raise InvalidAccessToken("Unknown signing key")
+        claims = jwt.decode(token, key, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError as e:
+        raise InvalidAccessToken(str(e))
+    if 'sub' not in claims or 'jti' not in claims:
+        raise InvalidAccessToken("Missing claims")
+    if settings.JWT_REVOCATION_CHECK and (
+            revocation_list.is_revoked(claims['jti']) or revocation_list.is_revoked(user_entry(claims['sub']))):
+        raise InvalidAccessToken("Token has been revoked")
+    return claims
+
+
+def user_entry(user_id) -> str:
+    # Revokes every token of a user (deactivated) rather than one jti
+    return f"user:{user_id}"
+
+
+class RevocationList:
+    """
+    Revoked access tokens (by ``jti``, or all of a user's), shared through a Redis sorted set
+    scored by token expiry, so entries go away once the token would have
+    expired anyway.
+
+    Each process checks tokens against a Bloom filter of the list, rebuilt
+    every JWT_REVOCATION_REFRESH seconds. A token missing from the filter is
+    accepted without any I/O; only a (possible) hit is confirmed in Redis. A
+    token revoked in another process may be accepted until the next rebuild.
+    """
+
+    def __init__(self):
+        self._filter: Optional[BloomFilter] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        try:
+            client = get_redis()
+            pipe = client.pipeline()
+            pipe.zadd(REVOKED_KEY, {jti: expires_at})
+            pipe.zremrangebyscore(REVOKED_KEY, '-inf', time.time())
+            pipe.expire(REVOKED_KEY, settings.JWT_ACCESS_TOKEN_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not revoke access token {jti}: {str(e)}")
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def revoke_user(self, user_id: int) -> None:
+        """
+        Revokes every access token the user holds, such as when they are deactivated.
+        """
+        self.revoke(user_entry(user_id), time.time() + settings.JWT_ACCESS_TOKEN_TTL)
+
+    def restore_user(self, user_id: int) -> None:
+        """
+        Lifts revoke_user. Users the filter has never seen revoked cost no I/O.
+        """
+        entry = user_entry(user_id)
+        token_filter = self._current_filter()
+        if token_filter is not None and entry not in token_filter:
+            return
+        try:
+            get_redis().zrem(REVOKED_KEY, entry)
+        except redis.RedisError as e:
+            logger.warning(f"Could not restore access tokens of user {user_id}: {str(e)}")
+
+    def _current_filter(self) -> Optional[BloomFilter]:
+        if time.monotonic() - self._loaded_at < settings.JWT_REVOCATION_REFRESH:
+            return self._filter
+        with self._lock:
+            if time.monotonic() - self._loaded_at >= settings.JWT_REVOCATION_REFRESH:
+                try:
+                    revoked = get_redis().zrangebyscore(REVOKED_KEY, time.time(), '+inf')
+                    self._filter = BloomFilter(
+                        max(len(revoked) * 2, 1024), items=(jti.decode('utf-8') for jti in revoked)
+                    )
+                except redis.RedisError as e:
+                    logger.warning(f"Could not load revoked access tokens: {str(e)}")
+                self._loaded_at = time.monotonic()
+            return self._filter
+
+    def is_revoked(self, jti: str) -> bool:
+        token_filter = self._current_filter()
+        if token_filter is not None and jti not in token_filter:
+            return False
+        try:
+            return get_redis().zscore(REVOKED_KEY, jti) is not None
+        except redis.RedisError as e:
+            # Without Redis revocations cannot be checked; accept like other Redis-backed checks
+            logger.warning(f"Could not check access token revocation: {str(e)}")
+            return False
+
+
+revocation_list = RevocationList()
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+from typing import Optional, Tuple
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.lru import LRUCache
+from core.redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+CACHE_PREFIX = 'auth_cache'
+
+# Left out of snapshots and loaded from the database on first access: the
+# password (never copied to Redis), last_login (saved on every login) and the
+# profile columns the generation tasks write without going through the cache
+USER_EXCLUDED_FIELDS = frozenset({'password', 'last_login'})
+PROFILE_EXCLUDED_FIELDS = frozenset({'status', 'updated_at'})
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _dump(instance, excluded) -> dict:
+    return {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields if field.name not in excluded
+    }
+
+
+def _load(model, values: dict):
+    # from_db takes the loaded values in concrete field order; the rest are deferred
+    fields = [field for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(
+        'default', [field.attname for field in fields], [field.to_python(values[field.attname]) for field in fields]
+    )
+
+
+class AuthCache:
+    """
+    Two-tier cache of the users behind opaque access tokens, so that a user
+    seen recently authenticates without touching the database.
+
+    Tokens map to a user id and user ids to a snapshot of the user and their
+    profile, both in a small in-process LRU in front of Redis. Snapshots are
+    dropped explicitly when the user, their profile or their email
+    verification changes, and tokens when they are deleted. A snapshot also
+    names the token it was built from, so a token that was replaced (the user
+    has one at a time) never resolves to a newer snapshot. Other processes
+    may serve an entry from their local tier for up to AUTH_CACHE_LOCAL_TTL
+    seconds after it is dropped. Cache failures are logged and treated as misses.
+    """
+
+    def __init__(self, ttl: int = None, local_size: int = None, local_ttl: int = None):
+        self.ttl = ttl or settings.AUTH_CACHE_TTL
+        self.local = LRUCache(
+            maxsize=settings.AUTH_CACHE_LOCAL_SIZE if local_size is None else local_size,
+            ttl=local_ttl or settings.AUTH_CACHE_LOCAL_TTL,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return settings.AUTH_CACHE_ENABLED
+
+    def _token_key(self, token_digest: str) -> str:
+        return f"{CACHE_PREFIX}:token:{token_digest}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{CACHE_PREFIX}:user:{user_id}"
+
+    def _get(self, key: str) -> Optional[str]:
+        value = self.local.get(key)
+        if value is None:
+            raw = get_redis().get(key)
+            if raw is None:
+                return None
+            value = raw.decode('utf-8')
+            self.local.set(key, value)
+        return value
+
+    def get(self, key: str) -> Optional[Tuple]:
+        """
+        Looks up the user behind an access token.
+
+        Args:
+            key: The access token
+
+        Returns:
+            Optional[Tuple]: (user, token) with the user's profile attached, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        token_digest = _digest(key)
+        try:
+            token_entry = self._get(self._token_key(token_digest))
+            if token_entry is None:
+                return None
+            token_values = json.loads(token_entry)
+            user_entry = self._get(self._user_key(token_values['user_id']))
+        except redis.RedisError as e:
+            logger.warning(f"Auth cache lookup failed: {str(e)}")
+            return None
+        if user_entry is None:
+            return None
+
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+        from .models import Profile
+
+        snapshot = json.loads(user_entry)
+        if snapshot['token'] != token_digest:
+            return None
+        user = _load(User, snapshot['user'])
+        if snapshot['profile'] is not None:
+            user.profile = _load(Profile, snapshot['profile'])
+        token = _load(Token, {'key': key, **token_values})
+        token.user = user
+        return user, token
+
+    def set(self, token) -> None:
+        """
+        Stores the token's user and their loaded profile in both cache tiers.
+
+        Args:
+            token: A Token with its user (and the user's profile) loaded
+        """
+        if not self.enabled:
+            return
+        from django.contrib.auth.models import User
+
+        user = token.user
+        profile = user.profile if User.profile.related.is_cached(user) else None
+        token_entry = json.dumps(
+            {'user_id': user.id, 'created': token.created}, cls=DjangoJSONEncoder
+        )
+        token_digest = _digest(token.key)
+        user_entry = json.dumps({
+            'token': token_digest,
+            'user': _dump(user, USER_EXCLUDED_FIELDS),
+            'profile': profile and _dump(profile, PROFILE_EXCLUDED_FIELDS),
+        }, cls=DjangoJSONEncoder)
+        token_key, user_key = self._token_key(token_digest), self._user_key(user.id)
+
+        self.local.set(token_key, token_entry)
+        self.local.set(user_key, user_entry)
+        try:
+            pipe = get_redis().pipeline()
+            pipe.set(token_key, token_entry, ex=self.ttl)
+            pipe.set(user_key, user_entry, ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Auth cache store failed: {str(e)}")
+
+    def invalidate(self, user_id: int, token_key: Optional[str] = None) -> None:
+        """
+        Drops the user's snapshot and, when a token is deleted, the token's entry.
+
+        Args:
+            user_id: The user whose user or profile data changed
+            token_key: An access token that was deleted
+        """
+        keys = [self._user_key(user_id)]
+        if token_key:
+            keys.append(self._token_key(_digest(token_key)))
+        for key in keys:
+            self.local.delete(key)
+        try:
+            get_redis().delete(*keys)
+        except redis.RedisError as e:
+            logger.warning(f"Auth cache invalidation failed for user {user_id}: {str(e)}")
+
+
+auth_cache = AuthCache()
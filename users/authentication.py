@@ -0,0 +1,74 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+
+from .access_tokens import InvalidAccessToken, decode_access_token
+from .auth_cache import auth_cache
+from .models import ClaimsUser
+
+
+class ProfileTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that loads the user's profile in the same query.
+
+    Nearly every authenticated endpoint reads ``request.user.profile`` (for
+    permission checks, the email verification flag or the profile id), which
+    would otherwise cost a second query per request. Recently seen tokens are
+    answered from users.auth_cache without any query.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = auth_cache.get(key)
+        if cached is not None:
+            return cached
+
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user__profile').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        auth_cache.set(token)
+        return (token.user, token)
+
+
+def user_from_claims(claims):
+    """
+    Builds the user named by a verified access token without a query. The
+    id, username and staff flag come from the claims; the other fields are
+    loaded together, in one query, on first access. The user is active:
+    deactivating a user revokes their tokens (see revoke_inactive_user_tokens).
+    """
+    # Values in the order of User's concrete fields
+    return ClaimsUser.from_db(
+        'default', ['id', 'username', 'is_staff', 'is_active'],
+        [int(claims['sub']), claims.get('username', ''), bool(claims.get('staff', False)), True]
+    )
+
+
+class JWTAuthentication(BaseAuthentication):
+    """
+    Authenticates ``Authorization: Bearer <jwt>`` access tokens (see
+    users.access_tokens) by their signature alone, so permission checks such
+    as IsAuthenticated and IsAdminUser need no query. ``request.auth`` holds
+    the token's claims.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+        try:
+            claims = decode_access_token(auth[1].decode())
+        except (UnicodeError, InvalidAccessToken):
+            raise exceptions.AuthenticationFailed(_('Invalid or expired token.'))
+        return (user_from_claims(claims), claims)
+
+    def authenticate_header(self, request):
+        return self.keyword
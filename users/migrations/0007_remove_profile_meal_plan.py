@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_emailverification'),
+        # The plans are copied into api.MealPlan before the column is dropped
+        ('api', '0004_move_profile_meal_plans'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='profile',
+            name='meal_plan',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:10
+
+from django.db import migrations, models
+
+
+def copy_email_verified(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Profile.objects.filter(user__email_verification__is_verified=True).update(email_verified=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_remove_profile_meal_plan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='email_verified',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(copy_email_verified, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def delete_refresh_tokens(apps, schema_editor):
+    # Live refresh tokens are now kept in Redis; tokens stored here can no longer be used
+    apps.get_model('users', 'RefreshToken').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_profile_email_verified'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_refresh_tokens, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name='refreshtoken',
+            old_name='token',
+            new_name='family',
+        ),
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='family',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refresh_tokens', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='refreshtoken',
+            name='revoked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,32 +1,49 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from datetime import datetime, timedelta
+from datetime import timedelta
 import uuid
 from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .access_tokens import revocation_list
+from .auth_cache import auth_cache
 
 # Create your models here.
 
 class RefreshToken(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='refresh_token')
-    token = models.CharField(max_length=255, unique=True)
+    """
+    Audit record of a refresh token family (one login on one device). Live
+    tokens are kept in Redis by users.refresh_tokens; these rows are only
+    written with REFRESH_TOKEN_AUDIT.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='refresh_tokens')
+    family = models.CharField(max_length=64, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     is_valid = models.BooleanField(default=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"Refresh token for {self.user.username}"
+        return f"Refresh token family {self.family} for {self.user.username}"
 
-    @classmethod
-    def create_token(cls, user, days=30):
-        token = str(uuid.uuid4())
-        expires_at = datetime.now() + timedelta(days=days)
-        return cls.objects.create(
-            user=user,
-            token=token,
-            expires_at=expires_at
-        )
+class ClaimsUser(User):
+    """
+    A user built from access token claims (see users.authentication). The
+    claims carry only a few fields; the first access to any other loads all
+    of the missing ones in a single query.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        if fields is not None:
+            deferred = self.get_deferred_fields()
+            if deferred.intersection(fields):
+                fields = deferred.union(fields)
+        super().refresh_from_db(using, fields, from_queryset)
 
 class EmailVerification(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='email_verification')
@@ -39,10 +56,15 @@ class EmailVerification(models.Model):
         return f"Email verification for {self.user.username}"
     
     @classmethod
-    def create_verification(cls, user):
-        """Create a new email verification token"""
+    def create_verification(cls, user, new_user=False):
+        """
+        Create a new email verification token. ``new_user`` skips the lookup
+        for a user who cannot have one yet.
+        """
         token = str(uuid.uuid4())
         expires_at = timezone.now() + timedelta(hours=24)  # 24 hour expiry
+        if new_user:
+            return cls.objects.create(user=user, verification_token=token, expires_at=expires_at)
         verification, created = cls.objects.get_or_create(
             user=user,
             defaults={
@@ -77,6 +99,8 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Copy of EmailVerification.is_verified, kept in sync by sync_profile_email_verified
+    email_verified = models.BooleanField(default=False)
     
     # Location data
     latitude = models.FloatField(null=True, blank=True)
@@ -88,8 +112,7 @@ class Profile(models.Model):
     weekly_budget = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Weekly grocery budget")
     preferred_store_id = models.CharField(max_length=100, blank=True, help_text="Preferred Instacart store ID")
     
-    # Generated meal plan and cart data
-    meal_plan = models.JSONField(null=True, blank=True, help_text="Generated meal plan and Instacart cart URL")
+    # Generated meal plans are stored in api.MealPlan (profile.meal_plans)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -97,18 +120,78 @@ class Profile(models.Model):
     @property
     def is_email_verified(self):
         """Check if user's email is verified"""
-        try:
-            return self.user.email_verification.is_verified
-        except EmailVerification.DoesNotExist:
-            return False
+        return self.email_verified
+
+# User fields that appear in profile responses; changing one moves Profile.updated_at
+PROFILE_USER_FIELDS = frozenset({'username', 'email', 'first_name', 'last_name'})
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
         # Create email verification for new users
-        EmailVerification.create_verification(instance)
+        EmailVerification.create_verification(instance, new_user=True)
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=ClaimsUser)
+def touch_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Moves the profile's updated_at (which profile ETags are built from) and
+    drops the cached authenticated user when a user field shown with the
+    profile may have changed. Saves of other fields, such as the last_login
+    update on every login, write nothing.
+    """
+    if created or (update_fields is not None and not PROFILE_USER_FIELDS.intersection(update_fields)):
+        return
+    auth_cache.invalidate(instance.id)
+    now = timezone.now()
+    Profile.objects.filter(user_id=instance.id).update(updated_at=now)
+    if User.profile.related.is_cached(instance):
+        instance.profile.updated_at = now
+
+@receiver(post_save, sender=EmailVerification)
+@receiver(post_delete, sender=EmailVerification)
+def sync_profile_email_verified(sender, instance, created=False, **kwargs):
+    """
+    Copies the verification flag onto the profile, which is what permission
+    checks and serializers read, and onto a profile already loaded through
+    the verification's user. A change drops the cached authenticated user.
+    """
+    verified = instance.is_verified and kwargs.get('signal') is post_save
+    if created and not verified:
+        return
+    now = timezone.now()
+    changed = Profile.objects.filter(user_id=instance.user_id).exclude(email_verified=verified).update(
+        email_verified=verified, updated_at=now
+    )
+    if changed:
+        auth_cache.invalidate(instance.user_id)
+    if changed and EmailVerification.user.is_cached(instance) and User.profile.related.is_cached(instance.user):
+        instance.user.profile.email_verified = verified
+        instance.user.profile.updated_at = now
+
+@receiver(post_delete, sender=Token)
+def drop_cached_token(sender, instance, **kwargs):
+    """
+    Stops a deleted access token from authenticating from users.auth_cache,
+    however it was deleted (logout through any authentication, admin, shell).
+    """
+    auth_cache.invalidate(instance.user_id, instance.key)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+@receiver(post_save, sender=ClaimsUser)
+def revoke_inactive_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Stops a deactivated user's access tokens from authenticating: JWTs are
+    accepted on their signature, and opaque tokens may be answered from
+    users.auth_cache, so neither reads is_active. Reactivating the user
+    lifts the JWT revocation.
+    """
+    if created or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    if instance.is_active:
+        revocation_list.restore_user(instance.id)
+    else:
+        auth_cache.invalidate(instance.id)
+        revocation_list.revoke_user(instance.id)
+
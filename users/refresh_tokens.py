@@ -0,0 +1,212 @@
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from core.redis_client import get_redis
+
+logger = logging.getLogger('core.tasks')
+
+# Rotation outcomes
+ROTATED = 'rotated'
+INVALID = 'invalid'
+REUSED = 'reused'
+UNAVAILABLE = 'unavailable'
+
+# Swaps a family's current secret for the next one, if the presented secret is
+# current. The secret it replaced stays accepted for a short grace window, so
+# two tabs refreshing at once both succeed; the next secret is derived from the
+# presented one, so both get the same token. A known family presented with any
+# other secret means an old token was replayed: the family is revoked so
+# neither the thief nor the owner can refresh again.
+# KEYS[1] = family hash; ARGV = presented secret hash, next secret hash, ttl, grace seconds
+# Returns {1, user_id} rotated, {0, ''} unknown or expired, {-1, user_id} reused
+_ROTATE_SCRIPT = """
+local current, previous, rotated_at, user_id = unpack(
+    redis.call('HMGET', KEYS[1], 'current', 'previous', 'rotated_at', 'user_id')
+)
+if not current then
+    return {0, ''}
+end
+local now = tonumber(redis.call('TIME')[1])
+if current == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'current', ARGV[2], 'previous', ARGV[1], 'rotated_at', now)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return {1, user_id}
+end
+if previous == ARGV[1] and now - tonumber(rotated_at) <= tonumber(ARGV[4]) then
+    return {1, user_id}
+end
+redis.call('DEL', KEYS[1])
+return {-1, user_id}
+"""
+
+
+class IssuedToken(NamedTuple):
+    token: str
+    family: str
+
+
+class RotationResult(NamedTuple):
+    status: str
+    user_id: Optional[int] = None
+    token: Optional[str] = None
+
+
+def family_key(family: str) -> str:
+    return f"refresh:family:{family}"
+
+
+def user_families_key(user_id: int) -> str:
+    return f"refresh:user:{user_id}"
+
+
+def _hash(secret: str) -> str:
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()
+
+
+def _next_secret(family: str, secret: str) -> str:
+    # Deterministic, so a concurrent refresh within the grace window gets the same token
+    digest = hmac.new(settings.SECRET_KEY.encode('utf-8'), f"{family}.{secret}".encode('utf-8'), hashlib.sha256)
+    return base64.urlsafe_b64encode(digest.digest()).rstrip(b'=').decode('ascii')
+
+
+def _split(token: str):
+    family, _, secret = (token or '').partition('.')
+    return (family, secret) if family and secret else (None, None)
+
+
+class RefreshTokenStore:
+    """
+    Refresh tokens kept in Redis, one family per login (device).
+
+    A token is ``<family>.<secret>``; only a hash of the family's current
+    secret is stored, with a sliding REFRESH_TOKEN_TTL. Every refresh rotates
+    the secret in one script call, without touching the database. Presenting
+    a secret that has already been rotated away revokes the whole family,
+    unless it was rotated less than REFRESH_TOKEN_REUSE_GRACE seconds ago.
+    Each user's families are listed in a set so that logout can revoke them all.
+
+    With REFRESH_TOKEN_AUDIT, issued and revoked families are also recorded
+    as RefreshToken rows; refreshes are never written.
+    """
+
+    def __init__(self):
+        self._rotate_script = None
+
+    def issue(self, user) -> Optional[IssuedToken]:
+        """
+        Starts a new token family for the user.
+
+        Returns:
+            Optional[IssuedToken]: The token, or None if Redis is unavailable
+        """
+        family, secret = secrets.token_urlsafe(16), secrets.token_urlsafe(32)
+        ttl = settings.REFRESH_TOKEN_TTL
+        try:
+            pipe = get_redis().pipeline()
+            pipe.hset(family_key(family), mapping={
+                'user_id': user.id, 'current': _hash(secret), 'created_at': time.time()
+            })
+            pipe.expire(family_key(family), ttl)
+            pipe.sadd(user_families_key(user.id), family)
+            pipe.execute()
+            self._prune(user.id)
+        except redis.RedisError as e:
+            logger.warning(f"Could not issue refresh token for user {user.id}: {str(e)}")
+            return None
+        if settings.REFRESH_TOKEN_AUDIT:
+            from .models import RefreshToken
+            RefreshToken.objects.create(user=user, family=family, expires_at=timezone.now() + timedelta(seconds=ttl))
+        return IssuedToken(f"{family}.{secret}", family)
+
+    def rotate(self, token: str) -> RotationResult:
+        """
+        Exchanges a refresh token for the next one in its family.
+        """
+        family, secret = _split(token)
+        if family is None:
+            return RotationResult(INVALID)
+        new_secret = _next_secret(family, secret)
+        try:
+            if self._rotate_script is None:
+                self._rotate_script = get_redis().register_script(_ROTATE_SCRIPT)
+            outcome, user_id = self._rotate_script(
+                keys=[family_key(family)],
+                args=[_hash(secret), _hash(new_secret), settings.REFRESH_TOKEN_TTL, settings.REFRESH_TOKEN_REUSE_GRACE],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Could not rotate refresh token: {str(e)}")
+            return RotationResult(UNAVAILABLE)
+        if outcome == 0:
+            return RotationResult(INVALID)
+        user_id = int(user_id)
+        if outcome == -1:
+            logger.warning(f"Refresh token reuse detected for user {user_id}, family {family} revoked")
+            self._audit_revoked(family=family)
+            return RotationResult(REUSED, user_id)
+        return RotationResult(ROTATED, user_id, f"{family}.{new_secret}")
+
+    @staticmethod
+    def _prune(user_id: int) -> None:
+        # Drops families that expired from the user's set (it has no TTL of its own)
+        client = get_redis()
+        families = list(client.smembers(user_families_key(user_id)))
+        pipe = client.pipeline(transaction=False)
+        for family in families:
+            pipe.exists(family_key(family.decode('utf-8')))
+        expired = [family for family, exists in zip(families, pipe.execute()) if not exists]
+        if expired:
+            client.srem(user_families_key(user_id), *expired)
+
+    def revoke(self, token: str) -> None:
+        """
+        Revokes the family of a single token (one device).
+        """
+        family, _ = _split(token)
+        if family is None:
+            return
+        try:
+            client = get_redis()
+            user_id = client.hget(family_key(family), 'user_id')
+            pipe = client.pipeline()
+            pipe.delete(family_key(family))
+            if user_id is not None:
+                pipe.srem(user_families_key(int(user_id)), family)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not revoke refresh token family {family}: {str(e)}")
+        self._audit_revoked(family=family)
+
+    def revoke_all(self, user_id: int) -> None:
+        """
+        Revokes every token family of the user (all devices).
+        """
+        try:
+            client = get_redis()
+            families = client.smembers(user_families_key(user_id))
+            pipe = client.pipeline()
+            for family in families:
+                pipe.delete(family_key(family.decode('utf-8')))
+            pipe.delete(user_families_key(user_id))
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not revoke refresh tokens of user {user_id}: {str(e)}")
+        self._audit_revoked(user_id=user_id)
+
+    @staticmethod
+    def _audit_revoked(**lookup) -> None:
+        if settings.REFRESH_TOKEN_AUDIT:
+            from .models import RefreshToken
+            RefreshToken.objects.filter(is_valid=True, **lookup).update(is_valid=False, revoked_at=timezone.now())
+
+
+refresh_tokens = RefreshTokenStore()
@@ -1,9 +1,98 @@
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Profile, RefreshToken
+from .models import Profile
 
-class ProfileSerializer(serializers.ModelSerializer):
+def parse_fieldset(value):
+    """
+    Parses a ``?fields=`` / ``?omit=`` value into a tree of field names.
+
+    ``"id,profile.status,profile.meal_plan"`` becomes
+    ``{'id': {}, 'profile': {'status': {}, 'meal_plan': {}}}``; an empty dict
+    stands for the whole field. Returns None for a missing or blank value.
+    """
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree or None
+
+def save_changed_fields(instance, validated_data, always=()):
+    """
+    Applies ``validated_data`` to ``instance`` and saves only the fields whose
+    value changed (plus ``always``, e.g. an auto_now timestamp). Nothing is
+    written when no value changed.
+    """
+    changed = [name for name, value in validated_data.items() if getattr(instance, name) != value]
+    for name in changed:
+        setattr(instance, name, validated_data[name])
+    if changed:
+        instance.save(update_fields=[*changed, *always])
+    return instance
+
+class SparseFieldsetsMixin:
+    """
+    Lets clients choose the fields of a response with ``?fields=a,b`` or drop
+    some with ``?omit=a,b``. Nested serializers using the mixin are selected
+    with dotted paths (``?fields=id,profile.status``).
+
+    The selection comes from the ``fields``/``omit`` arguments or, failing
+    those, from the query string of the request in the serializer context.
+    Unselected fields are removed from the serializer, so they are neither
+    computed nor encoded; ``model_columns`` tells views which columns to load.
+    """
+    # Model columns a field reads besides its own source, e.g. for method fields
+    field_dependencies = {}
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if fields is None and omit is None and request is not None:
+            fields = request.query_params.get('fields')
+            omit = request.query_params.get('omit')
+        self.prune_fields(
+            parse_fieldset(fields) if isinstance(fields, str) else fields,
+            parse_fieldset(omit) if isinstance(omit, str) else omit
+        )
+
+    def prune_fields(self, fields, omit):
+        """
+        Removes the fields not in the ``fields`` tree and those in the ``omit``
+        tree, recursing into nested serializers for dotted paths.
+        """
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name, nested in (omit or {}).items():
+            if not nested:
+                self.fields.pop(name, None)
+        for name, field in self.fields.items():
+            if isinstance(field, SparseFieldsetsMixin):
+                field.prune_fields((fields or {}).get(name) or None, (omit or {}).get(name) or None)
+
+    def model_columns(self):
+        """
+        Returns the names of the model columns the selected fields read, for
+        ``QuerySet.only()``. Relations to other tables are left to the caller.
+        """
+        opts = self.Meta.model._meta
+        columns = {opts.pk.name}
+        for name, field in self.fields.items():
+            for source in (field.source, *self.field_dependencies.get(name, ())):
+                try:
+                    model_field = opts.get_field(source.split('.')[0])
+                except FieldDoesNotExist:
+                    continue
+                if model_field.concrete:
+                    columns.add(model_field.name)
+        return columns
+
+class ProfileSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     is_email_verified = serializers.ReadOnlyField()
+    meal_plan = serializers.SerializerMethodField()
     
     class Meta:
         model = Profile
@@ -13,8 +102,22 @@ class ProfileSerializer(serializers.ModelSerializer):
             'weekly_budget', 'preferred_store_id', 'meal_plan', 'is_email_verified'
         ]
         read_only_fields = ['created_at', 'updated_at', 'status', 'meal_plan', 'is_email_verified']
+    
+    field_dependencies = {'meal_plan': ['status'], 'is_email_verified': ['email_verified']}
+    
+    def update(self, instance, validated_data):
+        return save_changed_fields(instance, validated_data, always=['updated_at'])
+    
+    def get_meal_plan(self, obj):
+        """
+        Summary of the current meal plan; the full plan is served by the meal plan endpoint.
+        """
+        meal_plan = obj.meal_plans.order_by('-version').only(
+            'id', 'profile_id', 'version', 'created_at', 'cart_url'
+        ).first()
+        return meal_plan.summary(status=obj.status) if meal_plan else None
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     profile = ProfileSerializer(read_only=True)
     email_verified = serializers.SerializerMethodField()
     
@@ -23,13 +126,27 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'profile', 'email_verified']
         read_only_fields = ['id', 'email_verified']
     
+    def update(self, instance, validated_data):
+        return save_changed_fields(instance, validated_data)
+    
     def get_email_verified(self, obj):
         """Get email verification status"""
-        return obj.profile.is_email_verified if hasattr(obj, 'profile') else False
+        return obj.profile.email_verified if hasattr(obj, 'profile') else False
+    
+    def profile_columns(self):
+        """
+        Returns the profile columns the selected fields read, or None when the
+        profile is not needed at all.
+        """
+        columns = set()
+        if 'profile' in self.fields:
+            columns |= self.fields['profile'].model_columns()
+        if 'email_verified' in self.fields:
+            columns |= {'id', 'email_verified'}
+        return columns or None
 
 class TokenSerializer(serializers.Serializer):
     access_token = serializers.CharField()
     refresh_token = serializers.CharField()
     user = UserSerializer()
-    email_verified = serializers.BooleanField() 
-        
\ No newline at end of file
+    email_verified = serializers.BooleanField()
@@ -1,3 +1,510 @@
-from django.test import TestCase
+import time
+from unittest import mock
+
+import redis
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from jose import jwt
+from rest_framework.test import APITestCase
+
+from core.testing import QueryBudgetMixin, isolate_throttles, use_fake_redis, write_queries
+from core.throttling import AnonSlidingWindowThrottle, RedisSlidingWindowThrottle
+from . import urls
+from .access_tokens import REVOKED_KEY, issue_access_token, revocation_list
+from .authentication import user_from_claims
+from .auth_cache import auth_cache
+from .models import EmailVerification, Profile
+from .refresh_tokens import INVALID, REUSED, ROTATED, UNAVAILABLE, IssuedToken, RefreshTokenStore, RotationResult
+
+PASSWORD = 'Corr3ct-horse-battery'
+
+
+def mock_refresh_tokens(test_case):
+    """
+    Replaces the Redis refresh token store for the duration of a test.
+    """
+    patcher = mock.patch('users.views.refresh_tokens')
+    store = patcher.start()
+    test_case.addCleanup(patcher.stop)
+    store.issue.return_value = IssuedToken('family.secret', 'family')
+    return store
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Query budgets of every endpoint in users/urls.py (see query_budgets.json).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', 'alice@example.com', PASSWORD)
+        self.token = Token.objects.create(user=self.user)
+        self.refresh_tokens = mock_refresh_tokens(self)
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_budgets_cover_all_urls(self):
+        self.assertBudgetsCover(urls.urlpatterns)
+
+    def test_register(self):
+        response = self.request_within_budget('POST register', reverse('register'), {
+            'username': 'bob', 'email': 'bob@example.com', 'password': PASSWORD
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        response = self.request_within_budget('POST login', reverse('login'), {
+            'username': 'alice', 'password': PASSWORD
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['email_verified'])
+
+    def test_logout(self):
+        self.authenticate()
+        response = self.request_within_budget('POST logout', reverse('logout'))
+        self.assertEqual(response.status_code, 200)
+        self.refresh_tokens.revoke_all.assert_called_once_with(self.user.id)
+
+    def test_refresh_token(self):
+        self.refresh_tokens.rotate.return_value = RotationResult(ROTATED, self.user.id, 'family.next')
+        response = self.request_within_budget('POST refresh-token', reverse('refresh-token'), {
+            'refresh_token': 'family.secret'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['refresh_token'], 'family.next')
+        self.assertNotIn('user', response.data)
+
+    def test_refresh_token_include_user(self):
+        self.refresh_tokens.rotate.return_value = RotationResult(ROTATED, self.user.id, 'family.next')
+        response = self.request_within_budget(
+            'POST refresh-token include-user', reverse('refresh-token') + '?include=user', {
+                'refresh_token': 'family.secret'
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['username'], 'alice')
+        self.assertIn('email_verified', response.data)
+
+    def test_verify_email(self):
+        response = self.request_within_budget('POST verify-email', reverse('verify-email'), {
+            'token': self.user.email_verification.verification_token
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['user']['email_verified'])
+
+    def test_resend_verification(self):
+        response = self.request_within_budget('POST resend-verification', reverse('resend-verification'), {
+            'email': 'alice@example.com'
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_profile(self):
+        self.authenticate()
+        response = self.request_within_budget('GET user-profile', reverse('user-profile'))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.request_within_budget(
+            'GET user-profile not-modified', reverse('user-profile'), HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = self.request_within_budget(
+            'GET user-profile sparse', reverse('user-profile'), {'fields': 'id,profile.status'}
+        )
+        self.assertEqual(response.data, {'id': self.user.id, 'profile': {'status': 'PENDING'}})
+
+        response = self.request_within_budget('PUT user-profile', reverse('user-profile'), {
+            'username': 'alice', 'first_name': 'Alice'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_update(self):
+        self.authenticate()
+        response = self.request_within_budget('GET profile-update', reverse('profile-update'))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.request_within_budget(
+            'GET profile-update not-modified', reverse('profile-update'), HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = self.request_within_budget('PUT profile-update', reverse('profile-update'), {
+            'bio': 'Cooks on weekends', 'weekly_budget': '120.00'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_location(self):
+        self.authenticate()
+        response = self.request_within_budget('PUT update-location', reverse('update-location'), {
+            'location': 'San Francisco', 'latitude': 37.77, 'longitude': -122.42
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class UserWriteTests(APITestCase):
+    """
+    The rows written by the account flows. Before these were trimmed, register
+    wrote 6 statements (the profile was saved again after its insert) and
+    login wrote 6 (the last_login update re-saved the whole profile), and a
+    second login failed on the one-per-user refresh token. Refresh tokens
+    now live in Redis.
+    """
+
+    def setUp(self):
+        super().setUp()
+        isolate_throttles(self)
+        mock_refresh_tokens(self)
+
+    def assertWrites(self, queries, expected):
+        writes = write_queries(queries.captured_queries)
+        self.assertEqual(len(writes), expected, '\n'.join(writes))
+
+    def test_register_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('register'), {
+                'username': 'bob', 'email': 'bob@example.com', 'password': PASSWORD
+            })
+        self.assertEqual(response.status_code, 201)
+        # user, profile, email verification, access token
+        self.assertWrites(queries, 4)
+
+    def test_login_writes(self):
+        User.objects.create_user('alice', 'alice@example.com', PASSWORD)
+        for expected in (4, 2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('login'), {'username': 'alice', 'password': PASSWORD})
+            self.assertEqual(response.status_code, 200)
+            # session insert (first login) and update, last_login, access token (first login)
+            self.assertWrites(queries, expected)
+
+    def test_last_login_does_not_touch_profile(self):
+        user = User.objects.create_user('alice', 'alice@example.com', PASSWORD)
+        updated_at = Profile.objects.get(user=user).updated_at
+        self.client.post(reverse('login'), {'username': 'alice', 'password': PASSWORD})
+        self.assertEqual(Profile.objects.get(user=user).updated_at, updated_at)
+
+    def test_unchanged_profile_update_writes_nothing(self):
+        user = User.objects.create_user('alice', 'alice@example.com', PASSWORD)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('profile-update'), {'bio': ''}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertWrites(queries, 0)
+
+    def test_user_field_change_moves_profile_updated_at(self):
+        user = User.objects.create_user('alice', 'alice@example.com', PASSWORD)
+        updated_at = Profile.objects.get(user=user).updated_at
+        user.first_name = 'Alice'
+        user.save(update_fields=['first_name'])
+        self.assertGreater(Profile.objects.get(user=user).updated_at, updated_at)
+
+
+class RefreshTokenStoreDownTests(APITestCase):
+    """
+    The account flows while the Redis refresh token store is unavailable.
+    """
+
+    def setUp(self):
+        super().setUp()
+        isolate_throttles(self)
+        self.store = mock_refresh_tokens(self)
+        self.store.issue.return_value = None
+        self.store.rotate.return_value = RotationResult(UNAVAILABLE)
+
+    def test_login_fails_without_writing(self):
+        user = User.objects.create_user('alice', 'alice@example.com', PASSWORD)
+        response = self.client.post(reverse('login'), {'username': 'alice', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Token.objects.filter(user=user).exists())
+
+    def test_register_reports_the_missing_refresh_token(self):
+        response = self.client.post(reverse('register'), {
+            'username': 'bob', 'email': 'bob@example.com', 'password': PASSWORD
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data['refresh_token'])
+        self.assertIn('refresh_token_error', response.data)
+
+    def test_refresh_is_unavailable(self):
+        response = self.client.post(reverse('refresh-token'), {'refresh_token': 'family.secret'})
+        self.assertEqual(response.status_code, 503)
+
+
+class AuthCacheTests(APITestCase):
+    """
+    Opaque tokens seen recently authenticate from users.auth_cache. Redis is
+    unavailable here, so these run against the in-process tier.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('users.auth_cache.get_redis', side_effect=redis.ConnectionError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auth_cache.local.clear()
+        isolate_throttles(self)
+        mock_refresh_tokens(self)
+        self.user = User.objects.create_user('alice', 'alice@example.com', PASSWORD)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def verification_status(self):
+        response = self.client.get(reverse('email-verification-status'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_hot_user_authenticates_without_queries(self):
+        self.verification_status()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verification_status()['username'], 'alice')
+
+    def test_user_update_invalidates(self):
+        self.verification_status()
+        response = self.client.put(reverse('user-profile'), {'username': 'alicia'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.verification_status()['username'], 'alicia')
+
+    def test_profile_update_invalidates(self):
+        self.client.get(reverse('user-profile'))
+        response = self.client.put(reverse('profile-update'), {'bio': 'Cooks a lot'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.data['profile']['bio'], 'Cooks a lot')
+
+    def test_email_verification_invalidates(self):
+        self.assertFalse(self.verification_status()['email_verified'])
+        verification = EmailVerification.objects.get(user=self.user)
+        response = self.client.post(reverse('verify-email'), {'token': verification.verification_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.verification_status()['email_verified'])
+
+    def test_logout_invalidates(self):
+        self.verification_status()
+        self.client.post(reverse('logout'))
+        response = self.client.get(reverse('email-verification-status'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_deleted_by_another_logout_is_rejected(self):
+        self.verification_status()
+        # Log out through the session, which deletes the token without presenting it
+        self.client.credentials()
+        self.client.login(username='alice', password=PASSWORD)
+        self.client.post(reverse('logout'))
+        response = self.client.post(reverse('login'), {'username': 'alice', 'password': PASSWORD})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['access_token']}")
+        self.verification_status()
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = self.client.get(reverse('email-verification-status'))
+        self.assertEqual(response.status_code, 401)
+
+
+class ThrottleTests(APITestCase):
+    """
+    The per-endpoint sliding-window throttles (core.throttling). The window
+    itself is a Redis script; here its verdict is stubbed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('core.throttling.get_redis')
+        self.redis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, RedisSlidingWindowThrottle, '_hit_script', None)
+        RedisSlidingWindowThrottle._hit_script = None
+        self.hit = self.redis.return_value.register_script.return_value
+
+    def login(self):
+        return self.client.post(reverse('login'), {'username': 'alice', 'password': 'wrong'})
+
+    def test_refused_request_carries_retry_after(self):
+        self.hit.return_value = [0, '12.5']
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '13')
+
+    def test_endpoints_have_their_own_windows(self):
+        self.hit.return_value = [1, '0']
+        self.login()
+        self.client.post(reverse('register'), {})
+        keys = [call.kwargs['keys'][0] for call in self.hit.call_args_list]
+        self.assertEqual(keys, ['throttle:login:127.0.0.1', 'throttle:register:127.0.0.1'])
+
+    def test_lets_requests_through_without_redis(self):
+        self.hit.side_effect = redis.ConnectionError
+        self.assertEqual(self.login().status_code, 401)
+
+
+class SlidingWindowTests(SimpleTestCase):
+    """
+    The sliding-window script (core.throttling) run against an in-memory Redis.
+    """
+
+    class Throttle(AnonSlidingWindowThrottle):
+        rate = '3/min'
+
+    def setUp(self):
+        use_fake_redis(self)
+        self.addCleanup(setattr, RedisSlidingWindowThrottle, '_hit_script', None)
+        RedisSlidingWindowThrottle._hit_script = None
+        patcher = mock.patch('core.throttling.time.time')
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        self.request.user = AnonymousUser()
+
+    def hit(self, now):
+        self.clock.return_value = now
+        throttle = self.Throttle()
+        return throttle.allow_request(self.request, None), throttle.wait()
+
+    def test_refuses_once_window_is_full(self):
+        self.assertEqual([self.hit(now)[0] for now in (1000, 1010, 1020)], [True] * 3)
+        self.assertEqual(self.hit(1030), (False, 30.0))
+
+    def test_window_slides(self):
+        for now in (1000, 1010, 1020):
+            self.hit(now)
+        self.assertFalse(self.hit(1059)[0])
+        # The request at 1000 has left the window; the one at 1010 is now the oldest
+        self.assertTrue(self.hit(1061)[0])
+        self.assertEqual(self.hit(1062), (False, 8.0))
+
+
+@override_settings(REFRESH_TOKEN_REUSE_GRACE=10)
+class RefreshTokenStoreTests(SimpleTestCase):
+    """
+    Refresh token rotation (users.refresh_tokens) run against an in-memory Redis.
+    """
+
+    def setUp(self):
+        use_fake_redis(self)
+        self.store = RefreshTokenStore()
+        self.token = self.store.issue(mock.Mock(id=7)).token
+
+    def test_rotation_issues_the_next_token(self):
+        rotation = self.store.rotate(self.token)
+        self.assertEqual(rotation.status, ROTATED)
+        self.assertEqual(rotation.user_id, 7)
+        self.assertEqual(self.store.rotate(rotation.token).status, ROTATED)
+
+    def test_concurrent_refresh_gets_the_same_token(self):
+        first, second = self.store.rotate(self.token), self.store.rotate(self.token)
+        self.assertEqual(second.status, ROTATED)
+        self.assertEqual(second.token, first.token)
+        self.assertEqual(self.store.rotate(first.token).status, ROTATED)
+
+    @override_settings(REFRESH_TOKEN_REUSE_GRACE=-1)
+    def test_reuse_after_grace_revokes_family(self):
+        rotation = self.store.rotate(self.token)
+        self.assertEqual(self.store.rotate(self.token).status, REUSED)
+        self.assertEqual(self.store.rotate(rotation.token).status, INVALID)
+
+    def test_unknown_token_is_invalid(self):
+        self.assertEqual(self.store.rotate('family.secret').status, INVALID)
+        self.assertEqual(self.store.rotate('garbage').status, INVALID)
+
+
+@override_settings(
+    ACCESS_TOKEN_MODE='jwt', JWT_SIGNING_KEYS={'k2': 'current-secret', 'k1': 'previous-secret'},
+    JWT_ALGORITHM='HS256', JWT_ACCESS_TOKEN_TTL=900, JWT_REVOCATION_CHECK=True, JWT_REVOCATION_REFRESH=60,
+)
+class JWTAuthenticationTests(QueryBudgetMixin, APITestCase):
+    """
+    ACCESS_TOKEN_MODE=jwt: signed access tokens (users.access_tokens) and their
+    revocation, with the revocation list in an in-memory Redis.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.redis = use_fake_redis(self)
+        mock_refresh_tokens(self)
+        self.reset_revocation_filter()
+        self.addCleanup(self.reset_revocation_filter)
+        self.user = User.objects.create_user('alice', 'alice@example.com', PASSWORD, first_name='Alice')
+
+    @staticmethod
+    def reset_revocation_filter():
+        revocation_list._filter = None
+        revocation_list._loaded_at = 0.0
+
+    def bearer(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def sign(self, kid, key, **claims):
+        now = int(time.time())
+        claims = {'sub': str(self.user.id), 'username': 'alice', 'iat': now, 'exp': now + 60,
+                  'jti': 'jti-1', **claims}
+        return jwt.encode(claims, key, algorithm='HS256', headers={'kid': kid})
+
+    def get_profile(self):
+        return self.client.get(reverse('user-profile'))
+
+    def test_login_profile_logout(self):
+        response = self.request_within_budget('POST login jwt', reverse('login'), {
+            'username': 'alice', 'password': PASSWORD
+        })
+        self.assertEqual(response.data['token_type'], 'Bearer')
+        self.bearer(response.data['access_token'])
+
+        response = self.request_within_budget('GET user-profile jwt', reverse('user-profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['email'], response.data['first_name']), ('alice@example.com', 'Alice'))
+        response = self.request_within_budget('GET profile-update jwt', reverse('profile-update'))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.request_within_budget('POST logout jwt', reverse('logout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile().status_code, 401)
+
+    def test_revocation_reaches_other_processes(self):
+        self.bearer(self.sign('k2', 'current-secret'))
+        self.assertEqual(self.get_profile().status_code, 200)
+        # Revoked by another process: this one's filter does not know yet
+        self.redis.zadd(REVOKED_KEY, {'jti-1': time.time() + 60})
+        self.assertEqual(self.get_profile().status_code, 200)
+        self.reset_revocation_filter()
+        self.assertEqual(self.get_profile().status_code, 401)
+
+    def test_rejects_bad_tokens(self):
+        tokens = {
+            'bad signature': self.sign('k2', 'wrong-secret'),
+            'unknown kid': self.sign('k9', 'current-secret'),
+            'expired': self.sign('k2', 'current-secret', exp=int(time.time()) - 10),
+            'missing jti': self.sign('k2', 'current-secret', jti=None),
+            'garbage': 'not-a-jwt',
+        }
+        for case, token in tokens.items():
+            with self.subTest(case):
+                self.bearer(token)
+                self.assertEqual(self.get_profile().status_code, 401)
+
+    def test_key_rotation(self):
+        token = self.sign('k1', 'previous-secret')
+        self.bearer(token)
+        self.assertEqual(self.get_profile().status_code, 200)
+        with self.settings(JWT_SIGNING_KEYS={'k2': 'current-secret'}):
+            self.assertEqual(self.get_profile().status_code, 401)
+        # New tokens are signed with the first key
+        self.assertEqual(jwt.get_unverified_header(issue_access_token(self.user)['access_token'])['kid'], 'k2')
+
+    def test_deactivated_user_is_rejected(self):
+        self.bearer(self.sign('k2', 'current-secret'))
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.get_profile().status_code, 401)
+
+        self.user.is_active = True
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.get_profile().status_code, 200)
+
+    def test_user_fields_load_in_one_query(self):
+        user = user_from_claims({'sub': str(self.user.id), 'username': 'alice'})
+        with self.assertNumQueries(1):
+            self.assertEqual((user.email, user.first_name, user.last_name), ('alice@example.com', 'Alice', ''))
 
-# Create your tests here.
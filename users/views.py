@@ -5,28 +5,74 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
+from django.db import transaction
 from rest_framework.authtoken.models import Token
 from django.core.exceptions import ValidationError
 from django.contrib.auth.password_validation import validate_password
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from rest_framework import generics
-from .serializers import UserSerializer, ProfileSerializer, TokenSerializer
-from .models import Profile, RefreshToken, EmailVerification
-from datetime import datetime
+from .serializers import UserSerializer, ProfileSerializer, TokenSerializer, save_changed_fields
+from .models import Profile, EmailVerification
+from .access_tokens import issue_access_token, revocation_list
+from .auth_cache import PROFILE_EXCLUDED_FIELDS, auth_cache
+from .refresh_tokens import REUSED, ROTATED, UNAVAILABLE, refresh_tokens
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from core.conditional import conditional_get, fieldset_key, weak_etag
+from core.throttling import AnonSlidingWindowThrottle, UserSlidingWindowThrottle
 
 # Create your views here.
 
-class RegisterRateThrottle(AnonRateThrottle):
-    rate = '5/hour'
+# Each endpoint has its own window; rates are in DEFAULT_THROTTLE_RATES
+class RegisterRateThrottle(AnonSlidingWindowThrottle):
+    scope = 'register'
 
-class LoginRateThrottle(AnonRateThrottle):
-    rate = '5/minute'  # Stricter rate limit for login attempts
+class LoginRateThrottle(AnonSlidingWindowThrottle):
+    scope = 'login'  # Stricter rate limit for login attempts
 
-class EmailVerificationThrottle(AnonRateThrottle):
-    rate = '3/hour'
+class EmailVerificationThrottle(AnonSlidingWindowThrottle):
+    scope = 'email_verification'
+
+def _load_profile(user, columns):
+    """
+    Attaches the user's profile with only ``columns`` loaded, unless no
+    columns are needed. A profile that is already attached (such as a cached
+    snapshot) has just its missing columns loaded, in one query.
+    """
+    if not columns:
+        return
+    if User.profile.related.is_cached(user):
+        missing = set(columns) & user.profile.get_deferred_fields()
+        if missing:
+            user.profile.refresh_from_db(fields=missing)
+        return
+    profile = Profile.objects.only(*columns).filter(user_id=user.id).first()
+    if profile is not None:
+        user.profile = profile
+
+def _user_data(request, user, profile_columns=()):
+    """
+    Serializes ``user`` with the fields selected by ?fields= / ?omit=, loading
+    only the profile columns those fields (and ``profile_columns``) read.
+    """
+    serializer = UserSerializer(user, context={'request': request})
+    _load_profile(user, (serializer.profile_columns() or set()) | set(profile_columns))
+    return serializer.data
+
+def _issue_access_token(user, new_user=False):
+    """
+    Returns the response fields of an access token for the user: a signed
+    short-lived JWT with ACCESS_TOKEN_MODE 'jwt', else their DRF token.
+    ``new_user`` skips the lookup for a user who cannot have a token yet.
+    """
+    if settings.ACCESS_TOKEN_MODE == 'jwt':
+        return issue_access_token(user)
+    if new_user:
+        token = Token.objects.create(user=user)
+    else:
+        token, _ = Token.objects.get_or_create(user=user)
+    return {'access_token': token.key, 'token_type': 'Token'}
 
 def send_verification_email(user, verification_token):
     """Send verification email to user"""
@@ -95,29 +141,31 @@ def register(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    user = User.objects.create_user(
-        username=username,
-        email=email,
-        password=password
-    )
+    # The user, their profile, verification and access token are created together
+    with transaction.atomic():
+        user = User.objects.create_user(
+            username=username,
+            email=email,
+            password=password
+        )
+        access_token = _issue_access_token(user, new_user=True)
+    refresh_token = refresh_tokens.issue(user)
 
     # Send verification email
     verification = user.email_verification
     email_sent = send_verification_email(user, verification.verification_token)
 
-    # Create access token
-    access_token, _ = Token.objects.get_or_create(user=user)
-    
-    # Create refresh token
-    refresh_token = RefreshToken.create_token(user)
-
-    return Response({
-        'access_token': access_token.key,
-        'refresh_token': refresh_token.token,
-        'user': UserSerializer(user).data,
+    response = {
+        **access_token,
+        'refresh_token': refresh_token and refresh_token.token,
+        'user': _user_data(request, user),
         'email_verification_sent': email_sent,
         'message': 'Registration successful! Please check your email to verify your account.'
-    }, status=status.HTTP_201_CREATED)
+    }
+    if refresh_token is None:
+        # The account exists either way; the client has to log in to get a refresh token
+        response['refresh_token_error'] = 'Refresh tokens are temporarily unavailable; please log in again later'
+    return Response(response, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -132,7 +180,7 @@ def verify_email(request):
         )
 
     try:
-        verification = EmailVerification.objects.get(verification_token=token)
+        verification = EmailVerification.objects.select_related('user__profile').get(verification_token=token)
         
         if verification.is_expired():
             return Response(
@@ -152,7 +200,7 @@ def verify_email(request):
         
         return Response({
             'message': 'Email verified successfully! You can now create meal plans.',
-            'user': UserSerializer(verification.user).data
+            'user': _user_data(request, verification.user)
         }, status=status.HTTP_200_OK)
         
     except EmailVerification.DoesNotExist:
@@ -175,10 +223,10 @@ def resend_verification_email(request):
         )
 
     try:
-        user = User.objects.get(email=email)
+        user = User.objects.select_related('profile').get(email=email)
         
         # Check if already verified
-        if user.profile.is_email_verified:
+        if user.profile.email_verified:
             return Response(
                 {'message': 'Email is already verified'},
                 status=status.HTTP_200_OK
@@ -225,35 +273,49 @@ def login_view(request):
             status=status.HTTP_401_UNAUTHORIZED
         )
 
-    login(request, user)
-    
-    # Create access token
-    access_token, _ = Token.objects.get_or_create(user=user)
-    
-    # Create refresh token
-    refresh_token = RefreshToken.create_token(user)
+    # Start a refresh token family for this device; without one the session
+    # could not be renewed, so the login fails before anything is written
+    refresh_token = refresh_tokens.issue(user)
+    if refresh_token is None:
+        return Response(
+            {'error': 'Login is temporarily unavailable'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    with transaction.atomic():
+        login(request, user)
+        
+        access_token = _issue_access_token(user)
 
     return Response({
-        'access_token': access_token.key,
+        **access_token,
         'refresh_token': refresh_token.token,
-        'user': UserSerializer(user).data,
-        'email_verified': user.profile.is_email_verified
+        'user': _user_data(request, user, profile_columns=('id', 'email_verified')),
+        'email_verified': user.profile.email_verified
     })
 
 @api_view(['POST'])
-@throttle_classes([UserRateThrottle])
+@throttle_classes([UserSlidingWindowThrottle])
 def logout_view(request):
     if request.user.is_authenticated:
-        # Invalidate refresh token
-        RefreshToken.objects.filter(user=request.user).update(is_valid=False)
-        # Delete access token
-        request.user.auth_token.delete()
+        # Revoke the refresh tokens of every device
+        refresh_tokens.revoke_all(request.user.id)
+        if isinstance(request.auth, dict):
+            # A JWT access token (request.auth holds its claims) is valid until revoked or expired
+            revocation_list.revoke(request.auth['jti'], request.auth['exp'])
+        # Delete access token (which also drops it from auth_cache)
+        Token.objects.filter(user_id=request.user.id).delete()
         logout(request)
     return Response({'message': 'Successfully logged out'})
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def refresh_token(request):
+    """
+    Exchange a refresh token for an access token and the next refresh token.
+    Each refresh token can be used once; using one again revokes its family.
+    The user is only returned with ?include=user.
+    """
     refresh_token = request.data.get('refresh_token')
     
     if not refresh_token:
@@ -262,38 +324,95 @@ def refresh_token(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    try:
-        token_obj = RefreshToken.objects.get(
-            token=refresh_token,
-            is_valid=True,
-            expires_at__gt=datetime.now()
+    rotation = refresh_tokens.rotate(refresh_token)
+    if rotation.status == UNAVAILABLE:
+        return Response(
+            {'error': 'Token refresh is temporarily unavailable'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
         )
-        
-        # Create new access token
-        access_token, _ = Token.objects.get_or_create(user=token_obj.user)
-        
-        return Response({
-            'access_token': access_token.key,
-            'user': UserSerializer(token_obj.user).data,
-            'email_verified': token_obj.user.profile.is_email_verified
-        })
-    except RefreshToken.DoesNotExist:
+    if rotation.status == REUSED:
+        return Response(
+            {'error': 'Refresh token was already used; please log in again'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    include_user = request.query_params.get('include') == 'user'
+    user = None
+    if rotation.status == ROTATED:
+        users = User.objects.select_related('profile') if include_user else User.objects
+        user = users.filter(id=rotation.user_id, is_active=True).first()
+    if user is None:
         return Response(
             {'error': 'Invalid or expired refresh token'},
             status=status.HTTP_401_UNAUTHORIZED
         )
+    
+    response = {**_issue_access_token(user), 'refresh_token': rotation.token}
+    if include_user:
+        response['user'] = _user_data(request, user)
+        response['email_verified'] = user.profile.email_verified
+    return Response(response)
 
+def _profile_updated_at(request):
+    """
+    Returns when the current user's profile last changed. Saving the user or
+    verifying the email also saves the profile, so this covers both. The
+    profile usually comes with the authenticated user; otherwise (JWT and
+    session authentication) it is read in full and attached to the user, so
+    the view that follows needs no second query. A cached snapshot lacks
+    updated_at and status, which change together, so both are loaded at once.
+    """
+    if not User.profile.related.is_cached(request.user):
+        profile = Profile.objects.filter(user_id=request.user.id).first()
+        if profile is None:
+            return None
+        request.user.profile = profile
+    profile = request.user.profile
+    missing = PROFILE_EXCLUDED_FIELDS & profile.get_deferred_fields()
+    if missing:
+        profile.refresh_from_db(fields=missing)
+    return profile.updated_at
+
+def _profile_etag(request, *args, **kwargs):
+    updated_at = _profile_updated_at(request)
+    if updated_at is None:
+        return None
+    return weak_etag(request.path, request.user.id, updated_at.isoformat(), fieldset_key(request))
+
+def _profile_last_modified(request, *args, **kwargs):
+    return _profile_updated_at(request)
+
+@method_decorator(conditional_get(_profile_etag, _profile_last_modified), name='get')
 class UserProfileView(generics.RetrieveUpdateAPIView):
+    """
+    The current user with their profile. Supports ?fields= and ?omit=
+    (e.g. ?fields=id,username,profile.status). Reads carry an ETag and
+    Last-Modified and are answered with 304 Not Modified when unchanged.
+    """
     serializer_class = UserSerializer
     
     def get_object(self):
-        return self.request.user
+        user = self.request.user
+        if self.request.method == 'GET':
+            _load_profile(user, self.get_serializer().profile_columns())
+        return user
 
+@method_decorator(conditional_get(_profile_etag, _profile_last_modified), name='get')
 class ProfileView(generics.RetrieveUpdateAPIView):
+    """
+    The current user's profile. Supports ?fields= and ?omit=; reads load only
+    the columns of the selected fields and are conditional like UserProfileView.
+    """
     serializer_class = ProfileSerializer
     
     def get_object(self):
-        return self.request.user.profile
+        user = self.request.user
+        if self.request.method == 'GET':
+            _load_profile(user, self.get_serializer().model_columns())
+        return user.profile
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        auth_cache.invalidate(self.request.user.id)
 
 @api_view(['PUT'])
 def update_location(request):
@@ -308,18 +427,19 @@ def update_location(request):
         )
     
     profile = request.user.profile
-    profile.location = location
+    changes = {'location': location}
     if latitude is not None:
         try:
-            profile.latitude = float(latitude)
+            changes['latitude'] = float(latitude)
         except (TypeError, ValueError):
             return Response({'error': 'Invalid latitude value'}, status=status.HTTP_400_BAD_REQUEST)
     if longitude is not None:
         try:
-            profile.longitude = float(longitude)
+            changes['longitude'] = float(longitude)
         except (TypeError, ValueError):
             return Response({'error': 'Invalid longitude value'}, status=status.HTTP_400_BAD_REQUEST)
-    profile.save()
+    save_changed_fields(profile, changes, always=['updated_at'])
+    auth_cache.invalidate(request.user.id)
     
     return Response({
         'message': 'Location updated successfully',
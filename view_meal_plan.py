@@ -35,12 +35,12 @@ def view_all_meal_plans():
         print(f"Generated: {profile.updated_at}")
         print("=" * 80)
         
-        if profile.meal_plan and isinstance(profile.meal_plan, dict) and 'plan' in profile.meal_plan:
-            plan_text = profile.meal_plan['plan']
-            print(plan_text)
+        meal_plan = profile.meal_plans.order_by('-version').first()
+        if meal_plan and meal_plan.plan_text:
+            print(meal_plan.plan_text)
             
-            if 'cart_url' in profile.meal_plan:
-                print(f"\n🛒 Cart URL: {profile.meal_plan['cart_url']}")
+            if meal_plan.cart_url:
+                print(f"\n🛒 Cart URL: {meal_plan.cart_url}")
         else:
             print("❌ No meal plan content found")
             print("   This profile was completed but doesn't have meal plan data.")
@@ -58,12 +58,13 @@ def view_specific_meal_plan(profile_id):
         print(f"Status: {profile.status}")
         print("=" * 80)
         
-        if profile.status == 'COMPLETED' and profile.meal_plan:
-            if isinstance(profile.meal_plan, dict) and 'plan' in profile.meal_plan:
-                print(profile.meal_plan['plan'])
+        meal_plan = profile.meal_plans.order_by('-version').first()
+        if profile.status == 'COMPLETED' and meal_plan:
+            if meal_plan.plan_text:
+                print(meal_plan.plan_text)
                 
-                if 'cart_url' in profile.meal_plan:
-                    print(f"\n🛒 Cart URL: {profile.meal_plan['cart_url']}")
+                if meal_plan.cart_url:
+                    print(f"\n🛒 Cart URL: {meal_plan.cart_url}")
             else:
                 print("❌ No meal plan content found")
         else:
@@ -136,22 +137,22 @@ def create_and_view_meal_plan():
                     # Refresh profile from database
                     profile.refresh_from_db()
                     
-                    if profile.status == 'COMPLETED' and profile.meal_plan:
+                    meal_plan = profile.meal_plans.order_by('-version').first()
+                    if profile.status == 'COMPLETED' and meal_plan:
                         print("✅ Meal plan generated and stored!")
                         print(f"   - Status: {profile.status}")
-                        print(f"   - Meal plan keys: {list(profile.meal_plan.keys())}")
+                        print(f"   - Meal plan version: {meal_plan.version}")
                         
                         # Display the meal plan
                         print("\n" + "=" * 80)
                         print("🍽️  GENERATED MEAL PLAN")
                         print("=" * 80)
                         
-                        if 'plan' in profile.meal_plan:
-                            plan_text = profile.meal_plan['plan']
-                            print(plan_text)
+                        if meal_plan.plan_text:
+                            print(meal_plan.plan_text)
                         
-                        if 'cart_url' in profile.meal_plan:
-                            print(f"\n🛒 Cart URL: {profile.meal_plan['cart_url']}")
+                        if meal_plan.cart_url:
+                            print(f"\n🛒 Cart URL: {meal_plan.cart_url}")
                         
                         print("\n" + "=" * 80)
                         
@@ -213,9 +214,9 @@ def show_database_status():
         print(f"\n✅ Completed Meal Plans:")
         for profile in completed:
             verification_status = "✅" if profile.is_email_verified else "❌"
-            if profile.meal_plan and isinstance(profile.meal_plan, dict) and 'plan' in profile.meal_plan:
-                plan_text = profile.meal_plan['plan']
-                print(f"  - {profile.user.username} (ID: {profile.id}) {verification_status}: {len(plan_text)} chars")
+            meal_plan = profile.meal_plans.order_by('-version').first()
+            if meal_plan and meal_plan.plan_text:
+                print(f"  - {profile.user.username} (ID: {profile.id}) {verification_status}: {len(meal_plan.plan_text)} chars")
             else:
                 print(f"  - {profile.user.username} (ID: {profile.id}) {verification_status}: No meal plan data")
 